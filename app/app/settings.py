@@ -46,15 +46,23 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
 ]
 
 MIDDLEWARE = [
+    'core.middleware.HealthCheckMiddleware',
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.QueryTimingMiddleware',
+    'core.middleware.SlowQueryMiddleware',
+    'core.middleware.CoalescingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.db_router.ReplicaRoutingMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -93,6 +101,58 @@ DATABASES = {
     }
 }
 
+# Comma separated hosts of streaming replicas of the default database.
+# Reads of GET requests go to them, see core.db_router.
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))
+):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'OPTIONS': {'connect_timeout': 2},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+# Replicas further behind are left out until they catch up.
+DB_REPLICA_MAX_LAG_SECONDS = float(
+    os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', 5)
+)
+DB_REPLICA_CHECK_SECONDS = float(
+    os.environ.get('DB_REPLICA_CHECK_SECONDS', 5)
+)
+# Users read from the primary this long after a write. Keep it above the
+# allowed lag.
+DB_PIN_SECONDS = int(os.environ.get('DB_PIN_SECONDS', 15))
+# Pins live in this file, shared by the processes of a node. Set
+# DB_PIN_CACHE to a cache alias shared by all nodes to keep them there.
+DB_PIN_DB_PATH = os.environ.get(
+    'DB_PIN_DB_PATH', '/dev/shm/recipe-app-pins.sqlite3'
+)
+DB_PIN_CACHE = os.environ.get('DB_PIN_CACHE', '')
+
+# Hash partitions of the recipe tables, 0 for none. Applied by the
+# 0023 migration, or by maintain_partitions --repartition after a change.
+RECIPE_HASH_PARTITIONS = int(os.environ.get('RECIPE_HASH_PARTITIONS', 0))
+
+# Shared by the processes of a node. Use a shared cache server, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, when the API
+# runs on several nodes.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache',
+        ),
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', '/dev/shm/recipe-app-cache'
+        ),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -136,16 +196,117 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# core.object_storage.ContentAddressedS3Storage keeps images in an S3
+# compatible bucket configured by the S3_* variables below.
+RECIPE_IMAGE_STORAGE = os.environ.get(
+    'RECIPE_IMAGE_STORAGE', 'core.storage.ContentAddressedStorage'
+)
+RECIPE_IMAGE_MAX_BYTES = int(
+    os.environ.get('RECIPE_IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+)
+
+# Resized copies of every recipe image, see core.variants. Changing an
+# entry renders that variant anew with backfill_image_variants.
+RECIPE_IMAGE_VARIANTS = {
+    'thumb': {'width': 160, 'height': 160, 'format': 'JPEG', 'quality': 80},
+    'card': {'width': 480, 'height': 480, 'format': 'JPEG', 'quality': 82},
+    'large': {'width': 1200, 'height': 1200, 'format': 'JPEG', 'quality': 85},
+}
+
+AWS_STORAGE_BUCKET_NAME = os.environ.get('S3_BUCKET')
+AWS_S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+AWS_S3_REGION_NAME = os.environ.get('S3_REGION')
+AWS_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+AWS_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+AWS_S3_SIGNATURE_VERSION = 's3v4'
+AWS_S3_ADDRESSING_STYLE = os.environ.get('S3_ADDRESSING_STYLE')
+AWS_QUERYSTRING_EXPIRE = 300
+# Endpoint browsers use for presigned URLs, when the app reaches the
+# storage under another name, e.g. http://localhost:9000 for MinIO.
+S3_PUBLIC_ENDPOINT_URL = os.environ.get('S3_PUBLIC_ENDPOINT_URL')
+
+# Images stored or reused this recently are never deleted on release, so
+# an upload that reused a file can commit before the file is collected.
+MEDIA_RELEASE_GRACE_SECONDS = int(
+    os.environ.get('MEDIA_RELEASE_GRACE_SECONDS', 3600)
+)
+
+# Internal location of the front web server that serves MEDIA_ROOT, e.g.
+# nginx "location /protected-media/ { internal; alias /vol/web/media/; }".
+# When empty, media files are sent by Django.
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = "core.User"
 
+# Requests per user and scope, or per address for anonymous requests.
+# Load tests fetching many tokens from one address need a higher
+# THROTTLE_TOKEN_RATE, see scripts/loadtest.py.
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_THROTTLE_CLASSES': ['core.throttling.TokenBucketThrottle'],
+    'DEFAULT_THROTTLE_RATES': {
+        'read': os.environ.get('THROTTLE_READ_RATE', '600/min'),
+        'write': os.environ.get('THROTTLE_WRITE_RATE', '120/min'),
+        'upload': os.environ.get('THROTTLE_UPLOAD_RATE', '20/min'),
+        'token': os.environ.get('THROTTLE_TOKEN_RATE', '10/min'),
+    },
 }
 
+# Token buckets shared by the worker processes of a node. Keep the file
+# on a memory filesystem, every API request writes to it.
+THROTTLE_DB_PATH = os.environ.get(
+    'THROTTLE_DB_PATH', '/dev/shm/recipe-app-throttle.sqlite3'
+)
+
+# Runs the tests without rate limits, see core.test_runner.
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
-}
\ No newline at end of file
+}
+
+# Performance instrumentation
+
+QUERY_TIMING_ENABLED = os.environ.get('QUERY_TIMING_ENABLED', '0') == '1'
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 30))
+# Feeds the http_request_db_queries histogram. With this and query
+# timing off no execute wrapper is installed on the connections.
+METRICS_QUERY_COUNTS = os.environ.get('METRICS_QUERY_COUNTS', '1') == '1'
+
+SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 0))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '0') == '1'
+SLOW_QUERY_LOG = os.environ.get(
+    'SLOW_QUERY_LOG', '/vol/web/logs/slow_queries.log'
+)
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/vol/web/profiles')
+PROFILE_SAMPLE_INTERVAL_MS = 5
+PROFILE_TOP_ALLOCATIONS = 25
+
+# Concurrent identical GETs under these path prefixes share a response,
+# followers wait at most COALESCE_WAIT_SECONDS before running their own.
+# The recipe app is mounted without a trailing slash, its routes are
+# /api/reciperecipes/ and /api/recipetags/.
+COALESCE_PATHS = ['/api/recipe', '/api/schema/']
+COALESCE_WAIT_SECONDS = float(os.environ.get('COALESCE_WAIT_SECONDS', 5))
+
+# /metrics answers staff users, clients in these comma separated networks,
+# e.g. the Prometheus server, and requests sending the header
+# "Authorization: Bearer <METRICS_TOKEN>". Behind a proxy REMOTE_ADDR is
+# the proxy's address, use the token there.
+METRICS_ALLOWED_NETWORKS = [
+    network.strip() for network in os.environ.get(
+        'METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128'
+    ).split(',') if network.strip()
+]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+HEALTH_CHECK_CACHE_SECONDS = float(
+    os.environ.get('HEALTH_CHECK_CACHE_SECONDS', 5)
+)
@@ -20,11 +20,15 @@ from drf_spectacular.views import (  # type: ignore
 ) 
 from django.contrib import admin
 from django.urls import path, include
-from django.conf.urls.static import static
 from django.conf import settings
 
+from core.views import healthz, media_view, metrics_view, readyz
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
+    path('healthz', healthz, name='healthz'),
+    path('readyz', readyz, name='readyz'),
 
     path('api/schema/', SpectacularAPIView.as_view(), name ="api-schema"),
     
@@ -38,11 +42,10 @@ urlpatterns = [
 
     path('api/user', include('user.urls')),
     path('api/recipe', include('recipe.urls')),
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}<path:path>',
+        media_view,
+        name='media',
+    ),
     
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL,
-        document_root=settings.MEDIA_ROOT,
-    )
\ No newline at end of file
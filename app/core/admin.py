@@ -1,9 +1,17 @@
 """
 Django admin customization
 """
+import csv
+
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.utils.functional import cached_property
 from core import models
+from core.images import set_image_metadata
+from core.purge import request_purge
 from django.utils.translation import gettext_lazy as _
 
 
@@ -55,20 +63,179 @@ class UserAdmin(BaseUserAdmin):
         }),        
     )
 
+    # Deleting a user deactivates them and queues a UserPurge,
+    # purge_users deletes their data in batches afterwards.
+    def get_deleted_objects(self, objs, request):
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        deleted = [
+            _('%(user)s, deactivated now. Their recipes, tags and '
+              'ingredients are deleted in the background.') % {'user': obj}
+            for obj in objs
+        ]
+        return deleted, {}, perms_needed, []
+
+    def delete_model(self, request, obj):
+        request_purge(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            request_purge(user)
+
+
+class UserPurgeAdmin(admin.ModelAdmin):
+    """ Show the progress of user deletions. """
+    list_display = ['email', 'status', 'created', 'started', 'finished',
+                    'recipes_deleted', 'tags_deleted',
+                    'ingredients_deleted', 'error']
+    search_fields = ['email']
+    readonly_fields = [
+        field.name for field in models.UserPurge._meta.fields
+    ] + ['status']
+
+    def has_add_permission(self, request):
+        return False
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    """ List the request profiles captured on demand. """
+    list_display = ['created', 'method', 'path', 'status_code',
+                    'duration_ms', 'user']
+    list_select_related = ['user']
+    readonly_fields = [
+        field.name for field in models.RequestProfile._meta.fields
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that estimates the size of large unfiltered tables.
+
+    An exact COUNT(*) reads the whole table, so without filters the
+    planner's row estimate is used once it passes EXACT_COUNT_LIMIT.
+    PostgreSQL keeps no estimate for a partitioned table, the estimates
+    of its partitions are added up instead.
+    """
+    EXACT_COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT CASE WHEN c.relkind = 'p' THEN ("
+                    'SELECT coalesce(sum(greatest(p.reltuples, 0)), 0) '
+                    'FROM pg_inherits i JOIN pg_class p '
+                    'ON p.oid = i.inhrelid WHERE i.inhparent = c.oid'
+                    ') ELSE c.reltuples END '
+                    'FROM pg_class c WHERE c.oid = %s::regclass',
+                    [query.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > self.EXACT_COUNT_LIMIT:
+                return int(row[0])
+        return super().count
+
+
+class Echo:
+    """ File like object handing written rows straight back. """
+
+    def write(self, value):
+        return value
+
+
+@admin.action(description=_('Export selected rows as CSV'))
+def export_as_csv(modeladmin, request, queryset):
+    """ Stream the selected rows as CSV without loading them at once. """
+    fields = modeladmin.csv_fields
+    writer = csv.writer(Echo())
+    rows = queryset.values_list(*fields).iterator(chunk_size=2000)
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in _with_header(fields, rows)),
+        content_type='text/csv',
+    )
+    filename = queryset.model._meta.model_name
+    response['Content-Disposition'] = (
+        f'attachment; filename="{filename}s.csv"'
+    )
+    return response
+
+
+def _with_header(fields, rows):
+    yield fields
+    yield from rows
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin for tables too big for the default changelist.
+
+    Search only runs lookups that have an index: a number matches the
+    id, a term with an @ matches the owner's email prefix, anything
+    else matches a prefix of search_prefix_field.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    ordering = ['-id']
+    actions = [export_as_csv]
+    search_prefix_field = 'name'
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+        if '@' in term:
+            return queryset.filter(user__email__startswith=term), False
+        return queryset.filter(**{
+            f'{self.search_prefix_field}__istartswith': term,
+        }), False
+
+
+class RecipeAdmin(LargeTableAdmin):
+    """ Admin pages for recipes. """
+    list_display = ['id', 'title', 'user', 'time_minutes', 'price']
+    search_fields = ['title']
+    search_help_text = _('Recipe id, owner email or title prefix.')
+    search_prefix_field = 'title'
+    autocomplete_fields = ['tags', 'ingredients']
+    csv_fields = ['id', 'user__email', 'title', 'time_minutes', 'price',
+                  'link', 'image']
+
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            set_image_metadata(obj)
+        super().save_model(request, obj, form, change)
 
-class RecipeAdmin(models.Recipe):
-    pass
 
+class TagAdmin(LargeTableAdmin):
+    """ Admin pages for tags. """
+    list_display = ['id', 'name', 'user']
+    search_fields = ['name']
+    search_help_text = _('Tag id, owner email or name prefix.')
+    csv_fields = ['id', 'user__email', 'name']
 
-class TagAdmin(models.Tag):
-    pass
 
-class IngredientAdmin(models.Ingredient):
-    pass
+class IngredientAdmin(LargeTableAdmin):
+    """ Admin pages for ingredients. """
+    list_display = ['id', 'name', 'user']
+    search_fields = ['name']
+    search_help_text = _('Ingredient id, owner email or name prefix.')
+    csv_fields = ['id', 'user__email', 'name']
 
 
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Recipe)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.Tag, TagAdmin)
+admin.site.register(models.Ingredient, IngredientAdmin)
+admin.site.register(models.RequestProfile, RequestProfileAdmin)
+admin.site.register(models.UserPurge, UserPurgeAdmin)
 
@@ -0,0 +1,279 @@
+"""
+Micro benchmarks for recipe queries, serializers and rendering.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.renderers import JSONRenderer  # type: ignore
+from rest_framework.request import Request  # type: ignore
+from rest_framework.test import APIRequestFactory  # type: ignore
+
+from core.models import Recipe, Tag, Ingredient
+from recipe.documents import (
+    load_documents,
+    refresh_documents,
+    serve_document,
+)
+from recipe.serializers import RecipeSerializer
+from recipe.views import RecipeViewSet
+
+
+@contextmanager
+def rolled_back():
+    """ Run the block in a transaction that is always rolled back. """
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def measure(func, rounds, warmup=1):
+    """ Time func and return summary statistics in milliseconds. """
+    for _ in range(warmup):
+        func()
+    with CaptureQueriesContext(connection) as queries:
+        func()
+
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+
+    return {
+        'rounds': rounds,
+        'min_ms': timings[0],
+        'median_ms': statistics.median(timings),
+        'mean_ms': statistics.fmean(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'queries': len(queries),
+    }
+
+
+def create_dataset(name, recipes, tags_per_recipe=3):
+    """ Bulk create a user owning recipes with tags and ingredients. """
+    user = get_user_model().objects.create_user(
+        f'{name}@example.com', 'benchmark123',
+    )
+    tags = Tag.objects.bulk_create(
+        Tag(user=user, name=f'tag {i}') for i in range(tags_per_recipe * 2)
+    )
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(user=user, name=f'ingredient {i}')
+        for i in range(tags_per_recipe * 2)
+    )
+    recipe_objs = Recipe.objects.bulk_create(
+        Recipe(
+            user=user,
+            title=f'recipe {i}',
+            time_minutes=10 + i % 50,
+            price=Decimal('4.50'),
+            description='benchmark recipe',
+        )
+        for i in range(recipes)
+    )
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+        for i, recipe in enumerate(recipe_objs)
+        for tag in tags[i % 2::2][:tags_per_recipe]
+    )
+    Recipe.ingredients.through.objects.bulk_create(
+        Recipe.ingredients.through(
+            recipe_id=recipe.id, ingredient_id=ingredient.id,
+        )
+        for i, recipe in enumerate(recipe_objs)
+        for ingredient in ingredients[i % 2::2][:tags_per_recipe]
+    )
+    Recipe.objects.filter(user=user).refresh_related_arrays()
+
+    return user, tags, ingredients
+
+
+def make_request(user, params=None):
+    request = Request(APIRequestFactory().get('/', params or {}))
+    request.user = user
+    return request
+
+
+def recipe_payload(tag_count, prefix='tag'):
+    return {
+        'title': 'benchmark recipe',
+        'time_minutes': 20,
+        'price': '7.25',
+        'tags': [{'name': f'{prefix} {i}'} for i in range(tag_count)],
+        'ingredients': [
+            {'name': f'{prefix} ingredient {i}'} for i in range(tag_count)
+        ],
+    }
+
+
+def bench_create(user, tag_count):
+    payload = recipe_payload(tag_count)
+    context = {'request': make_request(user)}
+
+    def run():
+        with rolled_back():
+            serializer = RecipeSerializer(data=payload, context=context)
+            serializer.is_valid(raise_exception=True)
+            serializer.save(user=user)
+
+    return run
+
+
+def bench_update(user, tag_count):
+    context = {'request': make_request(user)}
+    serializer = RecipeSerializer(
+        data=recipe_payload(tag_count), context=context,
+    )
+    serializer.is_valid(raise_exception=True)
+    recipe = serializer.save(user=user)
+    payload = recipe_payload(tag_count, prefix='new')
+
+    def run():
+        with rolled_back():
+            serializer = RecipeSerializer(
+                recipe, data=payload, context=context,
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+    return run
+
+
+def list_queryset(user, params=None):
+    view = RecipeViewSet()
+    view.action = 'list'
+    view.format_kwarg = None
+    view.request = make_request(user, params)
+    return view.get_queryset()
+
+
+def list_documents(user, request):
+    """ Build the list response the way RecipeViewSet.list does. """
+    documents = load_documents(
+        list_queryset(user).values_list('pk', 'document')
+    )
+    return [
+        serve_document(document, request, list_view=True)
+        for document in documents
+    ]
+
+
+def bench_list_serialize(user):
+    request = make_request(user)
+    # Store the documents before timing, like a saved recipe has them.
+    refresh_documents(list_queryset(user).filter(document={}))
+
+    def run():
+        list_documents(user, request)
+
+    return run
+
+
+def bench_list_model_serializer(user):
+    """ The serializer the list view used before stored documents. """
+    def run():
+        RecipeSerializer(list_queryset(user), many=True).data
+
+    return run
+
+
+def bench_get_queryset(user, params):
+    def run():
+        list(list_queryset(user, params))
+
+    return run
+
+
+def bench_render(user):
+    data = list_documents(user, make_request(user))
+    renderer = JSONRenderer()
+
+    def run():
+        renderer.render(data)
+
+    return run
+
+
+def build_cases(sizes, tag_counts):
+    """ Return (name, callable) pairs for every benchmark. """
+    cases = []
+    for tag_count in tag_counts:
+        user, _, _ = create_dataset(f'write{tag_count}', 0)
+        cases.append((
+            f'serializer_create_tags_{tag_count}',
+            bench_create(user, tag_count),
+        ))
+        cases.append((
+            f'serializer_update_tags_{tag_count}',
+            bench_update(user, tag_count),
+        ))
+
+    for size in sizes:
+        user, tags, ingredients = create_dataset(f'list{size}', size)
+        cases.append((f'list_serialize_{size}', bench_list_serialize(user)))
+        cases.append((
+            f'list_model_serializer_{size}', bench_list_model_serializer(user),
+        ))
+        cases.append((f'render_json_{size}', bench_render(user)))
+
+        filters = {
+            'plain': {},
+            'tags': {'tags': f'{tags[0].id},{tags[1].id}'},
+            'ingredients': {
+                'ingredients': f'{ingredients[0].id},{ingredients[1].id}',
+            },
+            'tags_and_ingredients': {
+                'tags': f'{tags[0].id},{tags[1].id}',
+                'ingredients': f'{ingredients[0].id}',
+            },
+        }
+        for variant, params in filters.items():
+            cases.append((
+                f'get_queryset_{variant}_{size}',
+                bench_get_queryset(user, params),
+            ))
+
+    return cases
+
+
+def run_benchmarks(sizes, tag_counts, rounds, stdout=None):
+    """ Run every benchmark and return the results by name. """
+    results = {}
+    for name, func in build_cases(sizes, tag_counts):
+        results[name] = measure(func, rounds)
+        if stdout is not None:
+            stdout.write(
+                f"{name}: {results[name]['median_ms']:.3f} ms median, "
+                f"{results[name]['queries']} queries"
+            )
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare medians against a baseline.
+
+    Return a row per benchmark present in both and the names of those
+    that got slower by more than threshold percent.
+    """
+    rows = []
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['median_ms']
+        after = result['median_ms']
+        change = (after - before) / before * 100 if before else 0.0
+        rows.append((name, before, after, change))
+        if change > threshold:
+            regressions.append(name)
+
+    return rows, regressions
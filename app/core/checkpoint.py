@@ -0,0 +1,32 @@
+"""
+Progress files for resumable management commands.
+"""
+import json
+import os
+
+
+class Checkpoint:
+    """ A JSON state file that is replaced atomically on every save. """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """ Return the saved state, or None when there is none. """
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state):
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(state, file)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,308 @@
+"""
+Routing of API reads to database replicas.
+
+ReplicaRoutingMiddleware marks GET, HEAD and OPTIONS requests as safe to
+read from a replica, and ReplicaRouter sends their reads to one replica
+per request. Everything else uses the primary:
+
+- writes, and every query of other requests
+- queries inside a transaction
+- credentials (tokens and sessions), so a token works right after login
+- requests of a user who wrote within DB_PIN_SECONDS, so a client sees
+  its own edits at once
+
+Pins are kept in an SQLite file in /dev/shm that the processes of a
+node share, like the throttle buckets. Unlike a cache it never evicts a
+pin before it expires. With several nodes behind a load balancer set
+DB_PIN_CACHE to a cache alias every node shares, e.g. Redis.
+
+ReplicaMonitor measures the replication lag of each replica every
+DB_REPLICA_CHECK_SECONDS in a background thread, so a replica that
+doesn't answer never delays a request. It leaves out replicas that are
+behind by more than DB_REPLICA_MAX_LAG_SECONDS or don't answer, until
+they catch up. Until the first check of a process is done its reads
+use the primary.
+"""
+import contextvars
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.functional import empty
+
+from core import metrics
+
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Credentials are read from the primary.
+PRIMARY_APPS = ('authtoken', 'sessions')
+
+LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+routing = contextvars.ContextVar('db_routing', default=None)
+
+
+# Expired pins are deleted now and then.
+PRUNE_EVERY = 1000
+
+
+class PinStore:
+    """ Pins of users to the primary in an SQLite file. """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.calls = 0
+
+    @property
+    def connection(self):
+        # SQLite connections must not cross threads or a fork.
+        if getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=1, isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS pin ('
+                'user_id INTEGER PRIMARY KEY, until REAL NOT NULL)'
+            )
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def pin(self, user_pk, seconds, now=None):
+        now = time.time() if now is None else now
+        self.connection.execute(
+            'INSERT OR REPLACE INTO pin (user_id, until) VALUES (?, ?)',
+            (user_pk, now + seconds),
+        )
+        self.calls += 1
+        if self.calls % PRUNE_EVERY == 0:
+            self.connection.execute('DELETE FROM pin WHERE until < ?', (now,))
+
+    def is_pinned(self, user_pk, now=None):
+        now = time.time() if now is None else now
+        row = self.connection.execute(
+            'SELECT until FROM pin WHERE user_id = ?', (user_pk,),
+        ).fetchone()
+        return row is not None and row[0] > now
+
+    def clear(self):
+        self.connection.execute('DELETE FROM pin')
+
+
+stores = {}
+
+
+def pin_store():
+    path = settings.DB_PIN_DB_PATH
+    if path not in stores:
+        stores[path] = PinStore(path)
+    return stores[path]
+
+
+def pin_key(user_pk):
+    return f'db-pin:{user_pk}'
+
+
+def pin_user(user):
+    """ Read from the primary for user until replicas have the writes. """
+    if settings.DB_PIN_CACHE:
+        caches[settings.DB_PIN_CACHE].set(
+            pin_key(user.pk), True, settings.DB_PIN_SECONDS,
+        )
+        return
+    try:
+        pin_store().pin(user.pk, settings.DB_PIN_SECONDS)
+    except sqlite3.Error:
+        logger.warning('Could not pin user %s', user.pk, exc_info=True)
+
+
+def is_pinned(user):
+    if settings.DB_PIN_CACHE:
+        return caches[settings.DB_PIN_CACHE].get(pin_key(user.pk), False)
+    try:
+        return pin_store().is_pinned(user.pk)
+    except sqlite3.Error:
+        # Reading a write back may fail, reading old data can't.
+        logger.warning('Pin store unavailable', exc_info=True)
+        return True
+
+
+def loaded_user(request):
+    """ Return the user of request if it is known without a query. """
+    user = request.__dict__.get('user')
+    if user is None or getattr(user, '_wrapped', None) is empty:
+        return None
+    return user if user.is_authenticated else None
+
+
+class ReplicaMonitor:
+    """ Track the lag of the replicas and list those that are usable. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = None
+        self.healthy = None
+        self.thread = None
+
+    def replicas(self):
+        """ Return the usable replicas, starting a check when one is due. """
+        now = time.monotonic()
+        due = self.checked is None or \
+            now - self.checked >= settings.DB_REPLICA_CHECK_SECONDS
+        # Requests use the last result while the check runs.
+        if due and self.lock.acquire(blocking=False):
+            try:
+                if self.thread is None or not self.thread.is_alive():
+                    self.checked = now
+                    self.thread = threading.Thread(
+                        target=self.run_check, name='replica-monitor',
+                        daemon=True,
+                    )
+                    self.thread.start()
+            finally:
+                self.lock.release()
+        return self.healthy or []
+
+    def run_check(self):
+        try:
+            self.healthy = self.check()
+        except Exception:
+            logger.exception('Checking the replicas failed')
+        finally:
+            # The connections belong to this thread, which ends here.
+            connections.close_all()
+
+    def wait(self, timeout=None):
+        """ Wait for a running check to finish. """
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def reset(self):
+        self.wait()
+        with self.lock:
+            self.checked = None
+            self.healthy = None
+            self.thread = None
+
+    def check(self):
+        """ Return the replicas that answer and are not too far behind. """
+        previous = settings.DATABASE_REPLICAS if self.healthy is None \
+            else self.healthy
+        healthy = []
+        for alias in settings.DATABASE_REPLICAS:
+            lag = self.lag(alias)
+            if lag is not None:
+                metrics.DB_REPLICA_LAG.labels(alias).set(lag)
+            if lag is not None and lag <= settings.DB_REPLICA_MAX_LAG_SECONDS:
+                healthy.append(alias)
+                if alias not in previous:
+                    logger.info('Readmitting replica %s, lag %s s', alias, lag)
+            elif alias in previous:
+                logger.warning('Ejecting replica %s, lag %s s', alias, lag)
+        return healthy
+
+    def lag(self, alias):
+        """ Return the replication lag of alias in seconds, or None. """
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                lag = cursor.fetchone()[0]
+        except DatabaseError:
+            # Drop the broken connection so the next check reconnects.
+            connection.close()
+            return None
+        return None if lag is None else float(lag)
+
+
+monitor = ReplicaMonitor()
+
+
+class RequestRouting:
+    """ The database choice of one request. """
+
+    def __init__(self, request):
+        self.request = request
+        self.replica = None
+        self.pinned = None
+
+    def read_alias(self):
+        if self.request.method not in SAFE_METHODS:
+            return DEFAULT_DB_ALIAS
+        user = loaded_user(self.request)
+        if user is not None:
+            if self.pinned is None:
+                self.pinned = is_pinned(user)
+            if self.pinned:
+                return DEFAULT_DB_ALIAS
+        if self.replica is None:
+            replicas = monitor.replicas()
+            # One replica per request keeps its reads consistent.
+            self.replica = random.choice(replicas) if replicas \
+                else DEFAULT_DB_ALIAS
+        return self.replica
+
+
+class ReplicaRoutingMiddleware:
+    """ Route the reads of safe requests and pin users who write. """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        token = routing.set(RequestRouting(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            routing.reset(token)
+        if request.method not in SAFE_METHODS:
+            user = loaded_user(request)
+            if user is not None:
+                pin_user(user)
+        return response
+
+
+class ReplicaRouter:
+    """ Send the reads of safe requests to a replica. """
+
+    def db_for_read(self, model, **hints):
+        state = routing.get()
+        if state is None:
+            return None
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,134 @@
+"""
+Recipe image metadata.
+
+Dimensions, size, format and a BlurHash placeholder are read once when
+an image is stored and kept on Recipe, so serving a recipe never opens
+its image. Dimensions are the displayed ones, after the EXIF rotation.
+"""
+import math
+
+from PIL import Image, ImageOps
+
+
+EMPTY_IMAGE_METADATA = {
+    'image_width': None,
+    'image_height': None,
+    'image_size': None,
+    'image_format': '',
+    'image_placeholder': '',
+}
+IMAGE_METADATA_FIELDS = tuple(EMPTY_IMAGE_METADATA)
+
+# 4x3 components give the usual 28 character BlurHash.
+PLACEHOLDER_COMPONENTS = (4, 3)
+PLACEHOLDER_SAMPLE_SIZE = 32
+
+BASE83 = (
+    '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    'abcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+)
+SRGB_TO_LINEAR = [
+    value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+    for value in (i / 255 for i in range(256))
+]
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def base83(value, length):
+    return ''.join(
+        BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length)
+    )
+
+
+def linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image, components=PLACEHOLDER_COMPONENTS):
+    """ Return the BlurHash of a Pillow image. """
+    x_components, y_components = components
+    image = image.convert('RGB')
+    image.thumbnail((PLACEHOLDER_SAMPLE_SIZE, PLACEHOLDER_SAMPLE_SIZE))
+    width, height = image.size
+    pixels = [
+        tuple(SRGB_TO_LINEAR[channel] for channel in pixel)
+        for pixel in image.getdata()
+    ]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)]
+             for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)]
+             for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            red = green = blue = 0.0
+            for y in range(height):
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[i][x] * cos_y[j][y]
+                    pixel = pixels[row + x]
+                    red += basis * pixel[0]
+                    green += basis * pixel[1]
+                    blue += basis * pixel[2]
+            factors.append((red * scale, green * scale, blue * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = base83(x_components - 1 + (y_components - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(value) for factor in ac for value in factor)
+        quantised_max = max(0, min(82, int(actual_max * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    result += base83(quantised_max, 1)
+    result += base83(
+        (linear_to_srgb(dc[0]) << 16) + (linear_to_srgb(dc[1]) << 8)
+        + linear_to_srgb(dc[2]),
+        4,
+    )
+    for factor in ac:
+        red, green, blue = (
+            max(0, min(18, math.floor(
+                math.copysign(abs(value / max_value) ** 0.5, value) * 9 + 9.5
+            )))
+            for value in factor
+        )
+        result += base83(red * 19 * 19 + green * 19 + blue, 2)
+
+    return result
+
+
+def image_metadata(file):
+    """ Return the Recipe image metadata fields of an image file. """
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        image_format = (image.format or '').lower()
+        if image.getexif().get(EXIF_ORIENTATION) in ROTATED_ORIENTATIONS:
+            width, height = height, width
+        # Let JPEG decode at a reduced scale, the hash needs 32 pixels.
+        image.draft('RGB', (PLACEHOLDER_SAMPLE_SIZE * 2,) * 2)
+        placeholder = blurhash(ImageOps.exif_transpose(image))
+    file.seek(0)
+
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_size': file.size,
+        'image_format': image_format,
+        'image_placeholder': placeholder,
+    }
+
+
+def set_image_metadata(recipe):
+    """ Set the metadata fields of recipe from its assigned image. """
+    metadata = image_metadata(recipe.image) if recipe.image \
+        else EMPTY_IMAGE_METADATA
+    for field, value in metadata.items():
+        setattr(recipe, field, value)
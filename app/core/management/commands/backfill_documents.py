@@ -0,0 +1,52 @@
+"""
+Django command to store the documents of recipes that have none.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from recipe.documents import refresh_documents
+
+
+class Command(BaseCommand):
+    """Django command to backfill recipe documents"""
+
+    help = (
+        'Build and store the documents of recipes whose document is empty, '
+        'e.g. after a migration changed the payload, in primary key '
+        'batches. Until then reads serialize those recipes every time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Rebuild the document of every recipe.',
+        )
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command"""
+        recipes = Recipe.objects.all()
+        if not options['all']:
+            recipes = recipes.filter(document={})
+
+        start = time.perf_counter()
+        stored = last_pk = 0
+        while True:
+            batch = list(
+                recipes.filter(pk__gt=last_pk).order_by('pk')
+                [:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            refresh_documents(batch)
+            stored += len(batch)
+            self.stdout.write(f'Stored {stored} documents')
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {stored} documents in {elapsed:.1f}s'
+        ))
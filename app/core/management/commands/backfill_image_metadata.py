@@ -0,0 +1,66 @@
+"""
+Django command to store the metadata of existing recipe images.
+"""
+import time
+
+from PIL import Image
+
+from django.core.management.base import BaseCommand
+
+from core.images import IMAGE_METADATA_FIELDS, set_image_metadata
+from core.models import Recipe
+from recipe.documents import refresh_documents
+
+
+class Command(BaseCommand):
+    """Django command to backfill recipe image metadata"""
+
+    help = (
+        'Read dimensions, size, format and the placeholder hash of recipe '
+        'images stored before they were recorded, in primary key batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute the metadata of every image.',
+        )
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command"""
+        recipes = Recipe.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            recipes = recipes.filter(image_width__isnull=True)
+
+        start = time.perf_counter()
+        updated = failed = last_pk = 0
+        while True:
+            batch = list(
+                recipes.filter(pk__gt=last_pk).order_by('pk')
+                [:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            changed = []
+            for recipe in batch:
+                try:
+                    with recipe.image.open('rb'):
+                        set_image_metadata(recipe)
+                except (OSError, Image.DecompressionBombError) as error:
+                    failed += 1
+                    self.stderr.write(f'Recipe {recipe.pk}: {error}')
+                    continue
+                changed.append(recipe)
+            Recipe.objects.bulk_update(changed, IMAGE_METADATA_FIELDS)
+            refresh_documents(changed)
+            updated += len(changed)
+            self.stdout.write(f'Updated {updated} recipes')
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored metadata of {updated} images in {elapsed:.1f}s, '
+            f'{failed} could not be read'
+        ))
@@ -0,0 +1,130 @@
+"""
+Django command to store the resized variants of existing recipe images.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.checkpoint import Checkpoint
+from core.models import Recipe
+from core.variants import init_worker, render_variants
+
+
+class Command(BaseCommand):
+    """Django command to backfill recipe image variants"""
+
+    help = (
+        'Render the RECIPE_IMAGE_VARIANTS of every recipe image across a '
+        'pool of worker processes, skipping variants that exist. Progress '
+        'is checkpointed after every batch and the next run continues '
+        'from there.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Worker processes, one per core by default. 0 renders '
+                 'in this process.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--checkpoint',
+            help='Progress file, MEDIA_ROOT/.image_variants.json by '
+                 'default.',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the checkpoint and start from the first recipe.',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Render variants again even if they exist.',
+        )
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command"""
+        checkpoint = Checkpoint(options['checkpoint'] or os.path.join(
+            settings.MEDIA_ROOT, '.image_variants.json',
+        ))
+        state = {'last_pk': 0, 'images': 0, 'variants': 0, 'failed': 0}
+        if options['restart']:
+            checkpoint.clear()
+        else:
+            saved = checkpoint.load()
+            if saved is not None:
+                state.update(saved)
+                self.stdout.write(f'Resuming after recipe {state["last_pk"]}')
+
+        pool = None
+        if options['workers']:
+            # Fork, so workers start with the settings and storage of this
+            # process instead of setting Django up again.
+            pool = ProcessPoolExecutor(
+                options['workers'],
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=init_worker,
+            )
+        start = time.perf_counter()
+        images = 0
+        try:
+            while True:
+                names = self.next_batch(state, options['batch_size'])
+                if names is None:
+                    break
+                forced = [options['force']] * len(names)
+                if pool is None:
+                    results = map(render_variants, names, forced)
+                else:
+                    # Few large chunks per worker keep the IPC cheap.
+                    results = pool.map(
+                        render_variants, names, forced,
+                        chunksize=max(
+                            1, len(names) // (options['workers'] * 4),
+                        ),
+                    )
+                for name, written, error in results:
+                    if error:
+                        state['failed'] += 1
+                        self.stderr.write(f'{name}: {error}')
+                    state['variants'] += written
+                images += len(names)
+                state['images'] += len(names)
+                checkpoint.save(state)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'Checked {state["images"]} images, '
+                    f'{images / elapsed:.1f} images/s'
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        checkpoint.clear()
+
+        elapsed = time.perf_counter() - start
+        rate = images / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {state["images"]} images and wrote {state["variants"]} '
+            f'variants, {state["failed"]} images could not be read. '
+            f'{images} images in {elapsed:.1f}s, {rate:.1f} images/s'
+        ))
+
+    def next_batch(self, state, batch_size):
+        """ Return the distinct image names of the next recipes, or None. """
+        rows = list(
+            Recipe.objects.exclude(image='').exclude(image__isnull=True)
+            .filter(pk__gt=state['last_pk']).order_by('pk')
+            .values_list('pk', 'image')[:batch_size]
+        )
+        if not rows:
+            return None
+        state['last_pk'] = rows[-1][0]
+        # Recipes share the file of equal images, render it once.
+        return list(dict.fromkeys(name for _, name in rows))
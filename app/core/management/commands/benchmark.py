@@ -0,0 +1,103 @@
+"""
+Django command to run the micro benchmark suite.
+"""
+import json
+import platform
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    teardown_databases,
+)
+
+from core.benchmarks import compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    """Django command to benchmark queries, serializers and rendering"""
+
+    help = (
+        'Run the benchmark suite against a throwaway test database and '
+        'compare the results with a stored baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10, 100, 1000],
+        )
+        parser.add_argument(
+            '--tag-counts', type=int, nargs='+', default=[10, 100],
+        )
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--baseline', default=None)
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=10.0,
+            help='Fail when a median is this many percent slower.',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Write the results to --baseline instead of comparing.',
+        )
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command"""
+        old_config = setup_databases(
+            verbosity=0, interactive=False, keepdb=options['keepdb'],
+        )
+        try:
+            with override_settings(DEBUG=False):
+                results = run_benchmarks(
+                    options['sizes'],
+                    options['tag_counts'],
+                    options['rounds'],
+                    stdout=self.stdout,
+                )
+        finally:
+            teardown_databases(
+                old_config, verbosity=0, keepdb=options['keepdb'],
+            )
+
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+        }
+        self.write_json(options['output'], report)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        baseline_path = options['baseline']
+        if not baseline_path:
+            return
+        if options['save_baseline']:
+            self.write_json(baseline_path, report)
+            self.stdout.write(f'Baseline written to {baseline_path}')
+            return
+
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        rows, regressions = compare(results, baseline, options['threshold'])
+        for name, before, after, change in rows:
+            line = f'{name}: {before:.3f} -> {after:.3f} ms ({change:+.1f}%)'
+            if name in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} benchmarks regressed by more than '
+                f"{options['threshold']}%"
+            )
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
+
+    def write_json(self, path, data):
+        with open(path, 'w') as output:
+            json.dump(data, output, indent=2, sort_keys=True)
@@ -0,0 +1,96 @@
+"""
+Django command to delete media files no recipe refers to.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from core.media_gc import MediaCollector
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """Django command to garbage collect orphaned recipe images"""
+
+    help = (
+        'Walk MEDIA_ROOT and delete files that no recipe refers to and that '
+        'are older than the grace period. Progress is checkpointed after '
+        'every batch and the next run continues from there.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.MEDIA_RELEASE_GRACE_SECONDS,
+            help='Keep files modified within this many seconds.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            help='Stop after the batch running past this many seconds.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Progress file, MEDIA_ROOT/.gc_media.json by default.',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the checkpoint and walk the whole tree.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report orphans without deleting them.',
+        )
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command"""
+        storage = Recipe._meta.get_field('image').storage
+        if not isinstance(storage, FileSystemStorage):
+            raise CommandError(
+                'gc_media walks MEDIA_ROOT, but recipe images are kept in '
+                'object storage.'
+            )
+        checkpoint = options['checkpoint'] or os.path.join(
+            settings.MEDIA_ROOT, '.gc_media.json',
+        )
+        collector = MediaCollector(
+            settings.MEDIA_ROOT,
+            options['grace'],
+            checkpoint=checkpoint,
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            stdout=self.stdout,
+        )
+        if options['restart']:
+            collector.clear_checkpoint()
+        elif not options['dry_run'] and collector.load_checkpoint():
+            self.stdout.write(
+                f'Resuming after {"/".join(collector.after)}'
+            )
+
+        start = time.perf_counter()
+        complete = collector.run(options['max_seconds'])
+        elapsed = time.perf_counter() - start
+
+        stats = collector.stats
+        verb = 'would reclaim' if options['dry_run'] else 'reclaimed'
+        summary = (
+            f'Scanned {stats["scanned"]} files, found {stats["orphans"]} '
+            f'orphans, deleted {stats["deleted"]}, {verb} '
+            f'{filesizeformat(stats["bytes"])} ({stats["bytes"]} bytes) '
+            f'in {elapsed:.1f}s'
+        )
+        if complete:
+            self.stdout.write(self.style.SUCCESS(summary))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'{summary}. Stopped early, run again to continue.'
+            ))
@@ -0,0 +1,93 @@
+"""
+Django command to maintain the recipe table partitions one at a time.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.template.defaultfilters import filesizeformat
+
+from core.models import Recipe
+from core.partitioning import (
+    partition_count,
+    partitions,
+    recipe_tables,
+    repartition,
+)
+
+
+class Command(BaseCommand):
+    """Django command to analyze, vacuum or reindex recipe partitions"""
+
+    help = (
+        'Analyze the partitions of the recipe tables one by one, so each '
+        'run locks and scans a single partition. Optionally vacuum and '
+        'reindex them, or rebuild the tables for a changed '
+        'RECIPE_HASH_PARTITIONS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--vacuum',
+            action='store_true',
+            help='VACUUM (ANALYZE) each partition instead of ANALYZE.',
+        )
+        parser.add_argument(
+            '--reindex',
+            action='store_true',
+            help='Rebuild the indexes of each partition concurrently.',
+        )
+        parser.add_argument(
+            '--repartition',
+            action='store_true',
+            help='Rebuild the tables when their partition count differs '
+                 'from RECIPE_HASH_PARTITIONS. Locks them while copying.',
+        )
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command"""
+        tables = recipe_tables(Recipe)
+        if options['repartition']:
+            self.repartition()
+
+        with connection.cursor() as cursor:
+            for table, _ in tables:
+                for partition in partitions(cursor, table):
+                    self.maintain(cursor, partition, options)
+
+    def repartition(self):
+        count = settings.RECIPE_HASH_PARTITIONS
+        with connection.cursor() as cursor:
+            current = partition_count(cursor, Recipe._meta.db_table)
+        if current == count:
+            self.stdout.write(f'Recipe tables have {count} partitions')
+            return
+        start = time.perf_counter()
+        repartition(connection, Recipe, count)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt recipe tables from {current} to {count} partitions '
+            f'in {time.perf_counter() - start:.1f}s'
+        ))
+
+    def maintain(self, cursor, partition, options):
+        name = connection.ops.quote_name(partition)
+        start = time.perf_counter()
+        # VACUUM and REINDEX CONCURRENTLY can't run in a transaction,
+        # Django's autocommit runs each statement on its own.
+        if options['vacuum']:
+            cursor.execute(f'VACUUM (ANALYZE) {name}')
+        else:
+            cursor.execute(f'ANALYZE {name}')
+        if options['reindex']:
+            cursor.execute(f'REINDEX TABLE CONCURRENTLY {name}')
+        cursor.execute(
+            'SELECT reltuples::bigint, pg_total_relation_size(oid) '
+            'FROM pg_class WHERE oid = %s::regclass',
+            [partition],
+        )
+        rows, size = cursor.fetchone()
+        self.stdout.write(
+            f'{partition}: {max(rows, 0)} rows, {filesizeformat(size)}, '
+            f'{time.perf_counter() - start:.2f}s'
+        )
@@ -0,0 +1,46 @@
+"""
+Django command to delete deactivated users and their data in batches.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import UserPurge
+from core.purge import UserPurger
+
+
+class Command(BaseCommand):
+    """Django command to run the queued user purges"""
+
+    help = (
+        'Delete the recipes, tags and ingredients of users queued for '
+        'deletion a batch per transaction, then the users themselves. '
+        'Progress is saved after every batch and the next run continues '
+        'from there.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            help='Stop after the batch running past this many seconds.',
+        )
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command"""
+        purger = UserPurger(
+            batch_size=options['batch_size'], stdout=self.stdout,
+        )
+        start = time.perf_counter()
+        complete = purger.run(options['max_seconds'])
+        elapsed = time.perf_counter() - start
+
+        pending = UserPurge.objects.filter(finished__isnull=True).count()
+        summary = f'{pending} users left to purge after {elapsed:.1f}s'
+        if complete:
+            self.stdout.write(self.style.SUCCESS(summary))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'{summary}. Stopped early, run again to continue.'
+            ))
@@ -0,0 +1,101 @@
+"""
+Django command to fill the database with synthetic data.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from core.seeding import DEFAULTS, seed
+
+
+class Command(BaseCommand):
+    """Django command to bulk create users, recipes, tags and images"""
+
+    help = (
+        'Create skewed synthetic data: a few power users own most recipes '
+        'and tag and ingredient popularity is Zipfian. The same --seed '
+        'always produces the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=DEFAULTS['users'])
+        parser.add_argument(
+            '--recipes', type=int, default=DEFAULTS['recipes'],
+        )
+        parser.add_argument(
+            '--tags',
+            type=int,
+            default=DEFAULTS['tags'],
+            help='Number of distinct tag names.',
+        )
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=DEFAULTS['ingredients'],
+            help='Number of distinct ingredient names.',
+        )
+        parser.add_argument(
+            '--images',
+            type=int,
+            default=DEFAULTS['images'],
+            help='Number of recipes that get a generated image.',
+        )
+        parser.add_argument(
+            '--power-users', type=int, default=DEFAULTS['power_users'],
+        )
+        parser.add_argument(
+            '--power-share',
+            type=float,
+            default=DEFAULTS['power_share'],
+            help='Fraction of recipes owned by the power users.',
+        )
+        parser.add_argument(
+            '--zipf',
+            type=float,
+            default=DEFAULTS['zipf'],
+            help='Zipf exponent of tag and ingredient popularity.',
+        )
+        parser.add_argument(
+            '--tags-per-recipe',
+            type=int,
+            default=DEFAULTS['tags_per_recipe'],
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe',
+            type=int,
+            default=DEFAULTS['ingredients_per_recipe'],
+        )
+        parser.add_argument('--password', default=DEFAULTS['password'])
+        parser.add_argument(
+            '--email-prefix', default=DEFAULTS['email_prefix'],
+        )
+        parser.add_argument('--seed', type=int, default=DEFAULTS['seed'])
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULTS['batch_size'],
+        )
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command"""
+        prefix = options['email_prefix']
+        if User.objects.filter(email__startswith=prefix).exists():
+            raise CommandError(
+                f'Users starting with {prefix!r} already exist, '
+                'pass another --email-prefix.'
+            )
+        if options['users'] < 1 and options['recipes']:
+            raise CommandError('Recipes need at least one user.')
+
+        start = time.perf_counter()
+        counts = seed(
+            stdout=self.stdout,
+            **{key: options[key] for key in DEFAULTS},
+        )
+        elapsed = time.perf_counter() - start
+
+        summary = ', '.join(
+            f'{count} {name}' for name, count in counts.items()
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {summary} in {elapsed:.1f}s'
+        ))
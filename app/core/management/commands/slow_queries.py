@@ -0,0 +1,61 @@
+"""
+Django command to summarize the slow query log.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.slow_queries import normalize_sql, read_records
+
+
+class Command(BaseCommand):
+    """Django command to list the worst slow queries"""
+
+    help = 'Summarize the slow query log by query and call site.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=None)
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument(
+            '--sort',
+            choices=['total', 'max', 'count'],
+            default='total',
+        )
+
+    def handle(self, *args, **options):
+        """ Entrypoint for command"""
+        path = options['log'] or settings.SLOW_QUERY_LOG
+        groups = {}
+        for record in read_records(path):
+            key = (normalize_sql(record['sql']), record.get('call_site'))
+            group = groups.setdefault(key, {
+                'count': 0,
+                'total': 0.0,
+                'max': 0.0,
+                'plan': None,
+            })
+            group['count'] += 1
+            group['total'] += record['duration_ms']
+            group['max'] = max(group['max'], record['duration_ms'])
+            group['plan'] = record.get('plan') or group['plan']
+
+        if not groups:
+            self.stdout.write('No slow queries recorded.')
+            return
+
+        worst = sorted(
+            groups.items(),
+            key=lambda item: item[1][options['sort']],
+            reverse=True,
+        )[:options['top']]
+
+        for (sql, call_site), group in worst:
+            self.stdout.write(self.style.WARNING(
+                f"{group['count']} calls, {group['total']:.1f} ms total, "
+                f"{group['total'] / group['count']:.1f} ms avg, "
+                f"{group['max']:.1f} ms max"
+            ))
+            self.stdout.write(f'  at {call_site or "unknown call site"}')
+            self.stdout.write(f'  {sql}')
+            if group['plan']:
+                for line in group['plan'].splitlines():
+                    self.stdout.write(f'    {line}')
@@ -4,22 +4,67 @@ Django command to wait for the database to be avalible
 import time
 from psycopg2 import OperationalError as psycopg2Error
 
+from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
 
 class Command(BaseCommand):
     """Django command to wait for database"""
 
+    help = (
+        'Wait until the database accepts connections, retrying with a '
+        'short exponential backoff until --timeout seconds have passed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=60.0,
+            help='Give up after this many seconds.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0.05,
+            help='First delay between attempts, doubled after each one.',
+        )
+        parser.add_argument('--max-interval', type=float, default=1.0)
+
+    def ping(self, alias):
+        """ Open a connection, which is all a readiness probe needs. """
+        connection = connections[alias]
+        try:
+            connection.ensure_connection()
+        except Exception:
+            connection.close()
+            raise
+
     def handle(self, *args, **options):
         """ Entrypoint for command"""
         self.stdout.write("wating for Database ...")
-        db_up = False
-        while db_up is False:
+        deadline = time.monotonic() + options['timeout']
+        interval = options['interval']
+        attempts = 0
+        while True:
+            attempts += 1
             try:
-                self.check(databases =['default'])
-                db_up = True
-            except(psycopg2Error,  OperationalError):
-                self.stdout.write('Database unavailble, waiting 1 second ...')
-                time.sleep(1)
+                self.ping(options['database'])
+                break
+            except (psycopg2Error, OperationalError) as error:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'Database unavailable after {attempts} attempts '
+                        f"in {options['timeout']:g}s: {error}"
+                    )
+                delay = min(interval, remaining)
+                self.stdout.write(
+                    f'Database unavailable, retrying in {delay:.2f}s ...'
+                )
+                time.sleep(delay)
+                interval = min(interval * 2, options['max_interval'])
 
         self.stdout.write(self.style.SUCCESS('Databases available!'))
@@ -0,0 +1,183 @@
+"""
+Serving of uploaded media.
+
+Media is only served to the owner of the recipe it belongs to. Once
+access is checked the byte transfer is handed to the front web server
+with X-Accel-Redirect when MEDIA_ACCEL_REDIRECT_PREFIX is set. Otherwise
+the file is returned as a FileResponse, which WSGI servers with a
+wsgi.file_wrapper send with sendfile(). Images in object storage are
+redirected to a presigned URL instead. Stored names are unique and never
+rewritten, so responses may be cached for a year.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from rest_framework.authentication import (  # type: ignore
+    TokenAuthentication,
+)
+from rest_framework.exceptions import AuthenticationFailed  # type: ignore
+
+from core.models import Recipe
+from core.variants import source_name
+
+
+CACHE_CONTROL = 'private, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def request_user(request):
+    """ Return the session user, or the token user for API clients. """
+    if request.user.is_authenticated:
+        return request.user
+    try:
+        user_auth = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        user_auth = None
+
+    return user_auth[0] if user_auth else request.user
+
+
+def clean_name(path):
+    """ Return path as a storage name, or None if it leaves MEDIA_ROOT. """
+    name = posixpath.normpath(path).lstrip('/')
+    if name in ('', '.') or name.startswith('..') or '\\' in name:
+        return None
+    return name
+
+
+def can_access(user, name):
+    # Variants are visible to whoever may see the image they show.
+    name = source_name(name) or name
+    if not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return Recipe.objects.filter(image=name).exists()
+    return Recipe.objects.filter(image=name, user=user).exists()
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) byte range requested by header.
+
+    Returns None for a missing or unsupported header, which is answered
+    with the whole file, and raises ValueError when the range is outside
+    of the file.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(request, path, stat, etag):
+    """ Return the file, or the requested part of it. """
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if_range = request.META.get('HTTP_IF_RANGE')
+    try:
+        byte_range = None if if_range and if_range != etag else \
+            parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(open(path, 'rb'), start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def accel_response(name):
+    """ Let the front web server send the file, ranges included. """
+    response = HttpResponse()
+    # Let the front server pick the type from the file it sends.
+    del response['Content-Type']
+    response['X-Accel-Redirect'] = (
+        settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(name)
+    )
+    return response
+
+
+def redirect_response(storage, name):
+    """ Send the client to a presigned URL of the object storage. """
+    response = HttpResponseRedirect(storage.download_url(name))
+    # Reuse the redirect while the presigned URL is still valid.
+    response['Cache-Control'] = \
+        f'private, max-age={storage.querystring_expire // 2}'
+    response['Vary'] = 'Authorization, Cookie'
+    return response
+
+
+def serve_media(request, path):
+    """ Return the response for the media file at path. """
+    name = clean_name(path)
+    if name is None or not can_access(request_user(request), name):
+        raise Http404('Media not found.')
+    storage = Recipe._meta.get_field('image').storage
+    if not isinstance(storage, FileSystemStorage):
+        return redirect_response(storage, name)
+    full_path = storage.path(name)
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404('Media not found.')
+
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime),
+    )
+    if response is None:
+        if settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+            response = accel_response(name)
+        else:
+            response = file_response(request, full_path, stat, etag)
+        response['Last-Modified'] = http_date(stat.st_mtime)
+
+    response['ETag'] = etag
+    response['Cache-Control'] = CACHE_CONTROL
+    response['Vary'] = 'Authorization, Cookie'
+    return response
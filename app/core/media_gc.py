@@ -0,0 +1,195 @@
+"""
+Garbage collection of media files no recipe refers to.
+
+The media tree is walked in name order with os.scandir and file names
+are compared against Recipe.image a batch at a time, so memory stays
+flat on millions of files. A directory is listed CHUNK_SIZE names at a
+time, so even the flat directory of legacy uploads is never held in
+memory whole. After every batch the last name is written
+to a checkpoint file, and an interrupted or time boxed run continues
+from there. Files modified within the grace period are never deleted,
+which keeps uploads that are not committed yet safe. Variants live as
+long as their image, unless their options are no longer configured.
+"""
+import heapq
+import os
+import posixpath
+import time
+
+from core.checkpoint import Checkpoint
+from core.models import Recipe
+from core.storage import INCOMING_DIR
+from core.variants import VARIANTS_DIR, is_current, source_name
+
+
+ROOTS = (INCOMING_DIR, posixpath.join('uploads', 'recipe'), VARIANTS_DIR)
+
+STAT_KEYS = ('scanned', 'orphans', 'deleted', 'bytes')
+
+# Entries of a directory held at a time. Larger directories are listed
+# once more for every further chunk.
+CHUNK_SIZE = 10000
+
+
+def sorted_entries(path, first=None):
+    """
+    Yield the entries of directory path in name order from first on.
+
+    Each listing keeps only the CHUNK_SIZE smallest names after the
+    last one yielded.
+    """
+    def wanted(entry):
+        if last is not None:
+            return entry.name > last
+        return first is None or entry.name >= first
+
+    last = None
+    while True:
+        try:
+            with os.scandir(path) as scan:
+                chunk = heapq.nsmallest(
+                    CHUNK_SIZE, filter(wanted, scan),
+                    key=lambda entry: entry.name,
+                )
+        except FileNotFoundError:
+            return
+        yield from chunk
+        if len(chunk) < CHUNK_SIZE:
+            return
+        last = chunk[-1].name
+
+
+def walk(root, directory, after=()):
+    """
+    Yield (name, entry) for the files under directory in name order.
+
+    Names are relative to root and split into their parts to compare
+    with after, the parts of the last name already handled. Directories
+    entirely before it are not listed at all, and the one containing it
+    is listed from its name on.
+    """
+    prefix = tuple(directory.split('/'))
+    first = None
+    if len(after) > len(prefix) and after[:len(prefix)] == prefix:
+        first = after[len(prefix)]
+    entries = sorted_entries(os.path.join(root, directory), first)
+    for entry in entries:
+        name = posixpath.join(directory, entry.name)
+        parts = tuple(name.split('/'))
+        if entry.is_dir(follow_symlinks=False):
+            if parts >= after[:len(parts)]:
+                yield from walk(root, name, after)
+        elif entry.is_file(follow_symlinks=False) and parts > after:
+            yield name, entry
+
+
+class MediaCollector:
+    """ Find and delete media files that are not referenced. """
+
+    def __init__(self, root, grace_seconds, checkpoint=None,
+                 batch_size=1000, dry_run=False, stdout=None):
+        self.root = root
+        self.grace_seconds = grace_seconds
+        self.checkpoint = Checkpoint(checkpoint) if checkpoint else None
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.stdout = stdout
+        self.after = ()
+        self.stats = dict.fromkeys(STAT_KEYS, 0)
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def load_checkpoint(self):
+        """ Continue from the checkpoint file, if there is one. """
+        state = self.checkpoint.load()
+        if state is None:
+            return False
+        self.after = tuple(state['after'].split('/'))
+        self.stats.update(state['stats'])
+        return True
+
+    def save_checkpoint(self, name):
+        self.checkpoint.save({'after': name, 'stats': self.stats})
+
+    def clear_checkpoint(self):
+        self.checkpoint.clear()
+
+    def files(self):
+        for directory in ROOTS:
+            yield from walk(self.root, directory, self.after)
+
+    def run(self, max_seconds=None):
+        """
+        Collect until the tree is done or max_seconds have passed.
+
+        Returns whether the whole tree was walked.
+        """
+        use_checkpoint = self.checkpoint and not self.dry_run
+        deadline = None if max_seconds is None \
+            else time.monotonic() + max_seconds
+        batch = []
+        for name, entry in self.files():
+            batch.append((name, entry))
+            if len(batch) == self.batch_size:
+                self.collect(batch)
+                if use_checkpoint:
+                    self.save_checkpoint(name)
+                batch = []
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+        if batch:
+            self.collect(batch)
+        if use_checkpoint:
+            self.clear_checkpoint()
+        return True
+
+    def collect(self, batch):
+        """ Delete the unreferenced files of one batch. """
+        self.stats['scanned'] += len(batch)
+        cutoff = time.time() - self.grace_seconds
+        old = {}
+        for name, entry in batch:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime < cutoff:
+                old[name] = (entry.path, stat.st_size)
+        sources = {name: self.source(name) for name in old}
+        referenced = set(Recipe.objects.filter(
+            image__in=[source for source in sources.values() if source],
+        ).values_list('image', flat=True))
+        for name in sorted(old):
+            if sources[name] in referenced:
+                continue
+            self.stats['orphans'] += 1
+            path, size = old[name]
+            if self.dry_run:
+                self.stats['bytes'] += size
+            else:
+                self.delete(path, cutoff)
+        self.log(
+            f'Scanned {self.stats["scanned"]} files, '
+            f'{self.stats["orphans"]} orphans'
+        )
+
+    def source(self, name):
+        """ Return the image name keeping name alive, None for none. """
+        source = source_name(name)
+        if source is None:
+            return name
+        return source if is_current(name) else None
+
+    def delete(self, path, cutoff):
+        # Stat again, the file may have been reused since the batch began.
+        try:
+            stat = os.stat(path)
+            if stat.st_mtime >= cutoff:
+                return
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        self.stats['deleted'] += 1
+        self.stats['bytes'] += stat.st_size
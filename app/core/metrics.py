@@ -0,0 +1,92 @@
+"""
+Prometheus metrics for the API.
+
+Set PROMETHEUS_MULTIPROC_DIR to a directory shared by all workers to
+aggregate metrics across forked processes. The server has to call
+worker_exited() for every worker that exits, see gunicorn.conf.py.
+"""
+import os
+
+from prometheus_client import (  # type: ignore
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Request latency by view and action.',
+    ['view', 'method', 'status'],
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries',
+    'Database queries run per request.',
+    ['view', 'method'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float('inf')),
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes',
+    'Response body size.',
+    ['view', 'method'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, float('inf')),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight',
+    'Requests currently being processed.',
+    multiprocess_mode='livesum',
+)
+REQUEST_EXCEPTIONS = Counter(
+    'http_request_exceptions',
+    'Requests that raised an unhandled exception.',
+    ['view', 'method'],
+)
+COALESCED_REQUESTS = Counter(
+    'http_requests_coalesced',
+    'Requests that waited for an identical request in flight.',
+    ['outcome'],
+)
+DB_REPLICA_LAG = Gauge(
+    'db_replica_lag_seconds',
+    'Replication lag of each database replica at its last check.',
+    ['alias'],
+    multiprocess_mode='max',
+)
+IMAGE_PROCESSING = Histogram(
+    'recipe_image_processing_seconds',
+    'Time spent storing and processing uploaded recipe images.',
+)
+
+
+def view_label(request):
+    """ Return a label such as 'recipe-list' or 'user-token'. """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    if hasattr(match.func, 'actions'):
+        # Router url names already carry the basename and action.
+        return match.url_name
+
+    return '-'.join(filter(None, [match.namespace, match.url_name]))
+
+
+def render():
+    """ Return the exposition body for all registered metrics. """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def worker_exited(pid):
+    """ Drop the live gauges of an exited worker process. """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
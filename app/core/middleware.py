@@ -0,0 +1,407 @@
+"""
+Middleware for request performance instrumentation.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from core import media, metrics, views
+from core.models import RequestProfile
+from core.profiling import ProfilerBusy, RequestProfiler
+from core.slow_queries import SlowQueryRecorder
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """
+    Count SQL queries and time spent in the database for a request.
+
+    One instance per request is shared as request.query_stats by the
+    middlewares that need it, so there is at most one execute wrapper.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.view_start = None
+        self.view_db_time = 0.0
+        self.serialize_time = None
+        self.render_start = None
+        self.render_time = None
+
+    def __call__(self, execute, sql, params, many, context):
+        """ Execute wrapper installed on every database connection. """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.db_time += time.perf_counter() - start
+
+    def start_view(self):
+        self.view_start = time.perf_counter()
+        self.view_db_time = self.db_time
+
+    def end_view(self):
+        """ Time spent in the view that was not spent in the database. """
+        if self.view_start is None or self.serialize_time is not None:
+            return
+        elapsed = time.perf_counter() - self.view_start
+        db_time = self.db_time - self.view_db_time
+        self.serialize_time = max(elapsed - db_time, 0.0)
+
+    def start_render(self):
+        self.render_start = time.perf_counter()
+
+    def end_render(self, response):
+        self.render_time = time.perf_counter() - self.render_start
+        return response
+
+    def server_timing(self):
+        """ Return the value for the Server-Timing header. """
+        metrics = [
+            f'db;dur={self.db_time * 1000:.2f}',
+            f'db-queries;desc="{self.count}"',
+        ]
+        if self.serialize_time is not None:
+            metrics.append(f'serialize;dur={self.serialize_time * 1000:.2f}')
+        if self.render_time is not None:
+            metrics.append(f'render;dur={self.render_time * 1000:.2f}')
+
+        return ', '.join(metrics)
+
+
+@contextmanager
+def tracked_queries(request):
+    """
+    Yield the QueryStats of request, installing them if not done yet.
+
+    Only the outermost caller installs the execute wrapper.
+    """
+    stats = getattr(request, 'query_stats', None)
+    if stats is not None:
+        yield stats
+        return
+    stats = request.query_stats = QueryStats()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield stats
+
+
+class HealthCheckMiddleware:
+    """
+    Answer /healthz and /readyz before the rest of the stack runs.
+
+    Orchestrators probe by pod or container address, which is not in
+    ALLOWED_HOSTS, and probes should not show up in request metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.probes = {'/healthz': views.healthz, '/readyz': views.readyz}
+
+    def __call__(self, request):
+        probe = self.probes.get(request.path_info)
+        if probe is not None and request.method in ('GET', 'HEAD'):
+            return probe(request)
+        return self.get_response(request)
+
+
+class Flight:
+    """ A response being computed that identical requests wait for. """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.shared = None
+
+    def share(self, response):
+        """ Keep a copy of a complete 200 response without cookies. """
+        if response.status_code == 200 and not response.streaming \
+                and not response.cookies:
+            self.shared = (response.content, list(response.items()))
+
+    def response(self):
+        content, headers = self.shared
+        response = HttpResponse(content)
+        for header, value in headers:
+            response[header] = value
+        return response
+
+
+class CoalescingMiddleware:
+    """
+    Let identical GETs that run at the same time share one response.
+
+    Requests under COALESCE_PATHS match on host, path, sorted query,
+    Accept headers and credentials, so only requests of one client
+    coalesce. The first runs the view, the others wait up to
+    COALESCE_WAIT_SECONDS for it and get a copy of its response. When
+    the wait runs out, or the response is not a plain 200, they run the
+    view themselves. Flights are shared between the threads of one
+    process.
+
+    Followers return before DRF runs, so they are not charged against
+    the rate limits. Only the leader's request is, which is the one that
+    did the work, and followers carry the leader's credentials.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def __call__(self, request):
+        credentials = self.credentials(request)
+        if request.method != 'GET':
+            try:
+                return self.get_response(request)
+            finally:
+                if request.method not in ('HEAD', 'OPTIONS'):
+                    self.land(credentials)
+        if not request.path_info.startswith(tuple(settings.COALESCE_PATHS)):
+            return self.get_response(request)
+
+        key = (credentials, self.request_key(request))
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+
+        if not leader:
+            if flight.done.wait(settings.COALESCE_WAIT_SECONDS) \
+                    and flight.shared is not None:
+                metrics.COALESCED_REQUESTS.labels('shared').inc()
+                return flight.response()
+            metrics.COALESCED_REQUESTS.labels('ran').inc()
+            return self.get_response(request)
+
+        try:
+            response = self.get_response(request)
+            flight.share(response)
+            return response
+        finally:
+            with self.lock:
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+            flight.done.set()
+
+    def credentials(self, request):
+        return hashlib.sha256('\0'.join([
+            request.META.get('HTTP_AUTHORIZATION', ''),
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME, ''),
+        ]).encode()).hexdigest()
+
+    def request_key(self, request):
+        query = sorted(
+            (name, value)
+            for name, values in request.GET.lists() for value in values
+        )
+        return hashlib.sha256(repr((
+            request.META.get('HTTP_HOST', ''),
+            request.path_info,
+            query,
+            request.META.get('HTTP_ACCEPT', ''),
+            request.META.get('HTTP_ACCEPT_LANGUAGE', ''),
+            request.META.get('HTTP_X_PROFILE', ''),
+        )).encode()).hexdigest()
+
+    def land(self, credentials):
+        """
+        Stop new requests from joining flights of credentials.
+
+        Those flights may have read data from before a write of the same
+        client, which its next requests must see.
+        """
+        with self.lock:
+            for key in [key for key in self.flights if key[0] == credentials]:
+                del self.flights[key]
+
+
+class QueryTimingMiddleware:
+    """
+    Add a Server-Timing header with SQL, serialize and render costs.
+
+    Controlled by the QUERY_TIMING_ENABLED setting, which is read on every
+    request so it can be switched without touching the middleware stack.
+    Requests running more than QUERY_BUDGET queries are logged. The query
+    stats are shared with MetricsMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_TIMING_ENABLED:
+            return self.get_response(request)
+
+        with tracked_queries(request) as stats:
+            response = self.get_response(request)
+
+        stats.end_view()
+        response['Server-Timing'] = stats.server_timing()
+
+        if stats.count > settings.QUERY_BUDGET:
+            logger.warning(
+                'Query budget exceeded: %s %s ran %d queries (budget %d) '
+                'in %.2f ms',
+                request.method,
+                request.path,
+                stats.count,
+                settings.QUERY_BUDGET,
+                stats.db_time * 1000,
+            )
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = getattr(request, 'query_stats', None)
+        if stats is not None and settings.QUERY_TIMING_ENABLED:
+            stats.start_view()
+
+    def process_template_response(self, request, response):
+        stats = getattr(request, 'query_stats', None)
+        if stats is not None and settings.QUERY_TIMING_ENABLED:
+            stats.end_view()
+            stats.start_render()
+            response.add_post_render_callback(stats.end_render)
+
+        return response
+
+
+class SlowQueryMiddleware:
+    """
+    Record queries slower than SLOW_QUERY_THRESHOLD_MS to SLOW_QUERY_LOG.
+
+    A threshold of 0 disables recording. When SLOW_QUERY_EXPLAIN is set
+    the plan of slow SELECTs is captured as well.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SLOW_QUERY_THRESHOLD_MS:
+            return self.get_response(request)
+
+        recorder = SlowQueryRecorder(
+            settings.SLOW_QUERY_THRESHOLD_MS,
+            explain=settings.SLOW_QUERY_EXPLAIN,
+            request=request,
+        )
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            return self.get_response(request)
+
+
+class MetricsMiddleware:
+    """
+    Record Prometheus request metrics for every request.
+
+    Queries are only counted with METRICS_QUERY_COUNTS set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = None
+        start = time.perf_counter()
+        metrics.REQUESTS_IN_FLIGHT.inc()
+        try:
+            if settings.METRICS_QUERY_COUNTS:
+                with tracked_queries(request) as stats:
+                    response = self.get_response(request)
+            else:
+                response = self.get_response(request)
+        finally:
+            metrics.REQUESTS_IN_FLIGHT.dec()
+
+        view = metrics.view_label(request)
+        metrics.REQUEST_LATENCY.labels(
+            view, request.method, response.status_code,
+        ).observe(time.perf_counter() - start)
+        if stats is not None:
+            metrics.REQUEST_DB_QUERIES.labels(view, request.method).observe(
+                stats.count
+            )
+        if not response.streaming:
+            metrics.RESPONSE_SIZE.labels(view, request.method).observe(
+                len(response.content)
+            )
+
+        return response
+
+    def process_exception(self, request, exception):
+        metrics.REQUEST_EXCEPTIONS.labels(
+            metrics.view_label(request), request.method,
+        ).inc()
+
+
+class ProfilingMiddleware:
+    """
+    Profile a request when a staff user asks for it.
+
+    Send the 'X-Profile: 1' header or the 'profile=1' query parameter.
+    Folded stacks and the top allocation sites are written to PROFILE_DIR
+    and listed in the admin. While another request of the process is
+    profiled the request runs unprofiled with 'X-Profile-Skipped: busy'.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.is_requested(request):
+            return self.get_response(request)
+        user = self.get_user(request)
+        if not user.is_staff:
+            return self.get_response(request)
+
+        try:
+            with RequestProfiler() as profile:
+                response = self.get_response(request)
+        except ProfilerBusy:
+            # Raised on entering, before the view ran.
+            response = self.get_response(request)
+            response['X-Profile-Skipped'] = 'busy'
+            return response
+
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        folded_path, allocations_path = profile.save(name)
+        record = RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path(),
+            status_code=response.status_code,
+            duration_ms=profile.duration * 1000,
+            samples=sum(profile.profiler.samples.values()),
+            peak_memory=profile.peak_memory,
+            folded_stacks_file=folded_path,
+            allocations_file=allocations_path,
+            top_allocations=profile.allocations_text(),
+        )
+        response['X-Profile-Id'] = str(record.id)
+
+        return response
+
+    def is_requested(self, request):
+        return (
+            request.META.get('HTTP_X_PROFILE') == '1'
+            or request.GET.get('profile') == '1'
+        )
+
+    def get_user(self, request):
+        """ Return the session user, or the token user for API calls. """
+        return media.request_user(request)
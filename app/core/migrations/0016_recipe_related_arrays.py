@@ -0,0 +1,88 @@
+# Generated by Django 4.0.10 on 2026-10-19 10:13
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+BACKFILL_BATCH_SIZE = 5000
+
+BACKFILL_SQL = """
+UPDATE core_recipe AS recipe SET
+    tag_ids = ARRAY(
+        SELECT tag_id FROM core_recipe_tags
+        WHERE recipe_id = recipe.id ORDER BY tag_id
+    ),
+    tag_names = ARRAY(
+        SELECT tag.name FROM core_recipe_tags AS rt
+        JOIN core_tag AS tag ON tag.id = rt.tag_id
+        WHERE rt.recipe_id = recipe.id ORDER BY rt.tag_id
+    ),
+    ingredient_ids = ARRAY(
+        SELECT ingredient_id FROM core_recipe_ingredients
+        WHERE recipe_id = recipe.id ORDER BY ingredient_id
+    ),
+    ingredient_names = ARRAY(
+        SELECT ingredient.name FROM core_recipe_ingredients AS ri
+        JOIN core_ingredient AS ingredient ON ingredient.id = ri.ingredient_id
+        WHERE ri.recipe_id = recipe.id ORDER BY ri.ingredient_id
+    )
+WHERE recipe.id > %s AND recipe.id <= %s
+"""
+
+
+def backfill(apps, schema_editor):
+    """ Fill the arrays a primary key range per transaction. """
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT coalesce(max(id), 0) FROM core_recipe')
+        last_id = cursor.fetchone()[0]
+        for start in range(0, last_id, BACKFILL_BATCH_SIZE):
+            # The migration isn't atomic, every batch commits by itself.
+            cursor.execute(
+                BACKFILL_SQL, [start, start + BACKFILL_BATCH_SIZE],
+            )
+
+
+class Migration(migrations.Migration):
+    # The backfill commits per batch and the indexes are built
+    # concurrently, so the recipe table stays writable.
+    atomic = False
+
+    dependencies = [
+        ('core', '0015_user_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_names',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_names',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), blank=True, default=list, editable=False, size=None),
+        ),
+        # Filled before indexing, so the batches don't update the indexes.
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tag_ids'], name='recipe_tag_ids_gin'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ingredient_ids'], name='recipe_ingredient_ids_gin'),
+        ),
+    ]
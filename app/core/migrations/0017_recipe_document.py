@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-19 10:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_recipe_related_arrays'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='document',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.10 on 2026-10-19 10:13
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_admin_prefix_search_indexes'),
+    ]
+
+    # The child tables only hold a pointer to their parent row, so
+    # dropping them leaves every recipe, tag and ingredient in place.
+    operations = [
+        migrations.RemoveField(
+            model_name='recipeadmin',
+            name='recipe_ptr',
+        ),
+        migrations.RemoveField(
+            model_name='tagadmin',
+            name='tag_ptr',
+        ),
+        migrations.DeleteModel(
+            name='IngredientAdmin',
+        ),
+        migrations.DeleteModel(
+            name='RecipeAdmin',
+        ),
+        migrations.DeleteModel(
+            name='TagAdmin',
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.0.10 on 2026-10-19 10:13
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Building the index concurrently keeps the table writable.
+    atomic = False
+
+    dependencies = [
+        ('core', '0001_squashed_0019_delete_admin_child_models'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['image'], name='recipe_image_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Partitions the recipe tables when RECIPE_HASH_PARTITIONS is set.
+
+from django.conf import settings
+from django.db import migrations
+
+from core.partitioning import partition_count, repartition
+
+
+def partition_recipes(apps, schema_editor):
+    if settings.RECIPE_HASH_PARTITIONS:
+        repartition(
+            schema_editor.connection,
+            apps.get_model('core', 'Recipe'),
+            settings.RECIPE_HASH_PARTITIONS,
+        )
+
+
+def unpartition_recipes(apps, schema_editor):
+    Recipe = apps.get_model('core', 'Recipe')
+    with schema_editor.connection.cursor() as cursor:
+        partitioned = partition_count(cursor, Recipe._meta.db_table)
+    if partitioned:
+        repartition(schema_editor.connection, Recipe, 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_recipe_image_metadata'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_recipes, unpartition_recipes),
+    ]
@@ -5,19 +5,35 @@ import uuid
 import os
 
 from django.conf import settings
+from django.contrib.postgres.expressions import ArraySubquery
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models import OuterRef
+from django.db.models.functions import Upper
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 
+from core.storage import recipe_image_storage
+
+
+RECIPE_IMAGE_DIR = os.path.join('uploads', 'recipe')
+
+
 def recipe_image_file_path(instance, filename):
-    """ Generate file path for new recipe image. """
+    """
+    Generate file path for new recipe image.
+
+    Content addressed storages keep the directory and extension and
+    replace the file name with the hash of the content.
+    """
     ext = os.path.splitext(filename)[1]
     filename = f'{uuid.uuid4()}{ext}'
     
-    return os.path.join('uploads', 'recipe', filename)
+    return os.path.join(RECIPE_IMAGE_DIR, filename)
 
 
 # Create your models here
@@ -57,9 +73,41 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """ Queryset for recipes. """
+
+    def refresh_related_arrays(self, *fields):
+        """
+        Copy tag and ingredient ids and names onto the matched recipes.
+
+        fields defaults to both 'tags' and 'ingredients'. Ids and names
+        are ordered by id, so tag_ids[i] is the id of tag_names[i].
+        """
+        values = {}
+        for field in fields or ('tags', 'ingredients'):
+            related = field[:-1]
+            rows = getattr(self.model, field).through.objects.filter(
+                recipe_id=OuterRef('pk'),
+            ).order_by(f'{related}_id')
+            values[f'{related}_ids'] = ArraySubquery(
+                rows.values(f'{related}_id'),
+            )
+            values[f'{related}_names'] = ArraySubquery(
+                rows.values(f'{related}__name'),
+            )
+        return self.update(**values)
+
+
 class Recipe(models.Model):
     """ Recipe object. """
 
+    # Copies of the tags and ingredients relations and of the detail
+    # payload, kept in sync by the handlers in core.signals.
+    ARRAY_FIELDS = (
+        'tag_ids', 'tag_names', 'ingredient_ids', 'ingredient_names',
+    )
+    DENORMALIZED_FIELDS = ARRAY_FIELDS + ('document',)
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete= models.CASCADE,
@@ -72,11 +120,83 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
-    image = models.ImageField(null = True, upload_to=recipe_image_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=recipe_image_storage,
+    )
+    # Read from the image when it is stored, see core.images.
+    image_width = models.PositiveIntegerField(null=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, editable=False)
+    image_size = models.PositiveBigIntegerField(null=True, editable=False)
+    image_format = models.CharField(max_length=10, blank=True, editable=False)
+    image_placeholder = models.CharField(
+        max_length=64, blank=True, editable=False,
+    )
+    tag_ids = ArrayField(
+        models.BigIntegerField(), default=list, blank=True, editable=False,
+    )
+    tag_names = ArrayField(
+        models.CharField(max_length=255),
+        default=list,
+        blank=True,
+        editable=False,
+    )
+    ingredient_ids = ArrayField(
+        models.BigIntegerField(), default=list, blank=True, editable=False,
+    )
+    ingredient_names = ArrayField(
+        models.CharField(max_length=255),
+        default=list,
+        blank=True,
+        editable=False,
+    )
+
+    document = models.JSONField(default=dict, blank=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
+    class Meta:
+        indexes = [
+            # Serves the per user listing ordered by -id without a sort.
+            models.Index(fields=['user', 'id'], name='recipe_user_id_idx'),
+            GinIndex(fields=['tag_ids'], name='recipe_tag_ids_gin'),
+            GinIndex(
+                fields=['ingredient_ids'], name='recipe_ingredient_ids_gin',
+            ),
+            # Serves the case insensitive prefix search of the admin.
+            models.Index(
+                OpClass(Upper('title'), name='text_pattern_ops'),
+                name='recipe_title_prefix_idx',
+            ),
+            # Serves the ownership check of the media view.
+            models.Index(fields=['image'], name='recipe_image_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored image so a replaced one can be released.
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Never write the denormalized fields back from memory.
+
+        They are only changed by their refresh functions, and an instance
+        loaded before a concurrent tag change would otherwise undo it.
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DENORMALIZED_FIELDS
+            ]
+        super().save(*args, **kwargs)
     
 
 class Tag(models.Model):
@@ -88,6 +208,15 @@ class Tag(models.Model):
 
     name = models.CharField(max_length=255)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'name'], name='tag_user_name_idx'),
+            models.Index(
+                OpClass(Upper('name'), name='text_pattern_ops'),
+                name='tag_name_prefix_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.name
     
@@ -101,10 +230,79 @@ class Ingredient(models.Model):
 
     name = models.CharField(max_length=255)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'name'], name='ingredient_user_name_idx',
+            ),
+            models.Index(
+                OpClass(Upper('name'), name='text_pattern_ops'),
+                name='ingredient_name_prefix_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.name
     
 
 
+class RequestProfile(models.Model):
+    """ Profile captured for a single request. """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2048)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    samples = models.PositiveIntegerField()
+    peak_memory = models.PositiveBigIntegerField()
+    folded_stacks_file = models.CharField(max_length=1024)
+    allocations_file = models.CharField(max_length=1024)
+    top_allocations = models.TextField(blank=True)
 
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return f'{self.method} {self.path}'
+
+
+
+class UserPurge(models.Model):
+    """ Deletion of a deactivated user and their data in batches. """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    email = models.EmailField(max_length=255)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    recipes_deleted = models.PositiveBigIntegerField(default=0)
+    tags_deleted = models.PositiveBigIntegerField(default=0)
+    ingredients_deleted = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['created'],
+                name='userpurge_pending_idx',
+                condition=models.Q(finished__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return self.email
 
+    @property
+    def status(self):
+        if self.finished:
+            return 'done'
+        return 'running' if self.started else 'pending'
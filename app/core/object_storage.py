@@ -0,0 +1,156 @@
+"""
+S3 compatible object storage for recipe images.
+
+Select it with RECIPE_IMAGE_STORAGE set to
+'core.object_storage.ContentAddressedS3Storage'. Objects get the content
+addressed names of core.storage, so every image is stored once in the
+bucket. Clients may PUT images straight to the bucket with a presigned
+URL and only confirm the key with the app. Links point at the media
+view, which checks ownership and redirects to a short lived presigned
+GET, so no app worker carries image bytes either way.
+"""
+import base64
+import hashlib
+import os
+import posixpath
+from urllib.parse import urljoin
+
+from botocore.exceptions import ClientError  # type: ignore
+from storages.backends.s3 import S3Storage  # type: ignore
+from storages.utils import clean_name  # type: ignore
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
+from django.utils.functional import cached_property
+
+from core.storage import content_name
+
+
+def is_not_found(error):
+    return error.response['ResponseMetadata']['HTTPStatusCode'] == 404
+
+
+class ContentAddressedS3Storage(S3Storage):
+    """ S3 storage that stores each distinct content once. """
+
+    supports_direct_upload = True
+
+    def _save(self, name, content):
+        directory, filename = posixpath.split(clean_name(name))
+        ext = os.path.splitext(filename)[1].lower()
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        name = content_name(directory, digest.hexdigest(), ext)
+        if self.touch(name):
+            return name
+        return super()._save(name, content)
+
+    def save_named(self, name, content):
+        """ Store content under exactly name, replacing any object. """
+        return super()._save(name, content)
+
+    def reset_connections(self):
+        """ Forget the clients, e.g. in a forked process. """
+        self.__setstate__(self.__getstate__())
+        self.__dict__.pop('presign_client', None)
+
+    def key(self, name):
+        return self._normalize_name(clean_name(name))
+
+    def head(self, name):
+        """ Return the HEAD response of name, or None if it is missing. """
+        try:
+            return self.connection.meta.client.head_object(
+                Bucket=self.bucket_name,
+                Key=self.key(name),
+                ChecksumMode='ENABLED',
+            )
+        except ClientError as error:
+            if is_not_found(error):
+                return None
+            raise
+
+    def touch(self, name):
+        """
+        Mark an existing object as just used and return whether it exists.
+
+        S3 has no utime, copying an object onto itself with replaced
+        metadata is what refreshes LastModified.
+        """
+        head = self.head(name)
+        if head is None:
+            return False
+        key = self.key(name)
+        self.connection.meta.client.copy_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            CopySource={'Bucket': self.bucket_name, 'Key': key},
+            MetadataDirective='REPLACE',
+            ContentType=head.get('ContentType', ''),
+            Metadata=head.get('Metadata', {}),
+        )
+        return True
+
+    def release(self, name, grace_seconds=None):
+        """ Delete name unless it was stored or reused recently. """
+        if grace_seconds is None:
+            grace_seconds = settings.MEDIA_RELEASE_GRACE_SECONDS
+        head = self.head(name)
+        if head is None:
+            return False
+        age = timezone.now() - head['LastModified']
+        if age.total_seconds() < grace_seconds:
+            return False
+        self.delete(name)
+        return True
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        """ Link to the media view, which checks access and redirects. """
+        return urljoin(settings.MEDIA_URL, filepath_to_uri(clean_name(name)))
+
+    @cached_property
+    def presign_client(self):
+        """ Client signing URLs for the endpoint browsers can reach. """
+        return self._create_session().client(
+            's3',
+            region_name=self.region_name,
+            endpoint_url=settings.S3_PUBLIC_ENDPOINT_URL or self.endpoint_url,
+            config=self.client_config,
+        )
+
+    def download_url(self, name):
+        """ Return a short lived URL to GET name from the bucket. """
+        return self.presign_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket_name, 'Key': self.key(name)},
+            ExpiresIn=self.querystring_expire,
+        )
+
+    def upload_url(self, name, digest, content_type):
+        """
+        Return the URL and headers to PUT the content with digest to name.
+
+        The SHA-256 checksum header is part of the signature, so the
+        bucket refuses any other body.
+        """
+        checksum = base64.b64encode(bytes.fromhex(digest)).decode()
+        url = self.presign_client.generate_presigned_url(
+            'put_object',
+            Params={
+                'Bucket': self.bucket_name,
+                'Key': self.key(name),
+                'ContentType': content_type,
+                'ChecksumSHA256': checksum,
+            },
+            ExpiresIn=self.querystring_expire,
+        )
+        return {
+            'url': url,
+            'method': 'PUT',
+            'headers': {
+                'Content-Type': content_type,
+                'x-amz-checksum-sha256': checksum,
+            },
+        }
@@ -0,0 +1,185 @@
+"""
+Hash partitioning of the recipe tables.
+
+With RECIPE_HASH_PARTITIONS set, core_recipe is partitioned by
+HASH(user_id). Every recipe query of the API filters by user, so
+PostgreSQL reads a single partition. Each partition gets its own small
+indexes, and it is vacuumed and analyzed separately.
+
+The tag and ingredient tables of Recipe are created by Django and have
+no user column. They are partitioned by HASH(recipe_id), so reading and
+changing the relations of a recipe prunes to one partition. Lookups by
+tag or ingredient don't: the assigned_only filter of the tag and
+ingredient lists, clearing the recipes of a tag in core.signals and the
+cascade when a tag or ingredient is deleted read every partition,
+through the tag_id or ingredient_id index each partition keeps. A
+partitioned table can only be referenced by a key that includes its
+partition key, so their foreign keys to core_recipe are dropped while
+partitioned. Django deletes the related rows itself before deleting a
+recipe.
+
+PostgreSQL keeps no row estimate for a partitioned table itself, only
+for its partitions, see EstimatedCountPaginator in core.admin.
+
+The primary keys become (id, partition key). The ORM keeps id as the
+primary key, which stays unique because it comes from one sequence.
+Rebuilding copies every row under an exclusive lock, so run it in a
+maintenance window.
+"""
+from django.db import transaction
+
+
+def recipe_tables(recipe_model):
+    """
+    Return (table, partition key) of the partitioned tables.
+
+    Tables referencing core_recipe come first.
+    """
+    return [
+        (recipe_model.tags.through._meta.db_table, 'recipe_id'),
+        (recipe_model.ingredients.through._meta.db_table, 'recipe_id'),
+        (recipe_model._meta.db_table, 'user_id'),
+    ]
+
+
+def partition_count(cursor, table):
+    """ Return the number of partitions of table, 0 if it has none. """
+    cursor.execute(
+        'SELECT c.relkind, (SELECT count(*) FROM pg_inherits i '
+        'WHERE i.inhparent = c.oid) FROM pg_class c '
+        'WHERE c.oid = %s::regclass',
+        [table],
+    )
+    kind, count = cursor.fetchone()
+    return count if kind == 'p' else 0
+
+
+def partitions(cursor, table):
+    """ Return the partitions of table, or table when it has none. """
+    cursor.execute(
+        'SELECT c.relname FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = %s::regclass ORDER BY c.oid',
+        [table],
+    )
+    return [name for name, in cursor.fetchall()] or [table]
+
+
+def repartition(connection, recipe_model, count):
+    """ Rebuild the recipe tables with count hash partitions, or none. """
+    tables = recipe_tables(recipe_model)
+    recipe_table = recipe_model._meta.db_table
+    quote = connection.ops.quote_name
+    with transaction.atomic(using=connection.alias), \
+            connection.cursor() as cursor:
+        # Deferred checks of earlier writes would block ALTER TABLE.
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(
+            'SELECT conrelid::regclass::text, conname FROM pg_constraint '
+            "WHERE contype = 'f' AND confrelid = %s::regclass",
+            [recipe_table],
+        )
+        for table, name in cursor.fetchall():
+            cursor.execute(
+                f'ALTER TABLE {table} DROP CONSTRAINT {quote(name)}'
+            )
+
+        for table, key in tables:
+            rebuild(cursor, quote, table, key, count)
+
+        if not count:
+            for table, key in tables:
+                if table == recipe_table:
+                    continue
+                cursor.execute(
+                    f'ALTER TABLE {quote(table)} ADD CONSTRAINT '
+                    f'{quote(table + "_recipe_id_fk")} FOREIGN KEY '
+                    f'({quote(key)}) REFERENCES {quote(recipe_table)} (id) '
+                    'DEFERRABLE INITIALLY DEFERRED'
+                )
+
+
+def rebuild(cursor, quote, table, key, count):
+    """ Copy table into a new table with count partitions by key. """
+    old = f'{table}_old'
+
+    # Identity columns can't be partitioned before PostgreSQL 17, give
+    # id a plain sequence that continues where the identity stopped.
+    cursor.execute(
+        "SELECT pg_get_serial_sequence(%s, 'id'), attidentity "
+        'FROM pg_attribute WHERE attrelid = %s::regclass '
+        "AND attname = 'id'",
+        [table, table],
+    )
+    sequence, identity = cursor.fetchone()
+    if identity:
+        cursor.execute(f'SELECT last_value, is_called FROM {sequence}')
+        last_value, is_called = cursor.fetchone()
+        cursor.execute(
+            f'ALTER TABLE {quote(table)} ALTER id DROP IDENTITY'
+        )
+        cursor.execute(f'CREATE SEQUENCE {sequence}')
+        cursor.execute(
+            'SELECT setval(%s, %s, %s)', [sequence, last_value, is_called],
+        )
+
+    # Index names are global, so they are created once the old table
+    # is gone. Partitioned indexes are defined ON ONLY the parent.
+    cursor.execute(
+        'SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i '
+        'WHERE i.indrelid = %s::regclass AND NOT i.indisprimary '
+        'AND NOT EXISTS (SELECT 1 FROM pg_constraint c '
+        'WHERE c.conrelid = i.indrelid AND c.conindid = i.indexrelid)',
+        [table],
+    )
+    indexes = [
+        definition.replace(' ON ONLY ', ' ON ', 1)
+        for definition, in cursor.fetchall()
+    ]
+    cursor.execute(
+        'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+        "WHERE conrelid = %s::regclass AND contype IN ('u', 'f')",
+        [table],
+    )
+    constraints = cursor.fetchall()
+
+    old_partitions = partitions(cursor, table)
+    cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old)}')
+    for name in old_partitions:
+        if name != table:
+            cursor.execute(
+                f'ALTER TABLE {quote(name)} RENAME TO '
+                f'{quote(name.replace(table, old, 1))}'
+            )
+
+    partition_by = f' PARTITION BY HASH ({quote(key)})' if count else ''
+    cursor.execute(
+        f'CREATE TABLE {quote(table)} (LIKE {quote(old)} INCLUDING DEFAULTS '
+        f'INCLUDING CONSTRAINTS INCLUDING STORAGE){partition_by}'
+    )
+    cursor.execute(
+        f'ALTER TABLE {quote(table)} ALTER id '
+        f"SET DEFAULT nextval('{sequence}'::regclass)"
+    )
+    for remainder in range(count):
+        cursor.execute(
+            f'CREATE TABLE {quote(f"{table}_p{remainder}")} PARTITION OF '
+            f'{quote(table)} FOR VALUES WITH '
+            f'(MODULUS {count}, REMAINDER {remainder})'
+        )
+    cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(old)}')
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.id')
+    cursor.execute(f'DROP TABLE {quote(old)}')
+
+    primary_key = f'id, {quote(key)}' if count else 'id'
+    cursor.execute(
+        f'ALTER TABLE {quote(table)} ADD PRIMARY KEY ({primary_key})'
+    )
+    for definition in indexes:
+        cursor.execute(definition)
+    for name, definition in constraints:
+        cursor.execute(
+            f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} '
+            f'{definition}'
+        )
+    cursor.execute(f'ANALYZE {quote(table)}')
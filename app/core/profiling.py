@@ -0,0 +1,141 @@
+"""
+On demand request profiling.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from django.conf import settings
+
+
+# tracemalloc is global to the process, so one request is profiled at a
+# time. Another starting or stopping it would corrupt the first profile.
+lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """ Another request of the process is being profiled. """
+
+
+class SamplingProfiler:
+    """
+    Sample the stack of the calling thread at a fixed interval.
+
+    Samples are aggregated as folded stacks, the input format of
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = Counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self.samples[self._fold(frame)] += 1
+
+    def _fold(self, frame):
+        base_dir = str(settings.BASE_DIR)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            filename = code.co_filename
+            if filename.startswith(base_dir):
+                filename = os.path.relpath(filename, base_dir)
+            stack.append(f'{code.co_name} ({filename}:{frame.f_lineno})')
+            frame = frame.f_back
+
+        return ';'.join(reversed(stack))
+
+    def folded(self):
+        return ''.join(
+            f'{stack} {count}\n' for stack, count in self.samples.items()
+        )
+
+
+class RequestProfiler:
+    """
+    Run a request under the sampling profiler and tracemalloc.
+
+    Entering raises ProfilerBusy while another profile is running.
+    """
+
+    def __init__(self):
+        self.profiler = SamplingProfiler(
+            settings.PROFILE_SAMPLE_INTERVAL_MS / 1000
+        )
+        self.started_tracemalloc = False
+        self.duration = None
+        self.allocations = []
+        self.peak_memory = None
+
+    def __enter__(self):
+        if not lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                self.started_tracemalloc = True
+            tracemalloc.reset_peak()
+            self._start = time.perf_counter()
+            self.profiler.start()
+        except BaseException:
+            self.stop_tracing()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self.profiler.stop()
+            self.duration = time.perf_counter() - self._start
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ])
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            self.stop_tracing()
+
+        statistics = snapshot.statistics('lineno')
+        self.allocations = statistics[:settings.PROFILE_TOP_ALLOCATIONS]
+
+    def stop_tracing(self):
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+        lock.release()
+
+    def save(self, name):
+        """ Write the folded stacks and allocation sites to PROFILE_DIR. """
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        folded_path = os.path.join(settings.PROFILE_DIR, f'{name}.folded')
+        with open(folded_path, 'w') as folded_file:
+            folded_file.write(self.profiler.folded())
+
+        allocations_path = os.path.join(
+            settings.PROFILE_DIR, f'{name}.alloc.txt'
+        )
+        with open(allocations_path, 'w') as allocations_file:
+            allocations_file.write(self.allocations_text())
+
+        return folded_path, allocations_path
+
+    def allocations_text(self):
+        return ''.join(f'{stat}\n' for stat in self.allocations)
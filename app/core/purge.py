@@ -0,0 +1,144 @@
+"""
+Deletion of users with large collections.
+
+Deleting a user through Django cascades into every recipe, tag and
+ingredient in memory and in one transaction. Instead request_purge()
+deactivates the user at once, revokes their tokens, releases their
+email for a new signup and queues a UserPurge. purge_users then deletes
+the owned rows a batch per transaction, recipes first as they refer to
+the tags and ingredients, and deletes the user once nothing is left.
+Progress is stored on the UserPurge after every batch, so an
+interrupted run loses nothing. The purge-worker service of
+docker-compose runs purge_users over and over.
+"""
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token  # type: ignore
+
+from core.models import Ingredient, Recipe, Tag, UserPurge
+from core.signals import renames_unsynced
+
+
+logger = logging.getLogger(__name__)
+
+STEPS = (
+    (Recipe, 'recipes_deleted'),
+    (Tag, 'tags_deleted'),
+    (Ingredient, 'ingredients_deleted'),
+)
+
+
+def released_email(user):
+    """ Return the placeholder email of a user queued for deletion. """
+    return f'deleted-{user.pk}@purged.invalid'
+
+
+def request_purge(user):
+    """ Deactivate user now and queue the deletion of their data. """
+    with transaction.atomic():
+        purge = UserPurge.objects.filter(
+            user=user, finished__isnull=True,
+        ).first()
+        if purge is None:
+            purge = UserPurge.objects.create(user=user, email=user.email)
+        user.is_active = False
+        user.email = released_email(user)
+        user.save(update_fields=['is_active', 'email'])
+        Token.objects.filter(user=user).delete()
+    return purge
+
+
+class UserPurger:
+    """ Delete the data of queued users in batches. """
+
+    def __init__(self, batch_size=500, stdout=None):
+        self.batch_size = batch_size
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def run(self, max_seconds=None):
+        """
+        Purge queued users until none is left or max_seconds have passed.
+
+        Returns whether the queue was emptied. A user that fails is
+        recorded on its UserPurge and retried by the next run.
+        """
+        deadline = None if max_seconds is None \
+            else time.monotonic() + max_seconds
+        complete = True
+        pending = UserPurge.objects.filter(
+            finished__isnull=True,
+        ).order_by('created')
+        for purge in pending:
+            try:
+                if not self.purge(purge, deadline):
+                    return False
+            except Exception as error:
+                logger.exception('Purging %s failed', purge.email)
+                UserPurge.objects.filter(pk=purge.pk).update(error=str(error))
+                complete = False
+        return complete
+
+    def purge(self, purge, deadline=None):
+        """ Delete the data of one user, returns whether it finished. """
+        if purge.started is None:
+            purge.started = timezone.now()
+            UserPurge.objects.filter(pk=purge.pk).update(
+                started=purge.started,
+            )
+        if purge.user_id is not None:
+            for model, counter in STEPS:
+                while self.delete_batch(purge, model, counter):
+                    if deadline is not None and time.monotonic() >= deadline:
+                        return False
+            with transaction.atomic():
+                purge.user.delete()
+
+        purge.finished = timezone.now()
+        UserPurge.objects.filter(pk=purge.pk).update(
+            finished=purge.finished, error='',
+        )
+        self.log(
+            f'Purged {purge.email}: {purge.recipes_deleted} recipes, '
+            f'{purge.tags_deleted} tags, '
+            f'{purge.ingredients_deleted} ingredients'
+        )
+        return True
+
+    def delete_batch(self, purge, model, counter):
+        """ Delete a batch of model rows of the user, returns the count. """
+        with transaction.atomic():
+            ids = list(
+                model.objects.filter(user_id=purge.user_id)
+                .order_by('pk').values_list('pk', flat=True)
+                [:self.batch_size]
+            )
+            if not ids:
+                return 0
+            if model is Recipe:
+                # Clear the relations up front, the collector would load
+                # every row to send signals nobody listens to.
+                Recipe.tags.through.objects.filter(recipe_id__in=ids).delete()
+                Recipe.ingredients.through.objects.filter(
+                    recipe_id__in=ids,
+                ).delete()
+            # Tags and ingredients go after all recipes of the user, so
+            # no recipe is left to refresh for them.
+            with renames_unsynced():
+                model.objects.filter(
+                    pk__in=ids, user_id=purge.user_id,
+                ).delete()
+            UserPurge.objects.filter(pk=purge.pk).update(
+                **{counter: F(counter) + len(ids)},
+            )
+        setattr(purge, counter, getattr(purge, counter) + len(ids))
+        self.log(f'{purge.email}: {getattr(purge, counter)} {counter}')
+        return len(ids)
@@ -0,0 +1,256 @@
+"""
+Synthetic data generation for performance work.
+
+Data is skewed the way real usage is: a handful of power users own a
+large share of the recipes and tag and ingredient names follow a Zipf
+distribution. Everything is drawn from one random.Random(seed), so the
+same options always produce the same data.
+"""
+import io
+import random
+from decimal import Decimal
+from itertools import accumulate
+from types import SimpleNamespace
+
+from PIL import Image
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+from core.images import image_metadata
+from core.models import Recipe, Tag, Ingredient, User
+from recipe.documents import refresh_documents
+
+
+WORDS = (
+    'fresh', 'spicy', 'roasted', 'garlic', 'lemon', 'crispy', 'slow',
+    'cooked', 'tomato', 'basil', 'creamy', 'chicken', 'smoky', 'sweet',
+    'pepper', 'butter', 'herb', 'grilled', 'honey', 'ginger', 'rice',
+    'bean', 'stew', 'salad', 'noodle', 'bake', 'soup', 'curry', 'quick',
+)
+
+
+DEFAULTS = {
+    'users': 100,
+    'recipes': 10000,
+    'tags': 200,
+    'ingredients': 500,
+    'images': 0,
+    'power_users': 5,
+    'power_share': 0.5,
+    'zipf': 1.1,
+    'tags_per_recipe': 3,
+    'ingredients_per_recipe': 6,
+    'password': 'password123',
+    'email_prefix': 'seed',
+    'seed': 0,
+    'batch_size': 5000,
+}
+
+
+def zipf_cum_weights(count, exponent):
+    """ Cumulative weights for ranks 1..count of a Zipf distribution. """
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, count + 1)))
+
+
+def pick_distinct(rng, cum_weights, k):
+    """ Draw up to k distinct ranks, popular ranks being more likely. """
+    k = min(k, len(cum_weights))
+    picked = {}
+    while len(picked) < k:
+        for rank in rng.choices(range(len(cum_weights)),
+                                cum_weights=cum_weights, k=k):
+            picked.setdefault(rank, None)
+    return list(picked)[:k]
+
+
+def recipe_owners(rng, users, options):
+    """ Return the owner of every recipe in a shuffled order. """
+    power = users[:options.power_users]
+    rest = users[options.power_users:] or power
+    power_recipes = round(options.recipes * options.power_share) \
+        if power else 0
+
+    owners = [power[i % len(power)] for i in range(power_recipes)]
+    owners += rng.choices(rest, k=options.recipes - power_recipes)
+    rng.shuffle(owners)
+    return owners
+
+
+def image_bytes(rng, size=64):
+    """ Return a small JPEG with a random colour gradient. """
+    base = [rng.randrange(256) for _ in range(3)]
+    image = Image.linear_gradient('L').resize((size, size)).convert('RGB')
+    image = Image.blend(image, Image.new('RGB', (size, size), tuple(base)),
+                        0.6)
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=80)
+    return output.getvalue()
+
+
+def copy_rows(table, columns, rows):
+    """
+    Load integer rows with COPY.
+
+    Through rows are the bulk of the data, and COPY skips building a
+    model instance and an INSERT parameter for every one of them.
+    """
+    data = io.StringIO(''.join(
+        '\t'.join(map(str, row)) + '\n' for row in rows
+    ))
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {connection.ops.quote_name(table)} '
+            f'({", ".join(columns)}) FROM STDIN',
+            data,
+        )
+
+
+def analyze(*models):
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(
+                f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}'
+            )
+
+
+class Seeder:
+    """ Bulk insert a synthetic dataset. """
+
+    def __init__(self, stdout=None, **options):
+        self.options = SimpleNamespace(**{**DEFAULTS, **options})
+        self.stdout = stdout
+        self.rng = random.Random(self.options.seed)
+        self.counts = {}
+        self.named_ids = {Tag: {}, Ingredient: {}}
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def run(self):
+        with transaction.atomic():
+            users = self.create_users()
+            owners = recipe_owners(self.rng, users, self.options)
+            self.create_recipes(owners)
+        return self.counts
+
+    def create_users(self):
+        options = self.options
+        # Hashing is deliberately slow, so every user shares one hash.
+        password = make_password(options.password)
+        users = User.objects.bulk_create(
+            (
+                User(
+                    email=f'{options.email_prefix}{i}@example.com',
+                    name=f'{options.email_prefix.title()} User {i}',
+                    password=password,
+                )
+                for i in range(options.users)
+            ),
+            batch_size=options.batch_size,
+        )
+        self.counts['users'] = len(users)
+        self.log(f'Created {len(users)} users')
+        return users
+
+    def create_recipes(self, owners):
+        options = self.options
+        tag_weights = zipf_cum_weights(options.tags, options.zipf)
+        ingredient_weights = zipf_cum_weights(
+            options.ingredients, options.zipf,
+        )
+        image_every = len(owners) / options.images if options.images else 0
+
+        for start in range(0, len(owners), options.batch_size):
+            batch = owners[start:start + options.batch_size]
+            recipes = [self.build_recipe(start + i, user)
+                       for i, user in enumerate(batch)]
+            if image_every:
+                for i, recipe in enumerate(recipes, start):
+                    if int(i % image_every) == 0:
+                        self.save_image(recipe)
+            Recipe.objects.bulk_create(recipes)
+
+            self.link(recipes, Tag, 'tag', tag_weights,
+                      options.tags_per_recipe)
+            self.link(recipes, Ingredient, 'ingredient', ingredient_weights,
+                      options.ingredients_per_recipe)
+            # COPY bypasses m2m_changed, so fill the arrays explicitly.
+            # Fresh statistics keep the refresh on the through indexes.
+            analyze(Recipe, Recipe.tags.through, Recipe.ingredients.through)
+            batch_recipes = Recipe.objects.filter(
+                pk__in=[recipe.id for recipe in recipes]
+            )
+            batch_recipes.refresh_related_arrays()
+            refresh_documents(batch_recipes)
+            self.add_count('recipes', len(recipes))
+            self.log(f'Created {self.counts["recipes"]} recipes')
+
+        self.counts.setdefault('recipes', 0)
+        self.counts['tags'] = len(self.named_ids[Tag])
+        self.counts['ingredients'] = len(self.named_ids[Ingredient])
+        self.counts.setdefault('images', 0)
+
+    def build_recipe(self, number, user):
+        rng = self.rng
+        return Recipe(
+            user=user,
+            title=' '.join(rng.choices(WORDS, k=rng.randint(2, 5))).title(),
+            description=' '.join(rng.choices(WORDS, k=rng.randint(0, 60))),
+            time_minutes=rng.randint(5, 240),
+            price=Decimal(rng.randint(100, 9999)) / 100,
+            link=f'https://example.com/recipes/{number}'
+            if rng.random() < 0.3 else '',
+        )
+
+    def link(self, recipes, model, field, cum_weights, per_recipe):
+        """ Attach Zipf picked names to recipes, creating missing rows. """
+        ids = self.named_ids[model]
+        picks = [
+            (recipe, pick_distinct(self.rng, cum_weights,
+                                   self.rng.randint(0, per_recipe)))
+            for recipe in recipes
+        ]
+
+        missing = {
+            (recipe.user_id, rank): None
+            for recipe, ranks in picks for rank in ranks
+            if (recipe.user_id, rank) not in ids
+        }
+        created = model.objects.bulk_create(
+            model(user_id=user_id, name=f'{field} {rank}')
+            for user_id, rank in missing
+        )
+        ids.update(zip(missing, (obj.id for obj in created)))
+
+        through = getattr(Recipe, f'{field}s').through
+        copy_rows(
+            through._meta.db_table,
+            ('recipe_id', f'{field}_id'),
+            (
+                (recipe.id, ids[(recipe.user_id, rank)])
+                for recipe, ranks in picks for rank in ranks
+            ),
+        )
+
+    def save_image(self, recipe):
+        """ Store a generated image for recipe. """
+        field = Recipe._meta.get_field('image')
+        content = ContentFile(image_bytes(self.rng))
+        for name, value in image_metadata(content).items():
+            setattr(recipe, name, value)
+        recipe.image = field.storage.save(
+            field.generate_filename(None, 'seed.jpg'), content,
+        )
+        self.add_count('images', 1)
+
+    def add_count(self, key, value):
+        self.counts[key] = self.counts.get(key, 0) + value
+
+
+def seed(stdout=None, **options):
+    """ Create the dataset described by options and return row counts. """
+    return Seeder(stdout, **options).run()
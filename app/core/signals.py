@@ -0,0 +1,145 @@
+"""
+Signal handlers keeping the denormalized recipe data in sync.
+
+The tag and ingredient arrays and the materialized document are
+rebuilt by the handlers below. Signals run in the transaction of the
+write only if there is one: relation changes and deletes are atomic in
+Django, while a save is not. Every write path saving models with
+handlers here wraps the save in transaction.atomic(), like the recipe
+serializers, the tag and ingredient views and the admin, so a failing
+handler rolls the write back instead of committing it out of step with
+the data derived from it.
+
+Images shared through content addressed storage are released after
+the commit that stopped using them, see core.storage. The variants of a
+new image are rendered after the commit that stored it.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Recipe, Tag, Ingredient
+from core.variants import render_new_image
+from recipe.documents import refresh_documents
+
+
+RELATION_FIELDS = {
+    Recipe.tags.through: 'tags',
+    Recipe.ingredients.through: 'ingredients',
+}
+
+sync_paused = ContextVar('sync_paused', default=False)
+
+
+@contextmanager
+def renames_unsynced():
+    """
+    Skip refreshing recipes for tags and ingredients deleted in the block.
+
+    Only for deletes that leave no recipe referring to them, like a
+    purge that deleted the owner's recipes first.
+    """
+    token = sync_paused.set(True)
+    try:
+        yield
+    finally:
+        sync_paused.reset(token)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def sync_recipe_arrays(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Refresh the arrays of the recipes whose relation changed. """
+    field = RELATION_FIELDS[sender]
+    related = field[:-1]
+
+    if reverse and action == 'pre_clear':
+        # The affected recipes can't be found once the rows are gone.
+        instance._cleared_recipe_ids = list(sender.objects.filter(
+            **{f'{related}_id': instance.pk}
+        ).values_list('recipe_id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action != 'post_clear' and not pk_set:
+        return
+
+    if reverse:
+        if action == 'post_clear':
+            recipe_ids = instance.__dict__.pop('_cleared_recipe_ids', [])
+        else:
+            recipe_ids = pk_set
+        recipes = Recipe.objects.filter(pk__in=recipe_ids)
+        recipes.refresh_related_arrays(field)
+        refresh_documents(recipes)
+        return
+
+    Recipe.objects.filter(pk=instance.pk).refresh_related_arrays(field)
+    instance.refresh_from_db(fields=[f'{related}_ids', f'{related}_names'])
+    refresh_documents([instance])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def sync_renamed_or_deleted(sender, instance, created=False, **kwargs):
+    """ Refresh recipes carrying a renamed or deleted tag or ingredient. """
+    if created or sync_paused.get():
+        return
+    related = sender._meta.model_name
+    recipes = Recipe.objects.filter(
+        **{f'{related}_ids__contains': [instance.pk]}
+    )
+    recipe_ids = list(recipes.values_list('pk', flat=True))
+    if recipe_ids:
+        recipes.refresh_related_arrays(f'{related}s')
+        refresh_documents(Recipe.objects.filter(pk__in=recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def sync_recipe_document(sender, instance, created, **kwargs):
+    """ Rebuild the document of a saved recipe. """
+    if not created:
+        # The arrays are never saved from memory and may be stale.
+        instance.refresh_from_db(fields=Recipe.ARRAY_FIELDS)
+    refresh_documents([instance])
+
+
+def release_images(names):
+    """ Delete the given images unless a recipe still uses them. """
+    names = set(names)
+    names.difference_update(
+        Recipe.objects.filter(image__in=names).values_list('image', flat=True)
+    )
+    storage = Recipe._meta.get_field('image').storage
+    for name in names:
+        storage.release(name)
+
+
+@receiver(post_save, sender=Recipe)
+def sync_replaced_image(sender, instance, **kwargs):
+    """
+    Render the variants of a new image and release the one it replaced,
+    once the save is committed.
+    """
+    old = getattr(instance, '_loaded_image', None)
+    new = instance.image.name
+    instance._loaded_image = new
+    if old == new:
+        return
+    if new:
+        transaction.on_commit(lambda: render_new_image(new))
+    if old:
+        transaction.on_commit(lambda: release_images([old]))
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(sender, instance, **kwargs):
+    """ Release the image of a deleted recipe once it is committed. """
+    if instance.image:
+        name = instance.image.name
+        transaction.on_commit(lambda: release_images([name]))
@@ -0,0 +1,135 @@
+"""
+Slow query recording with call site attribution.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import transaction
+
+
+APP_DIRS = ('recipe', 'user', 'core')
+IN_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def write_record(record):
+    """ Append a record to the rotating slow query log. """
+    path = settings.SLOW_QUERY_LOG
+    handler = _handlers.get(path)
+    if handler is None:
+        # Two handlers of one file would rotate it under each other.
+        with _handlers_lock:
+            handler = _handlers.get(path)
+            if handler is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                handler = RotatingFileHandler(
+                    path,
+                    maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+                    backupCount=settings.SLOW_QUERY_LOG_BACKUPS,
+                )
+                _handlers[path] = handler
+
+    handler.handle(logging.makeLogRecord({'msg': json.dumps(record)}))
+
+
+def find_call_site():
+    """ Return the innermost application frame as 'path:line in func'. """
+    base_dir = str(settings.BASE_DIR)
+    app_roots = tuple(os.path.join(base_dir, app) + os.sep for app in APP_DIRS)
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename == __file__:
+            continue
+        if frame.filename.endswith(os.path.join('core', 'middleware.py')):
+            continue
+        if frame.filename.startswith(app_roots):
+            path = os.path.relpath(frame.filename, base_dir)
+            return f'{path}:{frame.lineno} in {frame.name}'
+
+    return None
+
+
+def normalize_sql(sql):
+    """ Collapse IN lists so the same query with more ids groups together. """
+    return IN_LIST_RE.sub('(...)', sql)
+
+
+class SlowQueryRecorder:
+    """ Execute wrapper writing queries above a threshold to the log. """
+
+    def __init__(self, threshold_ms, explain=False, request=None):
+        self.threshold = threshold_ms / 1000
+        self.explain = explain
+        self.request = request
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+        if duration >= self.threshold:
+            self.record(sql, params, many, duration, context['connection'])
+
+        return result
+
+    def record(self, sql, params, many, duration, connection):
+        record = {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'duration_ms': round(duration * 1000, 3),
+            'sql': sql,
+            'params': None if many else [repr(p) for p in params or ()],
+            'call_site': find_call_site(),
+            'database': connection.alias,
+        }
+        if self.request is not None:
+            record['method'] = self.request.method
+            record['path'] = self.request.path
+        if self.explain and not many:
+            record['plan'] = self.get_plan(sql, params, connection)
+
+        write_record(record)
+
+    def get_plan(self, sql, params, connection):
+        """ Return the EXPLAIN output for a SELECT without executing it. """
+        if connection.vendor != 'postgresql':
+            return None
+        if not sql.lstrip().upper().startswith('SELECT'):
+            return None
+
+        # Run outside every execute wrapper, so neither this recorder
+        # nor the query counts of the request see the EXPLAIN.
+        wrappers = connection.execute_wrappers
+        connection.execute_wrappers = []
+        try:
+            with transaction.atomic(using=connection.alias), \
+                    connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (ANALYZE off) {sql}', params)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+        except Exception as exc:
+            return f'EXPLAIN failed: {exc}'
+        finally:
+            connection.execute_wrappers = wrappers
+
+
+def read_records(path):
+    """ Yield records from the log and its rotated backups. """
+    paths = [path] + [
+        f'{path}.{i}' for i in range(1, settings.SLOW_QUERY_LOG_BACKUPS + 1)
+    ]
+    for log_path in paths:
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path) as log_file:
+            for line in log_file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
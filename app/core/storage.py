@@ -0,0 +1,148 @@
+"""
+Content addressed storage of uploaded files.
+
+Files are named after the SHA-256 of their content and sharded in two
+directory levels, e.g. uploads/recipe/ab/cd/abcd...ef.jpg, so no
+directory grows past a few thousand entries. Uploading content that is
+already stored returns the existing name, and all recipes using it share
+one file. A shared file is only deleted by release() once nothing refers
+to it, see core.signals.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+from django.utils.module_loading import import_string
+
+
+# Uploads are written here while they are hashed. The directory lives in
+# the storage so the final move is an atomic rename on one filesystem.
+INCOMING_DIR = '.incoming'
+
+CONTENT_NAME_RE = re.compile(
+    r'^(?P<directory>.+)/(?P<shard>[0-9a-f]{2}/[0-9a-f]{2})/'
+    r'(?P<digest>[0-9a-f]{64})(?P<ext>\.[a-z0-9]+)$'
+)
+
+
+def content_name(directory, digest, ext):
+    return posixpath.join(directory, digest[:2], digest[2:4], digest + ext)
+
+
+def parse_content_name(name):
+    """ Return (directory, digest, ext) of a content name, or None. """
+    match = CONTENT_NAME_RE.match(name)
+    if not match:
+        return None
+    digest = match['digest']
+    if match['shard'] != f'{digest[:2]}/{digest[2:4]}':
+        return None
+    return match['directory'], digest, match['ext']
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """ File system storage that stores each distinct content once. """
+
+    # Clients can't write to the file system, uploads go through the app.
+    supports_direct_upload = False
+
+    def get_available_name(self, name, max_length=None):
+        # The name is replaced by the content hash in _save, and equal
+        # names mean equal content, so an existing name is not a clash.
+        return name
+
+    def _save(self, name, content):
+        return self.write(name, content, content_addressed=True)
+
+    def save_named(self, name, content):
+        """
+        Store content under exactly name, replacing any existing file.
+
+        For derived files like image variants, whose names the caller
+        chooses.
+        """
+        validate_file_name(name, allow_relative_path=True)
+        return self.write(name, content, content_addressed=False)
+
+    def write(self, name, content, content_addressed):
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        ext = os.path.splitext(filename)[1].lower()
+        incoming = self.path(INCOMING_DIR)
+        self.makedirs(incoming)
+
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=incoming, suffix=ext)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+            if content_addressed:
+                name = content_name(directory, digest.hexdigest(), ext)
+            path = self.path(name)
+            if not content_addressed or not self.touch(path):
+                self.makedirs(os.path.dirname(path))
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, path)
+                temp_path = None
+        finally:
+            if temp_path is not None:
+                os.unlink(temp_path)
+
+        return name
+
+    def makedirs(self, directory):
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+        try:
+            os.makedirs(
+                directory, self.directory_permissions_mode, exist_ok=True,
+            )
+        finally:
+            os.umask(old_umask)
+
+    def touch(self, path):
+        """
+        Mark an existing file as just used and return whether it exists.
+
+        The modification time protects the file from release() and
+        gc_media until the upload that reused it is committed.
+        """
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self, name, grace_seconds=None):
+        """
+        Delete name unless it was stored or reused within the grace period.
+
+        The caller checks nothing refers to name any more. Files kept
+        because of the grace period are left to gc_media.
+        """
+        if grace_seconds is None:
+            grace_seconds = settings.MEDIA_RELEASE_GRACE_SECONDS
+        path = self.path(name)
+        try:
+            age = time.time() - os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+        if age < grace_seconds:
+            return False
+        self.delete(name)
+        return True
+
+
+def recipe_image_storage():
+    """ Return the storage of recipe images set by RECIPE_IMAGE_STORAGE. """
+    return import_string(settings.RECIPE_IMAGE_STORAGE)()
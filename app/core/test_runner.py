@@ -0,0 +1,36 @@
+"""
+Test runner of the project.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Run the tests without rate limits.
+
+    All test requests come from one address and would share buckets
+    across tests. The throttling tests set their own rates and store.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.throttle_dir = tempfile.TemporaryDirectory()
+        self.throttle_settings = override_settings(
+            THROTTLE_DB_PATH=os.path.join(
+                self.throttle_dir.name, 'throttle.sqlite3',
+            ),
+            REST_FRAMEWORK={
+                **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {},
+            },
+        )
+        self.throttle_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.throttle_settings.disable()
+        super().teardown_test_environment(**kwargs)
+        self.throttle_dir.cleanup()
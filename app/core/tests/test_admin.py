@@ -1,10 +1,19 @@
 """
  Test for django admin modfication
 """
+import csv
+from decimal import Decimal
+from unittest.mock import patch
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from core import models
+from core.admin import EstimatedCountPaginator
 
 class AdminSiteTests(TestCase): 
     """ Test for Django Admins. """
@@ -46,3 +55,130 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
         
         self.assertEqual(res.status_code , 200)
+
+
+class LargeTableAdminTests(TestCase):
+    """ Test the admin pages of recipes, tags and ingredients. """
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='test123',
+        )
+        self.client.force_login(self.admin_user)
+        self.user = get_user_model().objects.create_user(
+            email='owner@example.com',
+            name='Owner',
+        )
+        self.recipes = [
+            models.Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=5,
+                price=Decimal('2.50'),
+            )
+            for i in range(3)
+        ]
+        self.tag = models.Tag.objects.create(user=self.user, name='Vegan')
+
+    def changelist(self, params=None):
+        return self.client.get(
+            reverse('admin:core_recipe_changelist'), params or {},
+        )
+
+    def test_recipe_changelist_queries_do_not_grow(self):
+        """ Test the changelist selects owners with the recipes. """
+        with CaptureQueriesContext(connection) as few:
+            self.changelist()
+        for i in range(20):
+            models.Recipe.objects.create(
+                user=self.user, title=f'More {i}', time_minutes=5,
+                price=Decimal('1.00'),
+            )
+
+        with CaptureQueriesContext(connection) as many:
+            res = self.changelist()
+
+        self.assertContains(res, 'More 19')
+        self.assertEqual(len(many), len(few))
+
+    def test_recipe_search(self):
+        """ Test searching by id, owner email and title prefix. """
+        other = get_user_model().objects.create_user('other@example.com')
+        models.Recipe.objects.create(
+            user=other, title='Other dish', time_minutes=5,
+            price=Decimal('1.00'),
+        )
+
+        cases = {
+            str(self.recipes[1].id): {'Recipe 1'},
+            'owner@': {'Recipe 0', 'Recipe 1', 'Recipe 2'},
+            'recipe 2': {'Recipe 2'},
+            'dish': set(),
+        }
+        for term, titles in cases.items():
+            with self.subTest(term=term):
+                res = self.changelist({'q': term})
+                found = {
+                    recipe.title for recipe in
+                    res.context['cl'].result_list
+                }
+                self.assertEqual(found, titles)
+
+    def test_estimated_count(self):
+        """ Test unfiltered counts come from the planner estimate. """
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_recipe')
+
+        with patch.object(EstimatedCountPaginator, 'EXACT_COUNT_LIMIT', 0), \
+                CaptureQueriesContext(connection) as queries:
+            res = self.changelist()
+
+        self.assertEqual(res.context['cl'].result_count, 3)
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] and 'core_recipe' in query['sql']
+            for query in queries
+        ))
+
+    def test_export_csv(self):
+        """ Test the export action streams the selected rows. """
+        res = self.client.post(reverse('admin:core_recipe_changelist'), {
+            'action': 'export_as_csv',
+            '_selected_action': [recipe.id for recipe in self.recipes[:2]],
+        })
+
+        self.assertTrue(res.streaming)
+        rows = list(csv.reader(
+            b''.join(res.streaming_content).decode().splitlines()
+        ))
+        self.assertEqual(rows[0][:3], ['id', 'user__email', 'title'])
+        self.assertEqual(
+            {row[2] for row in rows[1:]}, {'Recipe 0', 'Recipe 1'},
+        )
+
+    def test_tag_autocomplete(self):
+        """ Test the recipe form looks tags up by name prefix. """
+        res = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'core',
+            'model_name': 'recipe',
+            'field_name': 'tags',
+            'term': 'veg',
+        })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [result['text'] for result in res.json()['results']], ['Vegan'],
+        )
+
+    def test_recipe_change_form_skips_unselected_tags(self):
+        """ Test the change form does not render every tag. """
+        models.Tag.objects.create(user=self.user, name='Unselected')
+        self.recipes[0].tags.add(self.tag)
+
+        res = self.client.get(
+            reverse('admin:core_recipe_change', args=[self.recipes[0].id])
+        )
+
+        self.assertContains(res, 'Vegan')
+        self.assertNotContains(res, 'Unselected')
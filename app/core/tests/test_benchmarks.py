@@ -0,0 +1,48 @@
+"""
+Test for the benchmark suite.
+"""
+from django.test import SimpleTestCase, TestCase
+
+from core import benchmarks
+
+
+class BenchmarkSuiteTests(TestCase):
+    """ Test the benchmark cases run. """
+
+    def test_run_benchmarks(self):
+        """ Test every case produces timing results. """
+        results = benchmarks.run_benchmarks(
+            sizes=[2], tag_counts=[2], rounds=1,
+        )
+
+        self.assertIn('serializer_create_tags_2', results)
+        self.assertIn('serializer_update_tags_2', results)
+        self.assertIn('list_serialize_2', results)
+        self.assertIn('list_model_serializer_2', results)
+        # The list view reads stored documents in a single query.
+        self.assertEqual(results['list_serialize_2']['queries'], 1)
+        self.assertIn('get_queryset_tags_and_ingredients_2', results)
+        self.assertIn('render_json_2', results)
+        for result in results.values():
+            self.assertGreaterEqual(result['median_ms'], 0)
+
+
+class BenchmarkCompareTests(SimpleTestCase):
+    """ Test comparing results to a baseline. """
+
+    def test_compare_flags_regressions(self):
+        """ Test slower medians beyond the threshold are regressions. """
+        baseline = {
+            'fast': {'median_ms': 10.0},
+            'slow': {'median_ms': 10.0},
+        }
+        results = {
+            'fast': {'median_ms': 10.5},
+            'slow': {'median_ms': 12.0},
+            'new': {'median_ms': 1.0},
+        }
+
+        rows, regressions = benchmarks.compare(results, baseline, 10.0)
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(regressions, ['slow'])
@@ -2,35 +2,61 @@
 Test  custom Django management commands.
 """
 
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as psycopg2Error
 
 
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import SimpleTestCase
 
 
-@patch('core.management.commands.wait_for_db.Command.check')
+@patch('core.management.commands.wait_for_db.Command.ping')
 class CommandTests(SimpleTestCase):
     """Test commands."""
 
-    def test_wait_for_db_ready(self, patched_check):
+    def test_wait_for_db_ready(self, patched_ping):
         """Test waiting for database if database ready"""
-        patched_check.return_value = True
+        patched_ping.return_value = None
 
-        call_command('wait_for_db')
+        call_command('wait_for_db', stdout=StringIO())
+
+        patched_ping.assert_called_once_with('default')
 
-        patched_check.assert_called_once_with(databases =['default'])
     @patch('time.sleep')
-    def test_wait_for_db_delay(self, patched_sleep, patched_check):
+    def test_wait_for_db_delay(self, patched_sleep, patched_ping):
         """test waiting for database when getting OperatinalError"""
-        patched_check.side_effect = [psycopg2Error] * 2 + \
-            [OperationalError] * 3 + [True]
-        
+        patched_ping.side_effect = [psycopg2Error] * 2 + \
+            [OperationalError] * 3 + [None]
+
+        call_command('wait_for_db', stdout=StringIO())
+
+        self.assertEqual(patched_ping.call_count, 6)
+        patched_ping.assert_called_with('default')
+        delays = [call.args[0] for call in patched_sleep.call_args_list]
+        self.assertEqual(delays, [0.05, 0.1, 0.2, 0.4, 0.8])
+
+    @patch('time.sleep')
+    def test_wait_for_db_backoff_is_capped(self, patched_sleep, patched_ping):
+        """Test the delay between attempts stops growing at max interval"""
+        patched_ping.side_effect = [OperationalError] * 8 + [None]
+
+        call_command('wait_for_db', '--max-interval=0.5', stdout=StringIO())
+
+        delays = [call.args[0] for call in patched_sleep.call_args_list]
+        self.assertEqual(max(delays), 0.5)
+        self.assertEqual(delays[-3:], [0.5, 0.5, 0.5])
+
+    @patch('time.sleep')
+    def test_wait_for_db_timeout(self, patched_sleep, patched_ping):
+        """Test giving up once the deadline has passed"""
+        patched_ping.side_effect = OperationalError
 
-        call_command('wait_for_db')
+        with patch('time.monotonic', side_effect=[0, 1, 2, 10]), \
+                self.assertRaises(CommandError):
+            call_command('wait_for_db', '--timeout=5', stdout=StringIO())
 
-        self.assertEqual(patched_check.call_count, 6)
-        patched_check.assert_called_with(databases=['default'])
+        self.assertEqual(patched_ping.call_count, 3)
@@ -0,0 +1,247 @@
+"""
+Test routing reads to database replicas.
+"""
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from rest_framework.authtoken.models import Token  # type: ignore
+
+from core.db_router import (
+    PinStore,
+    ReplicaMonitor,
+    ReplicaRouter,
+    ReplicaRoutingMiddleware,
+    RequestRouting,
+    monitor,
+    routing,
+)
+from core.models import Recipe
+
+
+REPLICAS = ['replica_0', 'replica_1']
+
+
+def user(pk=1):
+    return SimpleNamespace(pk=pk, is_authenticated=True)
+
+
+@override_settings(
+    DATABASE_REPLICAS=REPLICAS,
+    DB_REPLICA_MAX_LAG_SECONDS=5,
+    DB_REPLICA_CHECK_SECONDS=60,
+    DB_PIN_SECONDS=15,
+    DB_PIN_CACHE='',
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'pins': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'pins',
+        },
+    },
+)
+class ReplicaRouterTests(SimpleTestCase):
+    """ Test the replica router and its middleware. """
+
+    def setUp(self):
+        monitor.reset()
+        self.addCleanup(monitor.reset)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.pins = override_settings(
+            DB_PIN_DB_PATH=os.path.join(directory.name, 'pins.sqlite3'),
+        )
+        self.pins.enable()
+        self.addCleanup(self.pins.disable)
+        self.lags = dict.fromkeys(REPLICAS, 0.0)
+        lag_patch = patch.object(
+            ReplicaMonitor, 'lag', side_effect=lambda alias: self.lags[alias],
+        )
+        lag_patch.start()
+        self.addCleanup(lag_patch.stop)
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.check_replicas()
+
+    def check_replicas(self):
+        """ Run a replica check now and wait for it. """
+        monitor.checked = None
+        monitor.replicas()
+        monitor.wait()
+
+    def request(self, method='get', user=None):
+        request = getattr(self.factory, method)('/api/recipe/recipes/')
+        if user is not None:
+            request.user = user
+        return request
+
+    def route(self, request, model=Recipe):
+        token = routing.set(RequestRouting(request))
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            routing.reset(token)
+
+    def test_reads_outside_requests_use_the_default(self):
+        self.assertIsNone(self.router.db_for_read(Recipe))
+        self.assertEqual(self.router.db_for_write(Recipe), 'default')
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.assertIn(self.route(self.request()), REPLICAS)
+        self.assertIn(self.route(self.request(user=user())), REPLICAS)
+
+    def test_one_replica_per_request(self):
+        state = RequestRouting(self.request())
+        token = routing.set(state)
+        try:
+            aliases = {self.router.db_for_read(Recipe) for _ in range(20)}
+        finally:
+            routing.reset(token)
+
+        self.assertEqual(len(aliases), 1)
+
+    def test_writes_and_credentials_use_the_primary(self):
+        self.assertEqual(self.route(self.request('post')), 'default')
+        self.assertEqual(self.route(self.request(), Token), 'default')
+
+    def test_writers_are_pinned_to_the_primary(self):
+        """ Test a user reads from the primary for a while after a write. """
+        middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+        middleware(self.request('post', user=user(1)))
+
+        self.assertEqual(self.route(self.request(user=user(1))), 'default')
+        self.assertIn(self.route(self.request(user=user(2))), REPLICAS)
+
+        with patch('core.db_router.time.time', return_value=10 ** 10):
+            self.assertIn(self.route(self.request(user=user(1))), REPLICAS)
+
+    def test_pins_survive_many_writers(self):
+        """ Test no pin is evicted before it expires. """
+        middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+        for pk in range(1, 1201):
+            middleware(self.request('post', user=user(pk)))
+
+        self.assertEqual(
+            {self.route(self.request(user=user(pk))) for pk in range(1, 1201)},
+            {'default'},
+        )
+
+    @override_settings(DB_PIN_CACHE='pins')
+    def test_pins_in_a_shared_cache(self):
+        middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+        middleware(self.request('post', user=user(1)))
+
+        self.assertTrue(caches['pins'].get('db-pin:1'))
+        self.assertEqual(self.route(self.request(user=user(1))), 'default')
+        caches['pins'].clear()
+
+    def test_pin_store_prunes_expired_pins(self):
+        store = PinStore(self.pins.options['DB_PIN_DB_PATH'])
+        store.pin(1, 15, now=0)
+        store.pin(2, 15, now=100)
+
+        self.assertFalse(store.is_pinned(1, now=100))
+        self.assertTrue(store.is_pinned(2, now=100))
+        with patch('core.db_router.PRUNE_EVERY', 1):
+            store.pin(3, 15, now=100)
+        self.assertEqual(
+            store.connection.execute('SELECT user_id FROM pin').fetchall(),
+            [(2,), (3,)],
+        )
+
+    def test_middleware_sets_routing_for_the_view(self):
+        seen = []
+        middleware = ReplicaRoutingMiddleware(
+            lambda request: seen.append(routing.get()) or HttpResponse(),
+        )
+
+        middleware(self.request())
+
+        self.assertIsInstance(seen[0], RequestRouting)
+        self.assertIsNone(routing.get())
+
+    def test_lagging_replicas_are_ejected(self):
+        """ Test replicas behind or down are left out until they recover. """
+        self.lags['replica_0'] = 30.0
+
+        with self.assertLogs('core.db_router', 'WARNING'):
+            self.check_replicas()
+        aliases = {self.route(self.request()) for _ in range(20)}
+
+        self.assertEqual(aliases, {'replica_1'})
+
+        self.lags['replica_0'] = 0.5
+        self.check_replicas()
+        aliases = {self.route(self.request()) for _ in range(50)}
+
+        self.assertEqual(aliases, set(REPLICAS))
+
+    def test_no_usable_replica_reads_from_the_primary(self):
+        self.lags.update(dict.fromkeys(REPLICAS, None))
+
+        with self.assertLogs('core.db_router', 'WARNING'):
+            self.check_replicas()
+
+        self.assertEqual(self.route(self.request()), 'default')
+
+    def test_lag_is_checked_once_per_period(self):
+        for _ in range(5):
+            self.route(self.request())
+        monitor.wait()
+
+        self.assertEqual(ReplicaMonitor.lag.call_count, len(REPLICAS))
+
+    def test_requests_never_wait_for_the_check(self):
+        """ Test a replica that doesn't answer doesn't delay requests. """
+        answered = threading.Event()
+        self.addCleanup(monitor.wait)
+        self.addCleanup(answered.set)
+        ReplicaMonitor.lag.side_effect = lambda alias: answered.wait(10)
+
+        with override_settings(DB_REPLICA_CHECK_SECONDS=0):
+            aliases = {self.route(self.request()) for _ in range(50)}
+
+        # The last result is used while the check hangs.
+        self.assertEqual(aliases, set(REPLICAS))
+        self.assertTrue(monitor.thread.is_alive())
+        answered.set()
+        monitor.wait()
+        self.assertEqual(ReplicaMonitor.lag.call_count, 2 * len(REPLICAS))
+
+    def test_first_requests_read_from_the_primary(self):
+        monitor.reset()
+        answered = threading.Event()
+        self.addCleanup(monitor.wait)
+        self.addCleanup(answered.set)
+        ReplicaMonitor.lag.side_effect = lambda alias: answered.wait(10)
+
+        self.assertEqual(self.route(self.request()), 'default')
+
+    def test_migrations_only_run_on_the_primary(self):
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica_0', 'core'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_nothing_is_routed(self):
+        seen = []
+        middleware = ReplicaRoutingMiddleware(
+            lambda request: seen.append(routing.get()) or HttpResponse(),
+        )
+
+        middleware(self.request('post', user=user()))
+
+        self.assertEqual(seen, [None])
+        self.assertFalse(os.path.exists(
+            self.pins.options['DB_PIN_DB_PATH'],
+        ))
@@ -0,0 +1,150 @@
+"""
+Test the media garbage collector.
+"""
+import os
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core import media_gc
+from core.media_gc import walk
+from core.models import Recipe
+
+
+class GcMediaCommandTests(TestCase):
+    """ Test the gc_media command. """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.root = media_root.name
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = get_user_model().objects.create_user('user@example.com')
+
+    def write(self, name, size=10, age=7200):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'x' * size)
+        then = time.time() - age
+        os.utime(path, (then, then))
+        return name
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.root, name))
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_media', *args, stdout=out)
+        return out.getvalue()
+
+    def create_files(self):
+        kept = self.write('uploads/recipe/aa/bb/kept.jpg')
+        Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+            image=kept,
+        )
+        return {
+            'kept': kept,
+            'orphan': self.write('uploads/recipe/aa/cc/orphan.jpg', 100),
+            'legacy': self.write('uploads/recipe/legacy.jpg', 50),
+            'fresh': self.write('uploads/recipe/cc/dd/fresh.jpg', age=0),
+            'incoming': self.write('.incoming/tmpabc.jpg', 5),
+        }
+
+    def test_deletes_old_orphans(self):
+        """ Test only old unreferenced files are deleted. """
+        files = self.create_files()
+
+        out = self.gc()
+
+        self.assertTrue(self.exists(files['kept']))
+        self.assertTrue(self.exists(files['fresh']))
+        for name in ('orphan', 'legacy', 'incoming'):
+            self.assertFalse(self.exists(files[name]))
+        self.assertIn('deleted 3', out)
+        self.assertIn('(155 bytes)', out)
+
+    def test_dry_run(self):
+        """ Test a dry run reports orphans and deletes nothing. """
+        files = self.create_files()
+
+        out = self.gc('--dry-run')
+
+        for name in files.values():
+            self.assertTrue(self.exists(name))
+        self.assertIn('found 3 orphans', out)
+        self.assertIn('would reclaim', out)
+
+    def test_resume_from_checkpoint(self):
+        """ Test a time boxed run stops and the next one continues. """
+        files = self.create_files()
+        checkpoint = os.path.join(self.root, '.gc_media.json')
+
+        out = self.gc('--batch-size=2', '--max-seconds=0')
+
+        self.assertIn('Stopped early', out)
+        self.assertTrue(os.path.exists(checkpoint))
+        self.assertFalse(self.exists(files['incoming']))
+        self.assertTrue(self.exists(files['orphan']))
+
+        out = self.gc('--batch-size=2')
+
+        self.assertIn('Resuming after', out)
+        self.assertFalse(self.exists(files['orphan']))
+        self.assertFalse(self.exists(files['legacy']))
+        self.assertIn('deleted 3', out)
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_walk_skips_handled_names(self):
+        """ Test walking after a name lists only later names in order. """
+        for name in ('a/1', 'a/2', 'b/c/1', 'b/d/1', 'c'):
+            self.write(os.path.join('tree', name))
+
+        names = [name for name, entry in walk(self.root, 'tree')]
+        after = ('tree', 'b', 'c', '1')
+        later = [name for name, entry in walk(self.root, 'tree', after)]
+
+        self.assertEqual(
+            names,
+            ['tree/a/1', 'tree/a/2', 'tree/b/c/1', 'tree/b/d/1', 'tree/c'],
+        )
+        self.assertEqual(later, ['tree/b/d/1', 'tree/c'])
+
+    def test_walk_lists_large_directories_in_chunks(self):
+        """ Test a flat directory is walked in order a chunk at a time. """
+        flat = [f'f{i:02}' for i in range(10)]
+        for name in [*flat, 'f05x/1']:
+            self.write(os.path.join('flat', name))
+        listed = []
+
+        def nsmallest(n, iterable, key):
+            chunk = heapq_nsmallest(n, iterable, key=key)
+            listed.append(len(chunk))
+            return chunk
+
+        heapq_nsmallest = media_gc.heapq.nsmallest
+        with patch.object(media_gc, 'CHUNK_SIZE', 3), \
+                patch.object(media_gc.heapq, 'nsmallest', nsmallest):
+            names = [name for name, entry in walk(self.root, 'flat')]
+            later = [
+                name for name, entry
+                in walk(self.root, 'flat', ('flat', 'f05x', '1'))
+            ]
+
+        expected = [f'flat/{name}' for name in flat]
+        expected.insert(6, 'flat/f05x/1')
+        self.assertEqual(names, expected)
+        self.assertEqual(later, expected[7:])
+        self.assertLessEqual(max(listed), 3)
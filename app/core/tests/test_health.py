@@ -0,0 +1,84 @@
+"""
+Test the liveness and readiness endpoints.
+"""
+from unittest.mock import patch
+
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.views import readiness
+
+
+HEALTHZ_URL = reverse('healthz')
+READYZ_URL = reverse('readyz')
+
+
+class HealthTests(TestCase):
+    """ Test the probe endpoints. """
+
+    def setUp(self):
+        readiness.reset()
+        self.addCleanup(readiness.reset)
+
+    def test_healthz_skips_database(self):
+        """ Test liveness answers without touching the database. """
+        with self.assertNumQueries(0):
+            res = self.client.get(HEALTHZ_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ok'})
+
+    def test_readyz_ok(self):
+        """ Test readiness reports a reachable, migrated database. """
+        res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['migrations'], 'ok')
+
+    def test_readyz_is_cached(self):
+        """ Test repeated probes reuse the last result. """
+        self.client.get(READYZ_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(HEALTH_CHECK_CACHE_SECONDS=0)
+    def test_readyz_checks_migrations_once(self):
+        """ Test only the ping repeats once migrations are applied. """
+        self.client.get(READYZ_URL)
+
+        with self.assertNumQueries(1):
+            self.client.get(READYZ_URL)
+
+    @override_settings(HEALTH_CHECK_CACHE_SECONDS=0)
+    def test_readyz_unmigrated(self):
+        """ Test unapplied migrations make the service not ready. """
+        with patch(
+            'core.views.MigrationExecutor.migration_plan',
+            return_value=[('core', False)],
+        ):
+            res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['migrations'], '1 unapplied')
+
+    @override_settings(HEALTH_CHECK_CACHE_SECONDS=0)
+    def test_readyz_database_down(self):
+        """ Test a failing database makes the service not ready. """
+        with patch('core.views.connections') as patched_connections:
+            cursor = patched_connections.__getitem__.return_value.cursor
+            cursor.side_effect = OperationalError('connection refused')
+            res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['database'], 'connection refused')
+
+    def test_probes_accept_any_host(self):
+        """ Test probes by container address are not rejected. """
+        for url in (HEALTHZ_URL, READYZ_URL):
+            res = self.client.get(url, HTTP_HOST='10.1.2.3:8000')
+
+            self.assertEqual(res.status_code, 200)
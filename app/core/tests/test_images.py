@@ -0,0 +1,113 @@
+"""
+Test recipe image metadata.
+"""
+import io
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.images import base83, blurhash, image_metadata
+from core.models import Recipe
+
+
+def jpeg(size=(40, 20), color=(255, 0, 0), orientation=None):
+    image = Image.new('RGB', size, color)
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    output = io.BytesIO()
+    image.save(output, format='JPEG', exif=exif.tobytes())
+    return ContentFile(output.getvalue())
+
+
+class ImageMetadataTests(TestCase):
+    """ Test metadata is read from images. """
+
+    def test_blurhash_of_solid_colour(self):
+        """ Test the hash has 4x3 components and the average colour. """
+        result = blurhash(Image.new('RGB', (20, 10), (255, 0, 0)))
+
+        self.assertEqual(len(result), 28)
+        self.assertEqual(result[0], 'L')
+        self.assertEqual(result[2:6], base83(0xFF0000, 4))
+
+    def test_blurhash_differs_by_content(self):
+        """ Test different pictures get different placeholders. """
+        gradient = Image.linear_gradient('L').convert('RGB')
+
+        self.assertNotEqual(
+            blurhash(gradient), blurhash(gradient.rotate(90)),
+        )
+
+    def test_image_metadata(self):
+        """ Test dimensions, size and format are read. """
+        content = jpeg()
+
+        metadata = image_metadata(content)
+
+        self.assertEqual(metadata['image_width'], 40)
+        self.assertEqual(metadata['image_height'], 20)
+        self.assertEqual(metadata['image_size'], content.size)
+        self.assertEqual(metadata['image_format'], 'jpeg')
+        self.assertEqual(len(metadata['image_placeholder']), 28)
+
+    def test_image_metadata_rotated(self):
+        """ Test EXIF rotated images report their displayed size. """
+        metadata = image_metadata(jpeg(orientation=6))
+
+        self.assertEqual(metadata['image_width'], 20)
+        self.assertEqual(metadata['image_height'], 40)
+
+
+class BackfillImageMetadataTests(TestCase):
+    """ Test the backfill_image_metadata command. """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = get_user_model().objects.create_user('user@example.com')
+
+    def create_recipe(self, content=None):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        if content is not None:
+            recipe.image.save('photo.jpg', content)
+        return recipe
+
+    def test_backfill(self):
+        """ Test missing metadata is stored and documents rebuilt. """
+        recipe = self.create_recipe(jpeg())
+        broken = self.create_recipe(ContentFile(b'not an image'))
+        without_image = self.create_recipe()
+        err = StringIO()
+
+        call_command(
+            'backfill_image_metadata', '--batch-size=1',
+            stdout=StringIO(), stderr=err,
+        )
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_width, 40)
+        self.assertEqual(recipe.document['image_width'], 40)
+        self.assertEqual(
+            recipe.document['image_placeholder'], recipe.image_placeholder,
+        )
+        broken.refresh_from_db()
+        self.assertIsNone(broken.image_width)
+        self.assertIn(f'Recipe {broken.pk}', err.getvalue())
+        without_image.refresh_from_db()
+        self.assertIsNone(without_image.document['image_width'])
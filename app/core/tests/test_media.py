@@ -0,0 +1,131 @@
+"""
+Test serving uploaded media.
+"""
+import os
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from rest_framework.authtoken.models import Token  # type: ignore
+
+from core.models import Recipe
+
+
+CONTENT = bytes(range(256)) * 4
+
+
+class MediaViewTests(TestCase):
+    """ Test the media view checks ownership and caches well. """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root.name, MEDIA_ACCEL_REDIRECT_PREFIX='',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.name = 'uploads/recipe/image.jpg'
+        os.makedirs(os.path.join(media_root.name, 'uploads', 'recipe'))
+        with open(os.path.join(media_root.name, self.name), 'wb') as file:
+            file.write(CONTENT)
+
+        self.user = get_user_model().objects.create_user('user@example.com')
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+            image=self.name,
+        )
+        self.url = self.recipe.image.url
+        self.client.force_login(self.user)
+
+    def test_owner_gets_file(self):
+        """ Test the owner receives the file with cache headers. """
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), CONTENT)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('private', res['Cache-Control'])
+        self.assertTrue(res['ETag'])
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+
+    def test_token_auth(self):
+        """ Test API clients authenticate with their token. """
+        self.client.logout()
+        token = Token.objects.create(user=self.user)
+
+        res = self.client.get(
+            self.url, HTTP_AUTHORIZATION=f'Token {token.key}',
+        )
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_other_users_are_refused(self):
+        """ Test other and anonymous users get a 404. """
+        other = get_user_model().objects.create_user('other@example.com')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_path_traversal_refused(self):
+        """ Test paths outside of MEDIA_ROOT are not served. """
+        res = self.client.get('/static/media/../../etc/passwd')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_not_modified(self):
+        """ Test a matching ETag is answered without the body. """
+        etag = self.client.get(self.url)['ETag']
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['ETag'], etag)
+
+    def test_range(self):
+        """ Test byte ranges are answered with partial content. """
+        res = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content), CONTENT[10:20])
+        self.assertEqual(res['Content-Range'], f'bytes 10-19/{len(CONTENT)}')
+
+        res = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(res.streaming_content), CONTENT[-4:])
+
+    def test_range_not_satisfiable(self):
+        """ Test ranges past the end of the file are refused. """
+        res = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    def test_stale_if_range_sends_whole_file(self):
+        """ Test a range for an outdated copy returns the whole file. """
+        res = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"',
+        )
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_accel_redirect(self):
+        """ Test the transfer is handed to the front web server. """
+        with override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected/'):
+            res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res['X-Accel-Redirect'], f'/protected/{self.name}',
+        )
+        self.assertEqual(res.content, b'')
+        self.assertIn('immutable', res['Cache-Control'])
@@ -0,0 +1,122 @@
+"""
+Test for the metrics endpoint.
+"""
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from prometheus_client.parser import (  # type: ignore
+    text_string_to_metric_families,
+)
+from rest_framework.authtoken.models import Token  # type: ignore
+from rest_framework.test import APIClient  # type: ignore
+
+from core import metrics
+
+
+METRICS_URL = reverse('metrics')
+
+
+def get_samples(content, name):
+    """ Return the samples of a metric from the exposition body. """
+    for family in text_string_to_metric_families(content.decode()):
+        for sample in family.samples:
+            if sample.name == name:
+                yield sample
+
+
+class MetricsTests(TestCase):
+    """ Test request metrics are exposed. """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_metrics_endpoint(self):
+        """ Test the endpoint serves the Prometheus text format. """
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('text/plain', res['Content-Type'])
+        self.assertIn(b'http_requests_in_flight', res.content)
+
+    def test_request_latency_labeled_by_view(self):
+        """ Test latency is labeled with the viewset route name. """
+        self.client.get(reverse('recipe:recipe-list'))
+        self.client.get(reverse('user:me'))
+
+        res = self.client.get(METRICS_URL)
+
+        views = {
+            sample.labels['view']
+            for sample in get_samples(
+                res.content, 'http_request_duration_seconds_count'
+            )
+        }
+        self.assertIn('recipe-list', views)
+        self.assertIn('user-me', views)
+        self.assertTrue(
+            list(get_samples(res.content, 'http_request_db_queries_count'))
+        )
+        self.assertTrue(
+            list(get_samples(res.content, 'http_response_size_bytes_count'))
+        )
+
+
+@override_settings(METRICS_ALLOWED_NETWORKS=['10.1.0.0/16'], METRICS_TOKEN='')
+class MetricsAccessTests(TestCase):
+    """ Test who may read the metrics. """
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get(self, address='192.0.2.1', **extra):
+        return self.client.get(METRICS_URL, REMOTE_ADDR=address, **extra)
+
+    def test_other_clients_are_forbidden(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get('127.0.0.1').status_code, 403)
+
+    def test_allowed_networks(self):
+        self.assertEqual(self.get('10.1.2.3').status_code, 200)
+
+    def test_bearer_token(self):
+        with override_settings(METRICS_TOKEN='secret'):
+            res = self.get(HTTP_AUTHORIZATION='Bearer secret')
+            wrong = self.get(HTTP_AUTHORIZATION='Bearer other')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(wrong.status_code, 403)
+
+    def test_staff_users(self):
+        """ Test staff may read the metrics with a token, others not. """
+        user = get_user_model().objects.create_user('user@example.com')
+        token = Token.objects.create(user=user)
+        auth = f'Token {token.key}'
+
+        self.assertEqual(self.get(HTTP_AUTHORIZATION=auth).status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.get(HTTP_AUTHORIZATION=auth).status_code, 200)
+
+    def test_exited_workers_are_marked_dead(self):
+        """ Test the live gauges of an exited worker are dropped. """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        with patch.object(metrics.multiprocess, 'mark_process_dead') as dead:
+            metrics.worker_exited(123)
+            dead.assert_not_called()
+            with patch.dict(
+                os.environ, PROMETHEUS_MULTIPROC_DIR=directory.name,
+            ):
+                metrics.worker_exited(123)
+        dead.assert_called_once_with(123)
@@ -0,0 +1,225 @@
+"""
+Test for the performance middleware.
+"""
+import threading
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework.test import APIClient  # type: ignore
+
+from core.middleware import CoalescingMiddleware
+from core.models import Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class QueryTimingMiddlewareTests(TestCase):
+    """ Test the Server-Timing middleware. """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(
+            user=self.user,
+            title='sample recipe name',
+            time_minutes=5,
+            price=Decimal('1.5'),
+        )
+
+    @override_settings(QUERY_TIMING_ENABLED=False)
+    def test_disabled_adds_no_header(self):
+        """ Test no header is added when timing is disabled. """
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    @override_settings(QUERY_TIMING_ENABLED=True, QUERY_BUDGET=100)
+    def test_enabled_adds_server_timing(self):
+        """ Test the header reports db, serialize and render timings. """
+        res = self.client.get(RECIPES_URL)
+
+        header = res['Server-Timing']
+        self.assertIn('db;dur=', header)
+        self.assertIn('db-queries;desc="', header)
+        self.assertIn('serialize;dur=', header)
+        self.assertIn('render;dur=', header)
+
+    @override_settings(QUERY_TIMING_ENABLED=False, METRICS_QUERY_COUNTS=False)
+    def test_disabled_installs_no_execute_wrapper(self):
+        """ Test queries run unwrapped when nothing needs their stats. """
+        with patch.object(
+            BaseDatabaseWrapper, 'execute_wrapper',
+            side_effect=BaseDatabaseWrapper.execute_wrapper, autospec=True,
+        ) as execute_wrapper:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, 200)
+        execute_wrapper.assert_not_called()
+
+    @override_settings(QUERY_TIMING_ENABLED=True, METRICS_QUERY_COUNTS=True)
+    def test_timing_and_metrics_share_one_wrapper(self):
+        with patch.object(
+            BaseDatabaseWrapper, 'execute_wrapper',
+            side_effect=BaseDatabaseWrapper.execute_wrapper, autospec=True,
+        ) as execute_wrapper:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertIn('db-queries;desc="', res['Server-Timing'])
+        self.assertEqual(execute_wrapper.call_count, len(connections.all()))
+
+    @override_settings(QUERY_TIMING_ENABLED=True, QUERY_BUDGET=0)
+    def test_query_budget_exceeded_logs_warning(self):
+        """ Test a warning is logged when the query budget is exceeded. """
+        with self.assertLogs('core.middleware', level='WARNING') as logs:
+            self.client.get(RECIPES_URL)
+
+        self.assertIn('Query budget exceeded', logs.output[0])
+
+
+class SlowView:
+    """ A view whose GETs block until released, counting calls. """
+
+    def __init__(self, status=200):
+        self.status = status
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, request):
+        self.calls += 1
+        if request.method == 'GET':
+            self.started.set()
+            self.release.wait(5)
+        response = HttpResponse(f'call {self.calls}', status=self.status)
+        response['X-Test'] = 'yes'
+        return response
+
+
+@override_settings(COALESCE_WAIT_SECONDS=5)
+class CoalescingMiddlewareTests(SimpleTestCase):
+    """ Test identical concurrent GETs share a response. """
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def run_together(self, view, *requests):
+        """ Run the first request, then the others while it is running. """
+        middleware = CoalescingMiddleware(view)
+        responses = [None] * len(requests)
+
+        def run(index):
+            responses[index] = middleware(requests[index])
+
+        threads = [threading.Thread(target=run, args=(0,))]
+        threads[0].start()
+        view.started.wait(5)
+        for index in range(1, len(requests)):
+            threads.append(threading.Thread(target=run, args=(index,)))
+            threads[-1].start()
+        # Give the followers time to join the flight.
+        threading.Timer(0.2, view.release.set).start()
+        for thread in threads:
+            thread.join(5)
+        return middleware, responses
+
+    def get(self, path=RECIPES_URL, token='a', **extra):
+        return self.factory.get(
+            path, HTTP_AUTHORIZATION=f'Token {token}', **extra,
+        )
+
+    def test_identical_requests_share_a_response(self):
+        view = SlowView()
+
+        middleware, responses = self.run_together(
+            view,
+            self.get(f'{RECIPES_URL}?b=2&a=1'),
+            self.get(f'{RECIPES_URL}?a=1&b=2'),
+            self.get(f'{RECIPES_URL}?a=1&b=2'),
+        )
+
+        self.assertEqual(view.calls, 1)
+        for response in responses:
+            self.assertEqual(response.content, b'call 1')
+            self.assertEqual(response['X-Test'], 'yes')
+        self.assertEqual(middleware.flights, {})
+
+    def test_other_clients_and_queries_run_alone(self):
+        view = SlowView()
+
+        _, responses = self.run_together(
+            view,
+            self.get(),
+            self.get(token='b'),
+            self.get(f'{RECIPES_URL}?tags=1'),
+            self.get(HTTP_ACCEPT='text/html'),
+        )
+
+        self.assertEqual(view.calls, 4)
+
+    @override_settings(COALESCE_WAIT_SECONDS=0.01)
+    def test_wait_is_bounded(self):
+        """ Test followers run the view once the wait runs out. """
+        view = SlowView()
+
+        _, responses = self.run_together(view, self.get(), self.get())
+
+        self.assertEqual(view.calls, 2)
+        self.assertEqual(responses[1].content, b'call 2')
+
+    def test_errors_are_not_shared(self):
+        view = SlowView(status=500)
+
+        _, responses = self.run_together(view, self.get(), self.get())
+
+        self.assertEqual(view.calls, 2)
+
+    def test_writes_end_flights_of_the_client(self):
+        """ Test requests after a write don't get an older response. """
+        view = SlowView()
+        middleware = CoalescingMiddleware(view)
+        leader = threading.Thread(target=middleware, args=(self.get(),))
+        leader.start()
+        view.started.wait(5)
+
+        write = self.factory.post(
+            RECIPES_URL, HTTP_AUTHORIZATION='Token a',
+        )
+        middleware(write)
+
+        self.assertEqual(middleware.flights, {})
+        view.release.set()
+        leader.join(5)
+
+    def test_other_paths_are_not_coalesced(self):
+        view = SlowView()
+
+        self.run_together(view, self.get('/admin/'), self.get('/admin/'))
+
+        self.assertEqual(view.calls, 2)
+
+    def test_recipe_endpoints_are_coalesced_by_default(self):
+        """ Test the default COALESCE_PATHS cover the real recipe routes. """
+        for path in [RECIPES_URL, reverse('recipe:tag-list'),
+                     reverse('recipe:ingredient-list')]:
+            view = SlowView()
+
+            self.run_together(view, self.get(path), self.get(path))
+
+            self.assertEqual(view.calls, 1, path)
@@ -0,0 +1,170 @@
+"""
+Test hash partitioning of the recipe tables.
+"""
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status  # type: ignore
+from rest_framework.test import APIClient  # type: ignore
+
+from core.admin import EstimatedCountPaginator
+from core.models import Ingredient, Recipe, Tag
+from core.partitioning import (
+    partition_count,
+    partitions,
+    recipe_tables,
+    repartition,
+)
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class PartitioningTests(TestCase):
+    """ Test the recipe tables keep working when partitioned. """
+
+    def setUp(self):
+        self.users = [
+            get_user_model().objects.create_user(f'user{i}@example.com')
+            for i in range(3)
+        ]
+        for user in self.users:
+            for i in range(2):
+                recipe = Recipe.objects.create(
+                    user=user,
+                    title=f'Recipe {i}',
+                    time_minutes=5,
+                    price=Decimal('1.50'),
+                )
+                recipe.tags.add(Tag.objects.create(user=user, name='Tag'))
+                recipe.ingredients.add(
+                    Ingredient.objects.create(user=user, name='Salt'),
+                )
+
+    def counts(self):
+        with connection.cursor() as cursor:
+            return {
+                table: partition_count(cursor, table)
+                for table, _ in recipe_tables(Recipe)
+            }
+
+    def test_repartition(self):
+        """ Test the tables are partitioned with their rows and back. """
+        last_id = Recipe.objects.latest('id').id
+
+        repartition(connection, Recipe, 4)
+
+        self.assertEqual(set(self.counts().values()), {4})
+        self.assertEqual(Recipe.objects.count(), 6)
+        self.assertEqual(Recipe.tags.through.objects.count(), 6)
+        recipe = Recipe.objects.create(
+            user=self.users[0], title='New', time_minutes=1,
+            price=Decimal('1.00'),
+        )
+        self.assertGreater(recipe.id, last_id)
+
+        repartition(connection, Recipe, 0)
+
+        self.assertEqual(set(self.counts().values()), {0})
+        self.assertEqual(Recipe.objects.count(), 7)
+
+    def test_user_queries_read_one_partition(self):
+        repartition(connection, Recipe, 4)
+
+        plan = Recipe.objects.filter(user=self.users[0]).order_by('-id') \
+            .explain()
+
+        self.assertEqual(plan.count('core_recipe_p'), 1)
+
+    def test_api_on_partitioned_tables(self):
+        """ Test the recipe API works unchanged on partitioned tables. """
+        repartition(connection, Recipe, 4)
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+
+        res = client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 2)
+
+        res = client.post(RECIPES_URL, {
+            'title': 'Soup', 'time_minutes': 10, 'price': '2.00',
+            'tags': [{'name': 'Tag'}, {'name': 'Dinner'}],
+            'ingredients': [{'name': 'Water'}],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tag_names, ['Tag', 'Dinner'])
+
+        res = client.patch(
+            reverse('recipe:recipe-detail', args=[recipe.id]),
+            {'tags': []}, format='json',
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(recipe.tags.count(), 0)
+
+        res = client.delete(reverse('recipe:recipe-detail', args=[recipe.id]))
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Recipe.ingredients.through.objects.filter(
+            recipe_id=recipe.id,
+        ).exists())
+
+    def test_partitions_index_the_related_column(self):
+        """ Test lookups by tag or ingredient use an index per partition. """
+        repartition(connection, Recipe, 4)
+
+        with connection.cursor() as cursor:
+            for through, column in (
+                (Recipe.tags.through, 'tag_id'),
+                (Recipe.ingredients.through, 'ingredient_id'),
+            ):
+                for partition in partitions(cursor, through._meta.db_table):
+                    cursor.execute(
+                        'SELECT count(*) FROM pg_index i '
+                        'JOIN pg_attribute a ON a.attrelid = i.indrelid '
+                        'AND a.attnum = i.indkey[0] '
+                        'WHERE i.indrelid = %s::regclass AND a.attname = %s',
+                        [partition, column],
+                    )
+                    self.assertGreater(cursor.fetchone()[0], 0, partition)
+
+    def test_admin_count_estimate_on_partitions(self):
+        """ Test the admin adds up the estimates of the partitions. """
+        repartition(connection, Recipe, 4)
+        paginator = EstimatedCountPaginator(Recipe.objects.order_by('id'), 10)
+
+        with patch.object(EstimatedCountPaginator, 'EXACT_COUNT_LIMIT', 0), \
+                CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 6)
+
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+
+    def test_maintain_partitions(self):
+        """ Test every partition is analyzed on its own. """
+        repartition(connection, Recipe, 2)
+        out = StringIO()
+
+        call_command('maintain_partitions', stdout=out)
+
+        for table, _ in recipe_tables(Recipe):
+            for remainder in range(2):
+                self.assertIn(f'{table}_p{remainder}:', out.getvalue())
+
+    @override_settings(RECIPE_HASH_PARTITIONS=3)
+    def test_repartition_to_setting(self):
+        repartition(connection, Recipe, 0)
+        out = StringIO()
+
+        call_command('maintain_partitions', '--repartition', stdout=out)
+        call_command('maintain_partitions', '--repartition', stdout=out)
+
+        self.assertEqual(set(self.counts().values()), {3})
+        self.assertIn('from 0 to 3 partitions', out.getvalue())
+        self.assertIn('Recipe tables have 3 partitions', out.getvalue())
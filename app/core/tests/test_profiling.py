@@ -0,0 +1,138 @@
+"""
+Test for on demand request profiling.
+"""
+import os
+import tempfile
+import threading
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token  # type: ignore
+from rest_framework.test import APIClient  # type: ignore
+
+from core import profiling
+from core.models import RequestProfile
+from core.profiling import ProfilerBusy, RequestProfiler
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """ Test profiling requests. """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            PROFILE_DIR=self.tmp_dir.name,
+        )
+        self.settings_override.enable()
+        self.client = APIClient()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+
+    def authenticate(self, is_staff):
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+            is_staff=is_staff,
+        )
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return user
+
+    def test_staff_request_is_profiled(self):
+        """ Test the profile is saved for a staff request. """
+        user = self.authenticate(is_staff=True)
+
+        res = self.client.get(RECIPES_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, 200)
+        profile = RequestProfile.objects.get(id=res['X-Profile-Id'])
+        self.assertEqual(profile.user, user)
+        self.assertEqual(profile.path, RECIPES_URL)
+        self.assertTrue(os.path.exists(profile.folded_stacks_file))
+        self.assertTrue(os.path.exists(profile.allocations_file))
+
+    def test_query_param_trigger(self):
+        """ Test the profile query parameter triggers profiling. """
+        self.authenticate(is_staff=True)
+
+        res = self.client.get(RECIPES_URL, {'profile': 1})
+
+        self.assertIn('X-Profile-Id', res)
+
+    def test_non_staff_request_not_profiled(self):
+        """ Test regular users cannot trigger profiling. """
+        self.authenticate(is_staff=False)
+
+        res = self.client.get(RECIPES_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_profiles_listed_in_admin(self):
+        """ Test the admin lists captured profiles. """
+        user = self.authenticate(is_staff=True)
+        self.client.get(RECIPES_URL, HTTP_X_PROFILE='1')
+        user.is_superuser = True
+        user.save()
+        self.client.force_login(user)
+
+        res = self.client.get(reverse('admin:core_requestprofile_changelist'))
+
+        self.assertContains(res, RECIPES_URL)
+
+    def test_request_during_another_profile_is_not_profiled(self):
+        """ Test a second concurrent profile request runs unprofiled. """
+        self.authenticate(is_staff=True)
+
+        with profiling.lock:
+            res = self.client.get(RECIPES_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['X-Profile-Skipped'], 'busy')
+        self.assertFalse(res.has_header('X-Profile-Id'))
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class RequestProfilerTests(SimpleTestCase):
+    """ Test concurrent use of the request profiler. """
+
+    def test_concurrent_profiles(self):
+        """ Test a second profile can't stop tracemalloc under the first. """
+        entered = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def first():
+            with RequestProfiler() as profile:
+                entered.set()
+                release.wait(10)
+                results.append(bytearray(1024 * 1024))
+            results.append(profile)
+
+        thread = threading.Thread(target=first)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        entered.wait(10)
+
+        with self.assertRaises(ProfilerBusy):
+            with RequestProfiler():
+                pass
+
+        self.assertTrue(tracemalloc.is_tracing())
+        release.set()
+        thread.join()
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertGreaterEqual(results[1].peak_memory, 1024 * 1024)
+        with RequestProfiler() as profile:
+            pass
+        self.assertIsNotNone(profile.duration)
@@ -0,0 +1,185 @@
+"""
+Test deleting users and their data in batches.
+"""
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token  # type: ignore
+
+from core.models import Ingredient, Recipe, Tag, UserPurge
+from core.purge import UserPurger, released_email, request_purge
+
+
+def create_collection(user, count):
+    """ Give user count recipes, each with a tag and an ingredient. """
+    for i in range(count):
+        recipe = Recipe.objects.create(
+            user=user,
+            title=f'Recipe {i}',
+            time_minutes=5,
+            price=Decimal('1.50'),
+        )
+        recipe.tags.add(Tag.objects.create(user=user, name=f'Tag {i}'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=user, name=f'Salt {i}'),
+        )
+
+
+class UserPurgeTests(TestCase):
+    """ Test queuing and running user purges. """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'gone@example.com', 'pass1234',
+        )
+        self.other = get_user_model().objects.create_user(
+            'kept@example.com', 'pass1234',
+        )
+        create_collection(self.user, 5)
+        create_collection(self.other, 2)
+
+    def test_request_purge_deactivates(self):
+        """ Test the user is locked out before any data is deleted. """
+        Token.objects.create(user=self.user)
+
+        purge = request_purge(self.user)
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(self.user.email, released_email(self.user))
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertEqual(purge.email, 'gone@example.com')
+        self.assertEqual(purge.status, 'pending')
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(request_purge(self.user), purge)
+        purge.refresh_from_db()
+        self.assertEqual(purge.email, 'gone@example.com')
+        get_user_model().objects.create_user('gone@example.com')
+
+    def test_purge_deletes_everything_of_the_user(self):
+        purge = request_purge(self.user)
+
+        self.assertTrue(UserPurger(batch_size=2).run())
+
+        purge.refresh_from_db()
+        self.assertEqual(purge.status, 'done')
+        self.assertIsNone(purge.user)
+        self.assertEqual(purge.recipes_deleted, 5)
+        self.assertEqual(purge.tags_deleted, 5)
+        self.assertEqual(purge.ingredients_deleted, 5)
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(Ingredient.objects.count(), 2)
+        self.assertEqual(Recipe.tags.through.objects.count(), 2)
+
+    def test_purge_skips_refreshing_recipes(self):
+        """ Test deleted tags don't look for recipes carrying them. """
+        request_purge(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            UserPurger(batch_size=2).run()
+
+        self.assertFalse(any(
+            '_ids" @>' in query['sql'] for query in queries
+        ))
+
+    def test_purge_stops_at_the_deadline(self):
+        """ Test a time boxed run keeps its progress for the next one. """
+        purge = request_purge(self.user)
+
+        with patch('core.purge.time.monotonic', side_effect=range(100)):
+            self.assertFalse(UserPurger(batch_size=2).run(max_seconds=1))
+
+        purge.refresh_from_db()
+        self.assertEqual(purge.status, 'running')
+        self.assertEqual(purge.recipes_deleted, 2)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+
+        self.assertTrue(UserPurger(batch_size=2).run())
+
+        purge.refresh_from_db()
+        self.assertEqual(purge.recipes_deleted, 5)
+        self.assertEqual(purge.status, 'done')
+
+    def test_failed_purge_is_recorded(self):
+        purge = request_purge(self.user)
+
+        with patch.object(UserPurger, 'delete_batch',
+                          side_effect=RuntimeError('boom')), \
+                self.assertLogs('core.purge', 'ERROR'):
+            self.assertFalse(UserPurger().run())
+
+        purge.refresh_from_db()
+        self.assertEqual(purge.error, 'boom')
+        self.assertIsNone(purge.finished)
+
+    def test_purge_users_command(self):
+        request_purge(self.user)
+        out = StringIO()
+
+        call_command('purge_users', '--batch-size', '3', stdout=out)
+
+        self.assertIn('Purged gone@example.com: 5 recipes', out.getvalue())
+        self.assertIn('0 users left to purge', out.getvalue())
+
+
+class UserPurgeAdminTests(TestCase):
+    """ Test deleting users from the admin. """
+
+    def setUp(self):
+        self.admin_user = get_user_model().objects.create_superuser(
+            'admin@example.com', 'pass1234',
+        )
+        self.client.force_login(self.admin_user)
+        self.user = get_user_model().objects.create_user(
+            'gone@example.com', 'pass1234',
+        )
+        create_collection(self.user, 3)
+
+    def test_delete_user_queues_purge(self):
+        """ Test the admin deactivates the user instead of cascading. """
+        url = reverse('admin:core_user_delete', args=[self.user.id])
+
+        res = self.client.get(url)
+        self.assertContains(res, 'deleted in the background')
+
+        res = self.client.post(url, {'post': 'yes'})
+
+        self.assertEqual(res.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(UserPurge.objects.get().user, self.user)
+
+    def test_bulk_delete_users_queues_purges(self):
+        other = get_user_model().objects.create_user('other@example.com')
+
+        self.client.post(reverse('admin:core_user_changelist'), {
+            'action': 'delete_selected',
+            '_selected_action': [self.user.id, other.id],
+            'post': 'yes',
+        })
+
+        self.assertEqual(UserPurge.objects.count(), 2)
+        self.assertEqual(
+            get_user_model().objects.filter(is_active=False).count(), 2,
+        )
+
+    def test_purge_progress_page(self):
+        request_purge(self.user)
+
+        res = self.client.get(reverse('admin:core_userpurge_changelist'))
+
+        self.assertContains(res, 'gone@example.com')
+        self.assertContains(res, 'pending')
@@ -0,0 +1,252 @@
+"""
+Query plan regression checks on a large seeded dataset.
+
+These are slow, so they only run with PLAN_CHECKS=1. Set
+PLAN_CHECKS_UPDATE=1 as well to rewrite the golden plans in
+core/tests/plans after an intended change. With RECIPE_HASH_PARTITIONS
+set the plans are compared to core/tests/plans/partitioned, with the
+partition suffix dropped from relation and index names.
+"""
+import json
+import os
+import re
+import unittest
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+
+from rest_framework.request import Request  # type: ignore
+from rest_framework.test import APIRequestFactory  # type: ignore
+
+from core.models import Recipe, User
+from recipe.views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+
+PLAN_CHECKS = os.environ.get('PLAN_CHECKS') == '1'
+UPDATE_GOLDEN = os.environ.get('PLAN_CHECKS_UPDATE') == '1'
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), 'plans')
+if settings.RECIPE_HASH_PARTITIONS:
+    GOLDEN_DIR = os.path.join(GOLDEN_DIR, 'partitioned')
+PARTITION_SUFFIX = re.compile(r'_p\d+(?=_|$)')
+
+USERS = int(os.environ.get('PLAN_CHECKS_USERS', 2000))
+RECIPES_PER_USER = int(os.environ.get('PLAN_CHECKS_RECIPES_PER_USER', 100))
+NAMES_PER_USER = 30
+POWER_USER_RECIPES = 5000
+POWER_USER_NAMES = 1000
+RELATED_PER_RECIPE = 3
+PAGE_SIZE = 50
+
+SHAPE_KEYS = ('Node Type', 'Relation Name', 'Index Name', 'Join Type',
+              'Parent Relationship', 'Strategy')
+
+
+def seed_user(cursor, email_pattern, recipes, names):
+    """ Insert tags, ingredients, recipes and through rows for users. """
+    for table in ('core_tag', 'core_ingredient'):
+        cursor.execute(f"""
+            INSERT INTO {table} (user_id, name)
+            SELECT u.id, 'name ' || n
+            FROM core_user AS u, generate_series(1, %s) AS n
+            WHERE u.email LIKE %s
+        """, [names, email_pattern])
+    cursor.execute("""
+        INSERT INTO core_recipe
+            (user_id, title, description, time_minutes, price, link,
+             image_format, image_placeholder, tag_ids, tag_names,
+             ingredient_ids, ingredient_names, document)
+        SELECT u.id, 'recipe ' || n, '', 5 + n %% 60, 9.99, '', '', '',
+               '{}', '{}', '{}', '{}', '{}'
+        FROM core_user AS u, generate_series(1, %s) AS n
+        WHERE u.email LIKE %s
+    """, [recipes, email_pattern])
+    for table, column, related in (
+        ('core_recipe_tags', 'tag_id', 'core_tag'),
+        ('core_recipe_ingredients', 'ingredient_id', 'core_ingredient'),
+    ):
+        # A stable pseudo random pick of the owner's rows for each recipe.
+        cursor.execute(f"""
+            INSERT INTO {table} (recipe_id, {column})
+            SELECT r.id, t.id
+            FROM core_recipe AS r
+            JOIN core_user AS u ON u.id = r.user_id
+            CROSS JOIN LATERAL (
+                SELECT id FROM {related}
+                WHERE user_id = r.user_id
+                ORDER BY md5(r.id || '-' || id)
+                LIMIT %s
+            ) AS t
+            WHERE u.email LIKE %s
+        """, [RELATED_PER_RECIPE, email_pattern])
+
+
+def seed(cursor):
+    """
+    Seed many ordinary users and one power user, then ANALYZE.
+
+    The power user owns enough rows that reading the first page in
+    index order is clearly cheaper than sorting.
+    """
+    cursor.execute("""
+        INSERT INTO core_user
+            (password, is_superuser, email, name, is_active, is_staff)
+        SELECT '!', false, 'plan' || i || '@example.com', 'Plan', true, false
+        FROM generate_series(1, %s) AS i
+        UNION ALL
+        SELECT '!', false, 'power@example.com', 'Power', true, false
+    """, [USERS])
+    seed_user(cursor, 'plan%', RECIPES_PER_USER, NAMES_PER_USER)
+    seed_user(cursor, 'power@example.com', POWER_USER_RECIPES,
+              POWER_USER_NAMES)
+    cursor.execute('ANALYZE')
+    Recipe.objects.refresh_related_arrays()
+    cursor.execute('ANALYZE')
+
+
+def relation(node):
+    """ Return the table a node reads, the same for all its partitions. """
+    name = node.get('Relation Name')
+    return name and PARTITION_SUFFIX.sub('', name)
+
+
+def plan_shape(node):
+    """ Keep the structure of a plan node and drop costs and estimates. """
+    shape = {key: node[key] for key in SHAPE_KEYS if key in node}
+    for key in ('Relation Name', 'Index Name'):
+        if key in shape:
+            shape[key] = PARTITION_SUFFIX.sub('', shape[key])
+    if 'Plans' in node:
+        shape['Plans'] = [plan_shape(child) for child in node['Plans']]
+    return shape
+
+
+def iter_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from iter_nodes(child)
+
+
+def view_queryset(viewset_class, user, params=None):
+    """ Build the queryset a viewset would use for a list request. """
+    view = viewset_class()
+    view.action = 'list'
+    view.format_kwarg = None
+    view.request = Request(APIRequestFactory().get('/', params or {}))
+    view.request.user = user
+    return view.get_queryset()
+
+
+@unittest.skipUnless(PLAN_CHECKS, 'set PLAN_CHECKS=1 to run plan checks')
+class QueryPlanTests(TestCase):
+    """ Test the plans of the API querysets on a large dataset. """
+
+    @classmethod
+    def setUpTestData(cls):
+        with connection.cursor() as cursor:
+            seed(cursor)
+        cls.user = User.objects.get(email='power@example.com')
+        cls.tag_ids = ','.join(
+            str(pk) for pk in cls.user.tag_set.values_list('id', flat=True)[:3]
+        )
+        cls.ingredient_ids = ','.join(
+            str(pk) for pk in
+            cls.user.ingredient_set.values_list('id', flat=True)[:3]
+        )
+
+    def get_plan(self, queryset):
+        return json.loads(queryset.explain(format='json'))[0]['Plan']
+
+    def assertNoSeqScan(self, plan, *relations):
+        for node in iter_nodes(plan):
+            self.assertFalse(
+                node['Node Type'] == 'Seq Scan'
+                and relation(node) in relations,
+                f'Sequential scan:\n{json.dumps(plan, indent=2)}',
+            )
+
+    def assertNoSort(self, plan):
+        for node in iter_nodes(plan):
+            self.assertNotIn(
+                node['Node Type'], ('Sort', 'Incremental Sort'),
+                f'Sort node in plan:\n{json.dumps(plan, indent=2)}',
+            )
+
+    def assertMatchesGolden(self, name, plan):
+        path = os.path.join(GOLDEN_DIR, f'{name}.json')
+        shape = plan_shape(plan)
+        if UPDATE_GOLDEN:
+            os.makedirs(GOLDEN_DIR, exist_ok=True)
+            with open(path, 'w') as golden_file:
+                json.dump(shape, golden_file, indent=2)
+                golden_file.write('\n')
+            return
+
+        self.assertTrue(
+            os.path.exists(path),
+            f'No golden plan {path}, run with PLAN_CHECKS_UPDATE=1',
+        )
+        with open(path) as golden_file:
+            self.assertEqual(shape, json.load(golden_file))
+
+    def assertListPlans(self, name, queryset, *tables):
+        """
+        Check the full list and its first page.
+
+        Sorting a whole list is fine, but the first page has to come
+        straight off the index in order.
+        """
+        plan = self.get_plan(queryset)
+        self.assertNoSeqScan(plan, *tables)
+        self.assertMatchesGolden(name, plan)
+
+        plan = self.get_plan(queryset[:PAGE_SIZE])
+        self.assertNoSeqScan(plan, *tables)
+        self.assertNoSort(plan)
+        self.assertMatchesGolden(f'{name}_page', plan)
+
+    def test_recipe_list_plans(self):
+        """ Test listing recipes uses the (user, id) index. """
+        self.assertListPlans(
+            'recipe_list', view_queryset(RecipeViewSet, self.user),
+            'core_recipe',
+        )
+
+    def test_recipe_filter_plans(self):
+        """ Test filtering recipes never scans the whole table. """
+        variants = {
+            'recipe_filter_tags': {'tags': self.tag_ids},
+            'recipe_filter_ingredients': {
+                'ingredients': self.ingredient_ids,
+            },
+            'recipe_filter_tags_and_ingredients': {
+                'tags': self.tag_ids,
+                'ingredients': self.ingredient_ids,
+            },
+        }
+        for name, params in variants.items():
+            with self.subTest(name):
+                plan = self.get_plan(
+                    view_queryset(RecipeViewSet, self.user, params)
+                )
+
+                self.assertNoSeqScan(plan, 'core_recipe')
+                self.assertMatchesGolden(name, plan)
+
+    def test_recipe_attr_list_plans(self):
+        """ Test listing tags and ingredients uses the (user, name) index. """
+        for viewset_class, table, through in (
+            (TagViewSet, 'core_tag', 'core_recipe_tags'),
+            (IngredientViewSet, 'core_ingredient',
+             'core_recipe_ingredients'),
+        ):
+            for params in ({}, {'assigned_only': 1}):
+                name = f'{table}_list'
+                if params:
+                    name += '_assigned'
+                with self.subTest(name):
+                    self.assertListPlans(
+                        name,
+                        view_queryset(viewset_class, self.user, params),
+                        table, through,
+                    )
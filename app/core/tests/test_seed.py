@@ -0,0 +1,102 @@
+"""
+Test the synthetic data seeding command.
+"""
+import random
+import tempfile
+from collections import Counter
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from core.models import Recipe, Tag, User
+from core.seeding import pick_distinct, zipf_cum_weights
+
+
+def snapshot():
+    """ Return the seeded data in a form independent of primary keys. """
+    return [
+        (
+            recipe.user.email,
+            recipe.title,
+            recipe.price,
+            sorted(tag.name for tag in recipe.tags.all()),
+            sorted(ingredient.name for ingredient in
+                   recipe.ingredients.all()),
+        )
+        for recipe in Recipe.objects.select_related('user').prefetch_related(
+            'tags', 'ingredients',
+        ).order_by('id')
+    ]
+
+
+class SeedCommandTests(TestCase):
+    """ Test the seed command. """
+
+    def seed(self, **options):
+        options.setdefault('users', 10)
+        options.setdefault('recipes', 200)
+        options.setdefault('power_users', 2)
+        call_command('seed', stdout=StringIO(), **options)
+
+    def test_seed_creates_rows(self):
+        """ Test the requested number of users and recipes is created. """
+        self.seed(batch_size=64)
+
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(Recipe.objects.count(), 200)
+        self.assertTrue(Tag.objects.exists())
+        user = User.objects.first()
+        self.assertTrue(user.check_password('password123'))
+
+    def test_seed_is_deterministic(self):
+        """ Test the same seed produces the same data. """
+        self.seed(seed=7)
+        first = snapshot()
+        User.objects.all().delete()
+        self.seed(seed=7)
+
+        self.assertEqual(snapshot(), first)
+
+        User.objects.all().delete()
+        self.seed(seed=8)
+        self.assertNotEqual(snapshot(), first)
+
+    def test_seed_is_skewed(self):
+        """ Test power users own most recipes and tags are Zipfian. """
+        self.seed(power_share=0.8, zipf=1.5, tags=50)
+
+        owners = Counter(Recipe.objects.values_list('user__email', flat=True))
+        self.assertEqual(owners['seed0@example.com'], 80)
+        self.assertEqual(owners['seed1@example.com'], 80)
+        uses = Counter(
+            Recipe.tags.through.objects.values_list('tag__name', flat=True)
+        )
+        self.assertEqual(uses.most_common(1)[0][0], 'tag 0')
+
+    def test_seed_images(self):
+        """ Test generated images are stored for the requested recipes. """
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            self.seed(images=5, recipes=20)
+
+            recipes = Recipe.objects.exclude(image='')
+            self.assertEqual(recipes.count(), 5)
+            for recipe in recipes:
+                self.assertTrue(recipe.image.storage.exists(recipe.image.name))
+
+    def test_seed_existing_prefix_fails(self):
+        """ Test seeding twice with one prefix is refused. """
+        self.seed()
+
+        with self.assertRaises(CommandError):
+            self.seed()
+
+    def test_pick_distinct(self):
+        """ Test picks are unique and capped by the number of names. """
+        rng = random.Random(0)
+        weights = zipf_cum_weights(3, 1.1)
+
+        self.assertEqual(sorted(pick_distinct(rng, weights, 5)), [0, 1, 2])
+        self.assertEqual(len(set(pick_distinct(rng, weights, 2))), 2)
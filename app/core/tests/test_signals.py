@@ -0,0 +1,104 @@
+"""
+Test the denormalized recipe arrays stay in sync with the relations.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core.models import Recipe, Tag, Ingredient
+
+
+class RecipeArraySyncTests(TestCase):
+    """ Test the tag and ingredient arrays on recipes. """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('user@example.com')
+        self.recipe = self.create_recipe()
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.dinner = Tag.objects.create(user=self.user, name='Dinner')
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+
+    def assertArrays(self, recipe, tag_ids, tag_names):
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.tag_ids, tag_ids)
+        self.assertEqual(recipe.tag_names, tag_names)
+
+    def test_add_and_remove(self):
+        """ Test adding and removing tags updates the arrays. """
+        self.recipe.tags.add(self.dinner, self.vegan)
+
+        self.assertEqual(self.recipe.tag_ids, [self.vegan.id, self.dinner.id])
+        self.assertEqual(self.recipe.tag_names, ['Vegan', 'Dinner'])
+
+        self.recipe.tags.remove(self.vegan)
+
+        self.assertArrays(self.recipe, [self.dinner.id], ['Dinner'])
+
+    def test_clear(self):
+        """ Test clearing the relation empties the arrays. """
+        self.recipe.tags.add(self.vegan)
+        self.recipe.tags.clear()
+
+        self.assertArrays(self.recipe, [], [])
+
+    def test_reverse_add_and_clear(self):
+        """ Test changes made from the tag side update every recipe. """
+        other = self.create_recipe()
+        self.vegan.recipe_set.add(self.recipe, other)
+
+        self.assertArrays(self.recipe, [self.vegan.id], ['Vegan'])
+        self.assertArrays(other, [self.vegan.id], ['Vegan'])
+
+        self.vegan.recipe_set.clear()
+
+        self.assertArrays(self.recipe, [], [])
+        self.assertArrays(other, [], [])
+
+    def test_rename_and_delete(self):
+        """ Test renaming or deleting a tag updates recipes using it. """
+        self.recipe.tags.add(self.vegan, self.dinner)
+
+        self.vegan.name = 'Plant based'
+        self.vegan.save()
+
+        self.assertArrays(
+            self.recipe,
+            [self.vegan.id, self.dinner.id],
+            ['Plant based', 'Dinner'],
+        )
+
+        self.dinner.delete()
+
+        self.assertArrays(self.recipe, [self.vegan.id], ['Plant based'])
+
+    def test_ingredients(self):
+        """ Test the ingredient arrays follow the ingredients relation. """
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.recipe.ingredients.add(salt)
+
+        self.assertEqual(self.recipe.ingredient_ids, [salt.id])
+        self.assertEqual(self.recipe.ingredient_names, ['Salt'])
+
+        salt.delete()
+        self.recipe.refresh_from_db()
+
+        self.assertEqual(self.recipe.ingredient_ids, [])
+
+    def test_stale_instance_save_keeps_arrays(self):
+        """ Test saving an instance loaded earlier keeps newer arrays. """
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        self.recipe.tags.add(self.vegan)
+
+        stale.title = 'Renamed'
+        stale.save()
+
+        self.assertArrays(self.recipe, [self.vegan.id], ['Vegan'])
+        self.assertEqual(self.recipe.title, 'Renamed')
@@ -0,0 +1,131 @@
+"""
+Test for the slow query recorder.
+"""
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from core import slow_queries
+from core.middleware import QueryStats
+from core.models import Recipe
+from core.slow_queries import SlowQueryRecorder, normalize_sql, write_record
+
+
+class SlowQueryRecorderTests(TestCase):
+    """ Test recording slow queries. """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp_dir.name, 'slow.log')
+        self.settings_override = override_settings(
+            SLOW_QUERY_LOG=self.log_path,
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+
+    def read_log(self):
+        with open(self.log_path) as log_file:
+            return [json.loads(line) for line in log_file]
+
+    def test_records_query_with_call_site(self):
+        """ Test slow queries are logged with the application frame. """
+        recorder = SlowQueryRecorder(0)
+        with connection.execute_wrapper(recorder):
+            Recipe.objects.filter(title='pasta').count()
+
+        records = self.read_log()
+        self.assertEqual(len(records), 1)
+        self.assertIn('core_recipe', records[0]['sql'])
+        self.assertEqual(records[0]['params'], ["'pasta'"])
+        self.assertIn(
+            'core/tests/test_slow_queries.py',
+            records[0]['call_site'],
+        )
+
+    def test_fast_queries_not_recorded(self):
+        """ Test queries under the threshold are ignored. """
+        recorder = SlowQueryRecorder(10000)
+        with connection.execute_wrapper(recorder):
+            Recipe.objects.count()
+
+        self.assertFalse(os.path.exists(self.log_path))
+
+    def test_records_explain_plan(self):
+        """ Test the plan is captured when explain is enabled. """
+        recorder = SlowQueryRecorder(0, explain=True)
+        with connection.execute_wrapper(recorder):
+            list(Recipe.objects.filter(user_id=1))
+
+        records = self.read_log()
+        self.assertEqual(len(records), 1)
+        self.assertIn('core_recipe', records[0]['plan'])
+
+    def test_explain_is_not_counted(self):
+        """ Test the EXPLAIN of a slow query is not a query of the request. """
+        stats = QueryStats()
+        recorder = SlowQueryRecorder(0, explain=True)
+        with connection.execute_wrapper(stats), \
+                connection.execute_wrapper(recorder):
+            list(Recipe.objects.filter(user_id=1))
+            list(Recipe.objects.filter(user_id=2))
+
+        self.assertEqual(stats.count, 2)
+        self.assertEqual(len(self.read_log()), 2)
+
+    def test_one_handler_per_log(self):
+        """ Test threads logging at once share one handler. """
+        path = os.path.join(self.tmp_dir.name, 'threads.log')
+        barrier = threading.Barrier(8)
+        created = []
+        real_handler = slow_queries.RotatingFileHandler
+
+        def handler(*args, **kwargs):
+            created.append(path)
+            return real_handler(*args, **kwargs)
+
+        def log():
+            barrier.wait()
+            write_record({'sql': 'SELECT 1'})
+
+        threads = [threading.Thread(target=log) for _ in range(8)]
+        with override_settings(SLOW_QUERY_LOG=path), \
+                patch.object(slow_queries, 'RotatingFileHandler', handler):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        slow_queries._handlers.pop(path).close()
+
+        self.assertEqual(len(created), 1)
+        with open(path) as log_file:
+            self.assertEqual(len(log_file.readlines()), 8)
+
+    def test_normalize_sql_collapses_in_lists(self):
+        """ Test IN lists of any length normalize to the same query. """
+        self.assertEqual(
+            normalize_sql('SELECT 1 WHERE id IN (%s, %s, %s)'),
+            normalize_sql('SELECT 1 WHERE id IN (%s, %s)'),
+        )
+
+    def test_summary_command(self):
+        """ Test the command lists the recorded queries. """
+        recorder = SlowQueryRecorder(0)
+        with connection.execute_wrapper(recorder):
+            for _ in range(2):
+                Recipe.objects.count()
+
+        out = StringIO()
+        call_command('slow_queries', stdout=out)
+
+        self.assertIn('2 calls', out.getvalue())
+        self.assertIn('core_recipe', out.getvalue())
@@ -0,0 +1,115 @@
+"""
+Test the content addressed image storage.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from core.models import Recipe
+from core.storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTests(TestCase):
+    """ Test images are stored once per content and released safely. """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = Recipe._meta.get_field('image').storage
+        self.user = get_user_model().objects.create_user('user@example.com')
+
+    def create_recipe(self, content=b'image', **params):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+            **params,
+        )
+        recipe.image.save('photo.JPG', ContentFile(content))
+        return Recipe.objects.get(pk=recipe.pk)
+
+    def age(self, name, seconds):
+        then = time.time() - seconds
+        os.utime(self.storage.path(name), (then, then))
+
+    def test_name_is_sharded_content_hash(self):
+        """ Test the stored name is derived from the content. """
+        recipe = self.create_recipe(b'image')
+
+        digest = hashlib.sha256(b'image').hexdigest()
+        self.assertIsInstance(self.storage, ContentAddressedStorage)
+        self.assertEqual(
+            recipe.image.name,
+            f'uploads/recipe/{digest[:2]}/{digest[2:4]}/{digest}.jpg',
+        )
+        with recipe.image.open('rb') as image:
+            self.assertEqual(image.read(), b'image')
+        self.assertEqual(os.listdir(self.storage.path('.incoming')), [])
+
+    def test_duplicates_share_a_file(self):
+        """ Test equal content is stored once and different content not. """
+        first = self.create_recipe(b'same')
+        second = self.create_recipe(b'same')
+        third = self.create_recipe(b'other')
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, third.image.name)
+        directory = os.path.dirname(self.storage.path(first.image.name))
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_reuse_refreshes_mtime(self):
+        """ Test storing existing content protects it from release. """
+        recipe = self.create_recipe(b'same')
+        self.age(recipe.image.name, 7200)
+
+        self.storage.save('uploads/recipe/x.jpg', ContentFile(b'same'))
+
+        self.assertFalse(self.storage.release(recipe.image.name))
+
+    def test_shared_image_kept_until_unused(self):
+        """ Test a deleted recipe only releases images nobody uses. """
+        first = self.create_recipe(b'same')
+        second = self.create_recipe(b'same')
+        name = first.image.name
+        self.age(name, 7200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(self.storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(self.storage.exists(name))
+
+    def test_replaced_image_released(self):
+        """ Test replacing an image releases the old file. """
+        recipe = self.create_recipe(b'old')
+        old_name = recipe.image.name
+        self.age(old_name, 7200)
+
+        # The content is no image, so its variants fail to render.
+        with self.assertLogs('core.variants', 'WARNING'), \
+                self.captureOnCommitCallbacks(execute=True):
+            recipe.image.save('new.jpg', ContentFile(b'new'))
+
+        self.assertFalse(self.storage.exists(old_name))
+        self.assertTrue(self.storage.exists(recipe.image.name))
+
+    def test_recent_image_kept_on_release(self):
+        """ Test files within the grace period are left to gc_media. """
+        recipe = self.create_recipe(b'fresh')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+
+        self.assertTrue(self.storage.exists(recipe.image.name))
@@ -0,0 +1,193 @@
+"""
+Test the token bucket throttling of the API.
+"""
+import os
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status  # type: ignore
+from rest_framework.test import APIClient  # type: ignore
+
+from core.models import Recipe
+from core.throttling import BucketStore, check_throttle_store, parse_rate
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+
+def rest_framework(**rates):
+    return {
+        'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+        'DEFAULT_THROTTLE_CLASSES': ['core.throttling.TokenBucketThrottle'],
+        'DEFAULT_THROTTLE_RATES': rates,
+    }
+
+
+class BucketStoreTests(TestCase):
+    """ Test the shared bucket store. """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'throttle.sqlite3')
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('10/min'), (10, 60))
+        self.assertEqual(parse_rate('5/second'), (5, 1))
+        self.assertEqual(parse_rate('100/day'), (100, 86400))
+
+    def test_burst_then_refill(self):
+        """ Test a full bucket allows a burst and refills at the rate. """
+        store = BucketStore(self.path)
+
+        waits = [store.consume('k', 1, 3, now=100) for _ in range(4)]
+
+        self.assertEqual(waits[:3], [0, 0, 0])
+        self.assertAlmostEqual(waits[3], 1)
+        self.assertAlmostEqual(store.consume('k', 1, 3, now=100.5), 0.5)
+        self.assertEqual(store.consume('k', 1, 3, now=101), 0)
+
+    def test_refill_is_capped(self):
+        """ Test idle buckets hold at most their capacity. """
+        store = BucketStore(self.path)
+        store.consume('k', 1, 2, now=0)
+
+        waits = [store.consume('k', 1, 2, now=1000) for _ in range(3)]
+
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertGreater(waits[2], 0)
+
+    def test_buckets_are_shared(self):
+        """ Test stores on one file see the same buckets. """
+        first, second = BucketStore(self.path), BucketStore(self.path)
+
+        first.consume('k', 1, 1, now=0)
+
+        self.assertGreater(second.consume('k', 1, 1, now=0), 0)
+        self.assertEqual(second.consume('other', 1, 1, now=0), 0)
+
+    def test_prune_drops_idle_buckets(self):
+        store = BucketStore(self.path)
+        store.consume('k', 1, 1, now=0)
+
+        store.prune(now=10 ** 6)
+
+        rows = store.connection.execute('SELECT COUNT(*) FROM bucket')
+        self.assertEqual(rows.fetchone()[0], 0)
+
+
+class ThrottleApiTests(TestCase):
+    """ Test throttled API requests. """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            THROTTLE_DB_PATH=os.path.join(directory.name, 'throttle.sqlite3'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(REST_FRAMEWORK=rest_framework(read='2/min'))
+    def test_reads_are_limited_per_user(self):
+        """ Test a user over the read rate is told when to retry. """
+        for _ in range(2):
+            res = self.client.get(RECIPES_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '30')
+
+        other = get_user_model().objects.create_user('other@example.com')
+        self.client.force_authenticate(other)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(REST_FRAMEWORK=rest_framework(
+        read='1/min', write='1/min', upload='1/min',
+    ))
+    def test_scopes_have_separate_budgets(self):
+        """ Test reads, writes and uploads don't use up each other. """
+        recipe = Recipe.objects.create(
+            user=self.user, title='Sample', time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        upload_url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+        payload = {'title': 'New', 'time_minutes': 5, 'price': '2.00'}
+
+        self.assertEqual(self.client.get(RECIPES_URL).status_code, 200)
+        self.assertEqual(self.client.post(RECIPES_URL, payload).status_code,
+                         status.HTTP_201_CREATED)
+        self.assertEqual(
+            self.client.post(upload_url, {'image': 'x'}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+        self.assertEqual(self.client.get(RECIPES_URL).status_code, 429)
+        self.assertEqual(self.client.post(RECIPES_URL, payload).status_code,
+                         429)
+        self.assertEqual(
+            self.client.post(upload_url, {'image': 'x'}).status_code, 429,
+        )
+
+    @override_settings(REST_FRAMEWORK=rest_framework(token='2/hour'))
+    def test_token_endpoint_is_limited(self):
+        """ Test password guessing on the token endpoint is slowed. """
+        client = APIClient()
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+
+        for _ in range(2):
+            res = client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '1800')
+
+    @override_settings(REST_FRAMEWORK=rest_framework())
+    def test_scopes_without_rate_are_not_limited(self):
+        for _ in range(5):
+            self.assertEqual(self.client.get(RECIPES_URL).status_code, 200)
+
+    @override_settings(REST_FRAMEWORK=rest_framework(read='100/min'))
+    def test_unavailable_store_allows_requests(self):
+        """ Test requests are served when the store can't be opened. """
+        with override_settings(THROTTLE_DB_PATH='/nonexistent/t.sqlite3'), \
+                self.assertLogs('core.throttling', 'WARNING') as logs:
+            for _ in range(3):
+                res = self.client.get(RECIPES_URL)
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(len(logs.records), 1)
+
+    def test_check_unwritable_store(self):
+        """ Test a missing store directory is reported at startup. """
+        self.assertEqual(check_throttle_store(None), [])
+
+        with override_settings(THROTTLE_DB_PATH='/nonexistent/t.sqlite3'):
+            errors = check_throttle_store(None)
+
+        self.assertEqual([error.id for error in errors], ['core.W001'])
+
+    def test_tests_run_without_rate_limits(self):
+        """ Test other tests can't run into the limits of each other. """
+        client = APIClient()
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+
+        for _ in range(15):
+            res = client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,249 @@
+"""
+Test the recipe image variants.
+"""
+import os
+import tempfile
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status  # type: ignore
+from rest_framework.test import APIClient  # type: ignore
+
+from core.media import can_access
+from core.models import Recipe
+from core.variants import source_name, variant_name
+
+
+VARIANTS = {
+    'thumb': {'width': 16, 'height': 16, 'format': 'JPEG', 'quality': 80},
+    'card': {'width': 48, 'format': 'PNG'},
+}
+
+
+def image_file(size=(120, 80), color=(200, 40, 40)):
+    output = BytesIO()
+    Image.new('RGB', size, color).save(output, format='JPEG')
+    return ContentFile(output.getvalue(), name='image.jpg')
+
+
+@override_settings(RECIPE_IMAGE_VARIANTS=VARIANTS)
+class VariantTests(TestCase):
+    """ Test rendering, naming and collecting variants. """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.root = media_root.name
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = get_user_model().objects.create_user('user@example.com')
+
+    def create_recipe(self, **params):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        recipe.image.save('image.jpg', image_file(**params))
+        return recipe
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def backfill(self, *args):
+        out = StringIO()
+        call_command(
+            'backfill_image_variants', *args, stdout=out, stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def test_names(self):
+        """ Test variant names map back to their image. """
+        name = 'uploads/recipe/ab/cd/abcd.jpg'
+        thumb = variant_name(name, 'thumb')
+
+        self.assertRegex(
+            thumb, r'^variants/thumb-[0-9a-f]{8}/uploads/recipe/ab/cd/'
+                   r'abcd\.jpg\.jpg$',
+        )
+        self.assertTrue(variant_name(name, 'card').endswith('abcd.jpg.png'))
+        self.assertEqual(source_name(thumb), name)
+        self.assertIsNone(source_name(name))
+
+    def test_changed_options_get_new_names(self):
+        """ Test changing a variant moves it to a new directory. """
+        name = 'uploads/recipe/a.jpg'
+        before = variant_name(name, 'thumb')
+        changed = dict(VARIANTS, thumb=dict(VARIANTS['thumb'], width=32))
+
+        with override_settings(RECIPE_IMAGE_VARIANTS=changed):
+            self.assertNotEqual(variant_name(name, 'thumb'), before)
+
+    def test_backfill_in_process(self):
+        """ Test variants are rendered within their bounds. """
+        recipe = self.create_recipe()
+
+        out = self.backfill('--workers', '0')
+
+        with Image.open(self.path(variant_name(recipe.image.name, 'thumb'))) \
+                as thumb:
+            self.assertEqual(thumb.format, 'JPEG')
+            self.assertEqual(thumb.size, (16, 11))
+        with Image.open(self.path(variant_name(recipe.image.name, 'card'))) \
+                as card:
+            self.assertEqual(card.format, 'PNG')
+            self.assertEqual(card.size, (48, 32))
+        self.assertIn('wrote 2 variants', out)
+        self.assertIn('images/s', out)
+
+    def test_backfill_with_workers(self):
+        """ Test the pool renders the variants of a shared image once. """
+        recipes = [self.create_recipe(color=(i * 60, 0, 0)) for i in range(3)]
+        self.create_recipe(color=(0, 0, 0))
+
+        out = self.backfill('--workers', '2', '--batch-size', '2')
+
+        for recipe in recipes:
+            for key in VARIANTS:
+                self.assertTrue(os.path.exists(
+                    self.path(variant_name(recipe.image.name, key)),
+                ))
+        self.assertIn('Checked 4 images and wrote 6 variants', out)
+        self.assertFalse(os.path.exists(self.path('.image_variants.json')))
+
+    def test_skips_up_to_date_variants(self):
+        """ Test existing variants are kept unless forced. """
+        recipe = self.create_recipe()
+        self.backfill('--workers', '0')
+        thumb = self.path(variant_name(recipe.image.name, 'thumb'))
+        os.utime(thumb, (0, 0))
+
+        out = self.backfill('--workers', '0')
+
+        self.assertIn('wrote 0 variants', out)
+        self.assertEqual(os.stat(thumb).st_mtime, 0)
+
+        out = self.backfill('--workers', '0', '--force')
+
+        self.assertIn('wrote 2 variants', out)
+        self.assertNotEqual(os.stat(thumb).st_mtime, 0)
+
+    def test_resumes_from_checkpoint(self):
+        """ Test a run continues after the recipe in the checkpoint. """
+        done, pending = self.create_recipe(), self.create_recipe(
+            color=(0, 90, 0),
+        )
+        with open(self.path('.image_variants.json'), 'w') as file:
+            file.write(f'{{"last_pk": {done.pk}, "images": 1}}')
+
+        out = self.backfill('--workers', '0')
+
+        self.assertIn(f'Resuming after recipe {done.pk}', out)
+        self.assertIn('Checked 2 images and wrote 2 variants', out)
+        self.assertFalse(os.path.exists(
+            self.path(variant_name(done.image.name, 'thumb')),
+        ))
+        self.assertTrue(os.path.exists(
+            self.path(variant_name(pending.image.name, 'thumb')),
+        ))
+
+    def test_unreadable_images_are_reported(self):
+        """ Test images that fail to decode don't stop the backfill. """
+        recipe = self.create_recipe()
+        with open(self.path(recipe.image.name), 'wb') as file:
+            file.write(b'not an image')
+
+        out = self.backfill('--workers', '0')
+
+        self.assertIn('1 images could not be read', out)
+
+    def test_upload_renders_variants(self):
+        """ Test an uploaded image gets its variants once committed. """
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = client.post(
+                url, {'image': image_file()}, format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        for key in VARIANTS:
+            name = variant_name(recipe.image.name, key)
+            self.assertTrue(os.path.exists(self.path(name)))
+            self.assertEqual(
+                res.data['variants'][key],
+                f'http://testserver{recipe.image.storage.url(name)}',
+            )
+        with Image.open(self.path(
+            variant_name(recipe.image.name, 'thumb'),
+        )) as thumb:
+            self.assertEqual(thumb.size, (16, 11))
+
+    def test_failed_render_keeps_the_upload(self):
+        """ Test an unreadable image is stored, its variants left out. """
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+
+        with self.assertLogs('core.variants', 'WARNING'), \
+                self.captureOnCommitCallbacks(execute=True):
+            recipe.image.save('image.jpg', ContentFile(b'not an image'))
+
+        self.assertTrue(os.path.exists(self.path(recipe.image.name)))
+        self.assertFalse(os.path.exists(
+            self.path(variant_name(recipe.image.name, 'thumb')),
+        ))
+
+    def test_owner_can_access_variants(self):
+        """ Test variants share the access rules of their image. """
+        recipe = self.create_recipe()
+        thumb = variant_name(recipe.image.name, 'thumb')
+        other = get_user_model().objects.create_user('other@example.com')
+
+        self.assertTrue(can_access(self.user, thumb))
+        self.assertFalse(can_access(other, thumb))
+
+    def test_gc_keeps_current_variants(self):
+        """ Test gc_media deletes variants of gone images or options. """
+        recipe = self.create_recipe()
+        self.backfill('--workers', '0')
+        thumb = self.path(variant_name(recipe.image.name, 'thumb'))
+        orphan = self.path(variant_name('uploads/recipe/gone.jpg', 'thumb'))
+        outdated = self.path(
+            f'variants/thumb-00000000/{recipe.image.name}.jpg',
+        )
+        for path in (orphan, outdated):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'wb').close()
+        then = time.time() - 7200
+        for path in (thumb, orphan, outdated):
+            os.utime(path, (then, then))
+
+        call_command('gc_media', '--grace', '3600', stdout=StringIO())
+
+        self.assertTrue(os.path.exists(thumb))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(outdated))
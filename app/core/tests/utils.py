@@ -0,0 +1,47 @@
+"""
+Helpers shared by the test suites.
+"""
+import re
+from collections import Counter
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+NUMBER_RE = re.compile(r'\b\d+\b')
+
+QUERY_COUNT_SIZES = (1, 10, 100)
+
+
+class QueryCountMixin:
+    """ Assert that the queries run by a request do not grow with data. """
+
+    def assertConstantQueries(self, setup, request,
+                              sizes=QUERY_COUNT_SIZES):
+        """
+        Call setup(size) then request(data) for every size.
+
+        Only the queries run by request are counted. On failure the
+        queries of the largest size are listed, grouped by shape.
+        """
+        captured = {}
+        for size in sizes:
+            data = setup(size)
+            with CaptureQueriesContext(connection) as queries:
+                request(data)
+            captured[size] = [query['sql'] for query in queries]
+
+        counts = {size: len(sqls) for size, sqls in captured.items()}
+        if len(set(counts.values())) == 1:
+            return
+
+        shapes = Counter(
+            NUMBER_RE.sub('N', sql) for sql in captured[sizes[-1]]
+        )
+        lines = [
+            f'{count} x {sql}' for sql, count in shapes.most_common()
+        ]
+        self.fail(
+            f'Query count grows with data size {counts}. '
+            f'Queries at size {sizes[-1]}:\n' + '\n'.join(lines)
+        )
@@ -0,0 +1,196 @@
+"""
+Token bucket rate limiting of the API.
+
+Each user has a bucket per scope: read, write, upload and token. A
+bucket holds as many requests as its rate allows per period and refills
+continuously, so clients may burst and are then held to the average.
+Buckets live in an SQLite file in /dev/shm that the worker processes of
+a node share. A check is one short local write transaction, there is no
+network round trip. Limits are per node, behind a load balancer a client
+gets at most the rate times the number of nodes.
+"""
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+
+from rest_framework.permissions import SAFE_METHODS  # type: ignore
+from rest_framework.settings import api_settings  # type: ignore
+from rest_framework.throttling import BaseThrottle  # type: ignore
+
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# A bucket left alone for the longest period is full, which is the same
+# as having no row, so such rows are deleted now and then.
+IDLE_SECONDS = PERIODS['d']
+PRUNE_EVERY = 1000
+
+
+def parse_rate(rate):
+    """ Return (requests, seconds) of a rate like '100/min'. """
+    requests, period = rate.split('/')
+    return int(requests), PERIODS[period[0]]
+
+
+class BucketStore:
+    """ Token buckets in an SQLite file shared between processes. """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.calls = 0
+        self.failed = False
+
+    @property
+    def connection(self):
+        # SQLite connections must not cross threads or a fork.
+        if getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=1, isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            # The file lives in memory, syncing it buys nothing.
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                'updated REAL NOT NULL) WITHOUT ROWID'
+            )
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def consume(self, key, rate, capacity, now=None):
+        """
+        Take a token from the bucket key.
+
+        The bucket holds up to capacity tokens and gains rate tokens a
+        second. Returns 0 when a token was taken, otherwise the seconds
+        until the next one.
+        """
+        now = time.time() if now is None else now
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT tokens, updated FROM bucket WHERE key = ?', (key,),
+            ).fetchone()
+            if row is None:
+                tokens = capacity
+            else:
+                tokens = min(
+                    capacity, row[0] + max(0.0, now - row[1]) * rate,
+                )
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            connection.execute(
+                'INSERT OR REPLACE INTO bucket (key, tokens, updated) '
+                'VALUES (?, ?, ?)',
+                (key, tokens, now),
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        self.calls += 1
+        if self.calls % PRUNE_EVERY == 0:
+            self.prune(now)
+        return wait
+
+    def prune(self, now):
+        self.connection.execute(
+            'DELETE FROM bucket WHERE updated < ?', (now - IDLE_SECONDS,),
+        )
+
+    def clear(self):
+        self.connection.execute('DELETE FROM bucket')
+
+
+stores = {}
+
+
+def bucket_store():
+    path = settings.THROTTLE_DB_PATH
+    if path not in stores:
+        stores[path] = BucketStore(path)
+    return stores[path]
+
+
+@checks.register()
+def check_throttle_store(app_configs, **kwargs):
+    """ Warn when the bucket store can't be created. """
+    directory = os.path.dirname(settings.THROTTLE_DB_PATH) or '.'
+    if os.access(directory, os.W_OK):
+        return []
+    return [checks.Warning(
+        f'The directory of THROTTLE_DB_PATH, {directory}, is not writable. '
+        'The API will not be rate limited.',
+        hint='Point THROTTLE_DB_PATH at a writable directory, preferably '
+             'on a tmpfs like /dev/shm.',
+        id='core.W001',
+    )]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle requests by user and scope with a token bucket.
+
+    The scope is the throttle_scope of the view, or else read for safe
+    methods and write for the others. Rates come from
+    DEFAULT_THROTTLE_RATES, scopes without one are not limited.
+    Anonymous requests are keyed by client address.
+    """
+
+    wait_seconds = 0.0
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        return 'read' if request.method in SAFE_METHODS else 'write'
+
+    def get_key(self, request, scope):
+        if request.user and request.user.is_authenticated:
+            return f'{scope}:user:{request.user.pk}'
+        return f'{scope}:ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        requests, seconds = parse_rate(rate)
+        store = bucket_store()
+        try:
+            self.wait_seconds = store.consume(
+                self.get_key(request, scope), requests / seconds, requests,
+            )
+        except sqlite3.Error:
+            # Serving without limits beats failing every request. Warn
+            # once per process rather than on every request.
+            if not store.failed:
+                store.failed = True
+                logger.warning(
+                    'Throttle store %s unavailable, requests are not '
+                    'rate limited', store.path, exc_info=True,
+                )
+            return True
+        if store.failed:
+            store.failed = False
+            logger.warning('Throttle store %s available again', store.path)
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return math.ceil(self.wait_seconds)
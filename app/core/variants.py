@@ -0,0 +1,157 @@
+"""
+Resized variants of recipe images.
+
+Each variant in RECIPE_IMAGE_VARIANTS is stored next to the images under
+variants/<key>-<fingerprint>/<image name>.<ext>. The fingerprint is a
+hash of the variant options, so changing a size writes the variants to
+a new directory and the old ones become orphans for gc_media. A variant
+is up to date when its file exists, no database column tracks it.
+
+Variants of a new image are rendered once the save storing it commits,
+see core.signals. backfill_image_variants renders those of older images
+and any a failed render left out.
+"""
+import hashlib
+import io
+import json
+import logging
+import posixpath
+
+from PIL import Image, ImageOps
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from core.models import Recipe
+
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+
+
+def image_storage():
+    return Recipe._meta.get_field('image').storage
+
+
+def variant_dir(key, spec):
+    fingerprint = hashlib.sha1(
+        json.dumps(spec, sort_keys=True).encode(),
+    ).hexdigest()[:8]
+    return f'{key}-{fingerprint}'
+
+
+def variant_dirs():
+    """ Return the directory of every configured variant by key. """
+    return {
+        key: variant_dir(key, spec)
+        for key, spec in settings.RECIPE_IMAGE_VARIANTS.items()
+    }
+
+
+def variant_name(name, key):
+    """ Return the storage name of the key variant of image name. """
+    spec = settings.RECIPE_IMAGE_VARIANTS[key]
+    ext = EXTENSIONS[spec['format']]
+    return posixpath.join(VARIANTS_DIR, variant_dir(key, spec), name + ext)
+
+
+def variant_urls(name):
+    """ Return the URL of every configured variant of image name by key. """
+    storage = image_storage()
+    return {
+        key: storage.url(variant_name(name, key))
+        for key in settings.RECIPE_IMAGE_VARIANTS
+    }
+
+
+def source_name(name):
+    """ Return the image name a variant was made from, or None. """
+    parts = name.split('/', 2)
+    if len(parts) < 3 or parts[0] != VARIANTS_DIR:
+        return None
+    source = posixpath.splitext(parts[2])[0]
+    return source if posixpath.splitext(source)[1] else None
+
+
+def is_current(name):
+    """ Return whether a variant name belongs to a configured variant. """
+    return name.split('/', 2)[1] in variant_dirs().values()
+
+
+def render(image, spec):
+    """ Return the encoded variant of a decoded Pillow image. """
+    variant = image.copy()
+    variant.thumbnail(
+        (spec['width'], spec.get('height', spec['width'])),
+        Image.LANCZOS,
+    )
+    output = io.BytesIO()
+    variant.save(
+        output,
+        format=spec['format'],
+        quality=spec.get('quality', 85),
+        optimize=True,
+    )
+    return ContentFile(output.getvalue())
+
+
+def render_variants(name, force=False):
+    """
+    Store the missing variants of image name.
+
+    Returns (name, number of variants written, error). The image is
+    decoded once for all variants, and not at all when every variant
+    exists already. Runs in worker processes, so it only uses storage.
+    """
+    storage = image_storage()
+    specs = settings.RECIPE_IMAGE_VARIANTS
+    missing = {
+        key: variant_name(name, key) for key in specs
+        if force or not storage.exists(variant_name(name, key))
+    }
+    if not missing:
+        return name, 0, None
+
+    try:
+        with storage.open(name, 'rb') as file, Image.open(file) as image:
+            # Let JPEG decode at the scale of the largest variant.
+            image.draft('RGB', (
+                max(specs[key]['width'] for key in missing),
+                max(specs[key].get('height', specs[key]['width'])
+                    for key in missing),
+            ))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            for key, variant in missing.items():
+                storage.save_named(variant, render(image, specs[key]))
+    except (OSError, Image.DecompressionBombError) as error:
+        return name, 0, str(error)
+
+    return name, len(missing), None
+
+
+def render_new_image(name):
+    """ Render the variants of a newly stored image, logging failures. """
+    try:
+        name, written, error = render_variants(name)
+    except Exception:
+        # The image is committed, the backfill can render them later.
+        logger.exception('Rendering the variants of %s failed', name)
+        return
+    if error:
+        logger.warning('Rendering the variants of %s failed: %s', name, error)
+
+
+def init_worker():
+    """
+    Prepare a forked worker process.
+
+    Network clients of the parent must not be shared. Database
+    connections are left alone, closing them would end the parent's
+    sessions, and workers never query.
+    """
+    reset = getattr(image_storage(), 'reset_connections', None)
+    if reset is not None:
+        reset()
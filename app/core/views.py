@@ -0,0 +1,124 @@
+"""
+Views for operational endpoints.
+"""
+import hmac
+import ipaddress
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.views.decorators.http import require_safe
+
+from core import media, metrics
+
+
+def can_scrape(request):
+    """
+    Return whether request may read the metrics.
+
+    Allowed are clients in METRICS_ALLOWED_NETWORKS, requests with the
+    bearer METRICS_TOKEN and staff users.
+    """
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        address = None
+    if address is not None and any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.METRICS_ALLOWED_NETWORKS
+    ):
+        return True
+
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    expected = f'Bearer {token}'.encode()
+    if token and hmac.compare_digest(header.encode(), expected):
+        return True
+
+    return media.request_user(request).is_staff
+
+
+def metrics_view(request):
+    """ Expose Prometheus metrics to scrapers and staff. """
+    if not can_scrape(request):
+        return HttpResponseForbidden()
+    body, content_type = metrics.render()
+    return HttpResponse(body, content_type=content_type)
+
+
+def healthz(request):
+    """ Liveness: the process is serving requests. Touches nothing else. """
+    return JsonResponse({'status': 'ok'})
+
+
+class ReadinessCheck:
+    """
+    Check the database answers and has every migration applied.
+
+    Results are cached for HEALTH_CHECK_CACHE_SECONDS so frequent probes
+    from several orchestrators cost one check per process per period.
+    Migrations only need checking until they are found applied once.
+    """
+
+    def __init__(self, alias=DEFAULT_DB_ALIAS):
+        self.alias = alias
+        self.lock = threading.Lock()
+        self.result = None
+        self.expires = 0.0
+        self.migrated = False
+
+    def __call__(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.result is None or now >= self.expires:
+                self.result = self.check()
+                self.expires = now + settings.HEALTH_CHECK_CACHE_SECONDS
+            return self.result
+
+    def reset(self):
+        with self.lock:
+            self.result = None
+            self.migrated = False
+
+    def check(self):
+        connection = connections[self.alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not self.migrated:
+                executor = MigrationExecutor(connection)
+                plan = executor.migration_plan(
+                    executor.loader.graph.leaf_nodes()
+                )
+                if plan:
+                    return {
+                        'status': 'unavailable',
+                        'database': 'ok',
+                        'migrations': f'{len(plan)} unapplied',
+                    }
+                self.migrated = True
+        except DatabaseError as error:
+            # Drop the broken connection so the next check reconnects.
+            connection.close()
+            return {'status': 'unavailable', 'database': str(error)}
+
+        return {'status': 'ok', 'database': 'ok', 'migrations': 'ok'}
+
+
+readiness = ReadinessCheck()
+
+
+def readyz(request):
+    """ Readiness: the database is reachable and migrated. """
+    result = readiness()
+    status = 200 if result['status'] == 'ok' else 503
+    return JsonResponse(result, status=status)
+
+
+@require_safe
+def media_view(request, path):
+    """ Serve an uploaded file to the owner of its recipe. """
+    return media.serve_media(request, path)
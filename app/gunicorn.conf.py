@@ -0,0 +1,14 @@
+"""
+Gunicorn settings, read from the working directory by
+"gunicorn app.wsgi".
+
+Set PROMETHEUS_MULTIPROC_DIR to an empty directory for the metrics of
+all workers, see core.metrics.
+"""
+
+
+def child_exit(server, worker):
+    """ Drop the metrics of a worker that exited. """
+    from core import metrics
+
+    metrics.worker_exited(worker.pid)
@@ -0,0 +1,90 @@
+"""
+Materialized recipe documents.
+
+Each recipe stores the RecipeDetailSerializer payload in
+Recipe.document so reads can return it without serializing. The
+document is rebuilt in the transaction of every write that changes it,
+see core.signals. Image URLs are stored relative to the site and made
+absolute when served.
+
+Reads never store documents. A recipe whose document is empty, e.g.
+after a migration changed the payload, is serialized for each read
+until backfill_documents stores it.
+"""
+from core.models import Recipe
+from recipe.serializers import RecipeDetailSerializer
+
+
+LIST_EXCLUDED_FIELDS = ('description',)
+
+
+def build_document(recipe):
+    """ Return the detail payload of recipe as plain JSON data. """
+    return dict(RecipeDetailSerializer(recipe).data)
+
+
+def refresh_documents(recipes, batch_size=500):
+    """
+    Rebuild and store the documents of the given recipes.
+
+    recipes may be a queryset or a list of up to date instances.
+    Returns the new documents by recipe id.
+    """
+    documents = {}
+    batch = []
+    for recipe in recipes:
+        batch.append(recipe)
+        if len(batch) == batch_size:
+            documents.update(store_documents(batch))
+            batch = []
+    if batch:
+        documents.update(store_documents(batch))
+
+    return documents
+
+
+def build_documents(recipes):
+    """ Return the detail payloads of recipes in order. """
+    # One list serializer builds its fields once for the whole batch.
+    data = RecipeDetailSerializer(recipes, many=True).data
+    return [dict(document) for document in data]
+
+
+def store_documents(recipes):
+    for recipe, document in zip(recipes, build_documents(recipes)):
+        recipe.document = document
+    Recipe.objects.bulk_update(recipes, ['document'])
+
+    return {recipe.pk: recipe.document for recipe in recipes}
+
+
+def load_documents(rows):
+    """
+    Return the documents of (pk, document) rows in order.
+
+    Empty documents are built without storing them, so a read never
+    writes. backfill_documents stores them.
+    """
+    rows = list(rows)
+    missing = [pk for pk, document in rows if not document]
+    if missing:
+        recipes = list(Recipe.objects.filter(pk__in=missing))
+        built = {
+            recipe.pk: document
+            for recipe, document in zip(recipes, build_documents(recipes))
+        }
+        rows = [(pk, document or built[pk]) for pk, document in rows]
+
+    return [document for pk, document in rows]
+
+
+def serve_document(document, request, list_view=False):
+    """ Prepare a stored document for a response to request. """
+    document = dict(document)
+    if list_view:
+        for field in LIST_EXCLUDED_FIELDS:
+            document.pop(field, None)
+    if document.get('image'):
+        document['image'] = request.build_absolute_uri(document['image'])
+
+    return document
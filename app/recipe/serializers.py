@@ -2,8 +2,32 @@
  Serializer for recipe APIs. 
 """
 
+import base64
+
+from django.conf import settings
+from django.db import transaction
+
 from rest_framework import serializers # type: ignore
-from core.models import Recipe, Tag, Ingredient
+from drf_spectacular.utils import extend_schema_field  # type: ignore
+
+from core.images import (
+    EMPTY_IMAGE_METADATA,
+    IMAGE_METADATA_FIELDS,
+    set_image_metadata,
+)
+from core.models import Recipe, Tag, Ingredient, RECIPE_IMAGE_DIR
+from core.storage import parse_content_name
+from core.variants import variant_urls
+
+
+# Image types accepted for direct uploads and the extension stored.
+IMAGE_CONTENT_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+IMAGE_FORMATS = {'.jpg': 'jpeg', '.png': 'png', '.gif': 'gif', '.webp': 'webp'}
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -23,46 +47,85 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
         read_only_fields = ['id']
 
+
+class DenormalizedListSerializer(serializers.ListSerializer):
+    """
+    Read a to many relation from the id and name arrays on the recipe.
+
+    Writes still validate through the child serializer as usual.
+    """
+
+    def __init__(self, *args, ids_field, names_field, **kwargs):
+        self.ids_field = ids_field
+        self.names_field = names_field
+        super().__init__(*args, **kwargs)
+
+    def get_attribute(self, instance):
+        return [
+            {'id': pk, 'name': name}
+            for pk, name in zip(
+                getattr(instance, self.ids_field),
+                getattr(instance, self.names_field),
+            )
+        ]
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """ Serializer for recipe. """
-    tags = TagSerializer(many=True, required = False)
-    ingredients = IngredientSerializer(many=True, required = False)
+    tags = DenormalizedListSerializer(
+        child=TagSerializer(),
+        ids_field='tag_ids',
+        names_field='tag_names',
+        required=False,
+    )
+    ingredients = DenormalizedListSerializer(
+        child=IngredientSerializer(),
+        ids_field='ingredient_ids',
+        names_field='ingredient_names',
+        required=False,
+    )
 
 
     class Meta:
         model = Recipe
         fields = [
                 'id', 'title', 'time_minutes', 'price', 'link', 'tags', 
-                'ingredients','image'
+                'ingredients','image', 'image_width', 'image_height',
+                'image_size', 'image_format', 'image_placeholder',
                  ]
         read_only_fields = ['id']
 
 
-    def _get_tag_or_create(self, tags, recipe):
-        """ handle getting or creating tags as needed. """
+    def _get_or_create_named(self, model, items):
+        """ Return objects for the named items, creating missing ones. """
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user = auth_user,
-                **tag
-            )
+        names = list(dict.fromkeys(item['name'] for item in items))
+        existing = {
+            obj.name: obj
+            for obj in model.objects.filter(user=auth_user, name__in=names)
+        }
+        created = model.objects.bulk_create([
+            model(user=auth_user, name=name)
+            for name in names if name not in existing
+        ])
+
+        return list(existing.values()) + created
 
-            recipe.tags.add(tag_obj)
+
+    def _get_tag_or_create(self, tags, recipe):
+        """ handle getting or creating tags as needed. """
+        recipe.tags.add(*self._get_or_create_named(Tag, tags))
 
 
     def _get_Ingredient_or_create(self, ingredients, recipe):
         """ handle getting or creating ingredients as needed. """
-        auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user = auth_user,
-                **ingredient
-            )
-
-            recipe.ingredients.add(ingredient_obj)
+        recipe.ingredients.add(
+            *self._get_or_create_named(Ingredient, ingredients)
+        )
 
 
 
+    @transaction.atomic
     def create(self, validated_data):
         """ create a recipe override. """
         tags = validated_data.pop('tags', [])
@@ -73,6 +136,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         return recipe
     
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """ update a recipe override. """
         tags = validated_data.pop('tags', None)
@@ -106,17 +170,92 @@ class RecipeDetailSerializer(RecipeSerializer):
 
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin(serializers.Serializer):
+    """ Add the URLs of the resized variants of the image. """
+    variants = serializers.SerializerMethodField()
+
+    @extend_schema_field(serializers.DictField(child=serializers.URLField()))
+    def get_variants(self, recipe):
+        """ Return the variant URLs, rendered once the upload commits. """
+        if not recipe.image:
+            return {}
+        request = self.context.get('request')
+        return {
+            key: request.build_absolute_uri(url) if request else url
+            for key, url in variant_urls(recipe.image.name).items()
+        }
+
+
+class RecipeImageSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     """ serializer for uploading an image to recipes. """
 
     class Meta:
         model = Recipe
-        fields = ['id', 'image']
+        fields = ['id', 'image', *IMAGE_METADATA_FIELDS, 'variants']
         read_only_fields =['id']
         extra_kwargs = {'image': {'required': 'True'}}
-        
+
+    def update(self, instance, validated_data):
+        """ Store the image together with its metadata. """
+        instance.image = validated_data['image']
+        set_image_metadata(instance)
+        return super().update(instance, validated_data)
 
 
+class RecipeImageUploadURLSerializer(serializers.Serializer):
+    """ serializer requesting a direct upload of a recipe image. """
+    sha256 = serializers.RegexField(
+        r'^[0-9a-f]{64}$',
+        help_text='Hex SHA-256 digest of the image.',
+    )
+    content_type = serializers.ChoiceField(choices=list(IMAGE_CONTENT_TYPES))
 
 
-        
\ No newline at end of file
+class RecipeImageKeySerializer(ImageVariantsMixin,
+                               serializers.ModelSerializer):
+    """ serializer confirming an image uploaded straight to storage. """
+    key = serializers.CharField(write_only=True)
+
+    class Meta:
+        model = Recipe
+        fields = ['id', 'key', 'image', *IMAGE_METADATA_FIELDS, 'variants']
+        read_only_fields = ['id', 'image']
+
+    def validate_key(self, key):
+        """ Check the key names an uploaded recipe image. """
+        storage = Recipe._meta.get_field('image').storage
+        if not storage.supports_direct_upload:
+            raise serializers.ValidationError(
+                'Direct uploads need object storage.'
+            )
+        parsed = parse_content_name(key)
+        if parsed is None or parsed[0] != RECIPE_IMAGE_DIR \
+                or parsed[2] not in IMAGE_FORMATS:
+            raise serializers.ValidationError('Not a recipe image key.')
+
+        head = storage.head(key)
+        if head is None:
+            raise serializers.ValidationError('Nothing was uploaded yet.')
+        checksum = head.get('ChecksumSHA256')
+        if checksum and base64.b64decode(checksum).hex() != parsed[1]:
+            raise serializers.ValidationError('Checksum does not match.')
+        if head['ContentLength'] > settings.RECIPE_IMAGE_MAX_BYTES:
+            raise serializers.ValidationError('Image is too large.')
+        self.uploaded_size = head['ContentLength']
+        return key
+
+    def update(self, instance, validated_data):
+        """
+        Point the recipe at the uploaded object.
+
+        Reading dimensions and the placeholder would download the image,
+        backfill_image_metadata fills them in later.
+        """
+        key = validated_data['key']
+        instance.image.name = key
+        for field, value in EMPTY_IMAGE_METADATA.items():
+            setattr(instance, field, value)
+        instance.image_size = self.uploaded_size
+        instance.image_format = IMAGE_FORMATS[parse_content_name(key)[2]]
+        instance.save()
+        return instance
@@ -0,0 +1,202 @@
+"""
+Test storing recipe images in object storage with direct uploads.
+"""
+import hashlib
+import io
+from decimal import Decimal
+from unittest.mock import patch
+
+import boto3  # type: ignore
+import requests  # type: ignore
+from moto import mock_aws  # type: ignore
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status  # type: ignore
+from rest_framework.test import APIClient  # type: ignore
+
+from core.models import Recipe
+from core.object_storage import ContentAddressedS3Storage
+
+
+def upload_url_url(recipe_id):
+    return reverse('recipe:recipe-upload-url', args=[recipe_id])
+
+
+def image_upload_url(recipe_id):
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def jpeg_bytes():
+    output = io.BytesIO()
+    Image.new('RGB', (10, 10), (0, 128, 0)).save(output, format='JPEG')
+    return output.getvalue()
+
+
+class DirectUploadTests(TestCase):
+    """ Test the presigned upload flow against a stand-in S3. """
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        credentials = {
+            'region_name': 'us-east-1',
+            'aws_access_key_id': 'testing',
+            'aws_secret_access_key': 'testing',
+        }
+        boto3.client('s3', **credentials).create_bucket(Bucket='recipes')
+        self.storage = ContentAddressedS3Storage(
+            bucket_name='recipes',
+            region_name='us-east-1',
+            access_key='testing',
+            secret_key='testing',
+        )
+        storage_patch = patch.object(
+            Recipe._meta.get_field('image'), 'storage', self.storage,
+        )
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+        self.user = get_user_model().objects.create_user('user@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        self.content = jpeg_bytes()
+        self.digest = hashlib.sha256(self.content).hexdigest()
+
+    def request_upload(self):
+        return self.client.post(upload_url_url(self.recipe.id), {
+            'sha256': self.digest, 'content_type': 'image/jpeg',
+        })
+
+    def test_direct_upload(self):
+        """ Test a client uploads to storage and confirms the key. """
+        res = self.request_upload()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(res.data['exists'])
+        key = res.data['key']
+        self.assertEqual(
+            key,
+            f'uploads/recipe/{self.digest[:2]}/{self.digest[2:4]}/'
+            f'{self.digest}.jpg',
+        )
+        self.assertIn('x-amz-checksum-sha256', res.data['headers'])
+        put = requests.put(
+            res.data['url'], data=self.content, headers=res.data['headers'],
+        )
+        self.assertEqual(put.status_code, 200)
+
+        res = self.client.post(
+            image_upload_url(self.recipe.id), {'key': key}, format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_size'], len(self.content))
+        self.assertEqual(res.data['image_format'], 'jpeg')
+        self.assertEqual(
+            res.data['image'], f'http://testserver/static/media/{key}',
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, key)
+        self.assertEqual(self.recipe.document['image_size'], len(self.content))
+
+    def test_existing_content_needs_no_upload(self):
+        """ Test content already in storage is reused. """
+        name = self.storage.save('uploads/recipe/a.jpg', ContentFile(
+            self.content,
+        ))
+
+        res = self.request_upload()
+
+        self.assertEqual(res.data, {'key': name, 'exists': True})
+
+    def test_confirm_rejects_bad_keys(self):
+        """ Test only uploaded recipe image keys are accepted. """
+        missing = f'uploads/recipe/{self.digest[:2]}/{self.digest[2:4]}/' \
+            f'{self.digest}.jpg'
+        for key in (missing, 'uploads/recipe/../../etc/passwd',
+                    f'other/{self.digest[:2]}/{self.digest[2:4]}/'
+                    f'{self.digest}.jpg'):
+            res = self.client.post(
+                image_upload_url(self.recipe.id), {'key': key}, format='json',
+            )
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_IMAGE_MAX_BYTES=10)
+    def test_confirm_rejects_large_images(self):
+        """ Test objects over the size limit are refused. """
+        name = self.storage.save('uploads/recipe/a.jpg', ContentFile(
+            self.content,
+        ))
+
+        res = self.client.post(
+            image_upload_url(self.recipe.id), {'key': name}, format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_through_app_is_deduplicated(self):
+        """ Test multipart uploads land in the bucket once per content. """
+        first = self.storage.save('uploads/recipe/a.jpg', ContentFile(
+            self.content,
+        ))
+        second = self.storage.save('uploads/recipe/b.JPG', ContentFile(
+            self.content,
+        ))
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(list(self.storage.bucket.objects.all())), 1)
+
+    def test_release_keeps_recent_objects(self):
+        """ Test objects within the grace period survive release. """
+        name = self.storage.save('uploads/recipe/a.jpg', ContentFile(
+            self.content,
+        ))
+
+        self.assertFalse(self.storage.release(name))
+        self.assertTrue(self.storage.release(name, grace_seconds=0))
+        self.assertFalse(self.storage.exists(name))
+
+    def test_media_view_redirects(self):
+        """ Test owners are sent to a presigned URL of the object. """
+        self.recipe.image.name = self.storage.save(
+            'uploads/recipe/a.jpg', ContentFile(self.content),
+        )
+        self.recipe.save()
+        self.client.force_login(self.user)
+
+        res = self.client.get(self.recipe.image.url)
+
+        self.assertEqual(res.status_code, status.HTTP_302_FOUND)
+        self.assertIn('X-Amz-Signature', res['Location'])
+        self.assertEqual(requests.get(res['Location']).content, self.content)
+
+
+class DirectUploadUnsupportedTests(TestCase):
+    """ Test direct uploads are refused with file system storage. """
+
+    def test_upload_url_needs_object_storage(self):
+        user = get_user_model().objects.create_user('user@example.com')
+        recipe = Recipe.objects.create(
+            user=user, title='Sample', time_minutes=5, price=Decimal('1.00'),
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.post(upload_url_url(recipe.id), {
+            'sha256': '0' * 64, 'content_type': 'image/jpeg',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,190 @@
+"""
+Test the materialized recipe documents.
+"""
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status  # type: ignore
+from rest_framework.test import APIClient  # type: ignore
+
+from core.models import Recipe, Tag
+from recipe.documents import build_document
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 5,
+        'price': Decimal('5.50'),
+        'description': 'Sample description',
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeDocumentTests(TestCase):
+    """ Test recipe documents are kept up to date and served. """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('user@example.com')
+        self.client.force_authenticate(self.user)
+
+    def assertDocumentCurrent(self, recipe):
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.document, build_document(recipe))
+
+    def test_create_and_update_store_document(self):
+        """ Test writes through the API store the detail payload. """
+        payload = {
+            'title': 'Curry',
+            'time_minutes': 30,
+            'price': '7.25',
+            'tags': [{'name': 'Dinner'}],
+            'ingredients': [{'name': 'Rice'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(pk=res.data['id'])
+
+        self.assertEqual(recipe.document, res.data)
+
+        res = self.client.patch(
+            detail_url(recipe.id), {'tags': [{'name': 'Lunch'}]},
+            format='json',
+        )
+
+        self.assertDocumentCurrent(recipe)
+        self.assertEqual(recipe.document['tags'][0]['name'], 'Lunch')
+
+    def test_tag_rename_updates_document(self):
+        """ Test renaming a tag through the tag API updates recipes. """
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+
+        res = self.client.patch(
+            reverse('recipe:tag-detail', args=[tag.id]), {'name': 'Plant'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertDocumentCurrent(recipe)
+        self.assertEqual(
+            recipe.document['tags'], [{'id': tag.id, 'name': 'Plant'}],
+        )
+
+    def test_image_upload_updates_document(self):
+        """ Test uploading an image stores its relative URL. """
+        recipe = create_recipe(self.user)
+        url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            res = self.client.post(
+                url, {'image': image_file}, format='multipart',
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_width'], 10)
+        self.assertEqual(res.data['image_format'], 'jpeg')
+        recipe.refresh_from_db()
+        self.addCleanup(recipe.image.delete)
+
+        self.assertEqual(recipe.document['image'], recipe.image.url)
+        self.assertEqual(
+            recipe.document['image_placeholder'], recipe.image_placeholder,
+        )
+        res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(
+            res.data['image'], f'http://testserver{recipe.image.url}',
+        )
+
+    def test_retrieve_is_one_query(self):
+        """ Test the detail read is a single lookup. """
+        recipe = create_recipe(self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        with self.assertNumQueries(1):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.data, build_document(recipe))
+
+    def test_list_serves_documents(self):
+        """ Test listing returns documents without the description. """
+        recipe = create_recipe(self.user)
+
+        res = self.client.get(RECIPES_URL)
+
+        expected = build_document(recipe)
+        del expected['description']
+        self.assertEqual(res.data, [expected])
+
+    def test_missing_document_is_built_on_read(self):
+        """ Test recipes without a stored document read fine unstored. """
+        recipe = create_recipe(self.user)
+        Recipe.objects.filter(pk=recipe.pk).update(document={})
+
+        res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(res.data, build_document(recipe))
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data[0]['title'], recipe.title)
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.document, {})
+
+    def test_backfill_documents(self):
+        """ Test the command stores the missing documents. """
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        Recipe.objects.filter(pk__in=[r.pk for r in recipes[:2]]).update(
+            document={},
+        )
+        out = StringIO()
+
+        call_command('backfill_documents', '--batch-size', '1', stdout=out)
+
+        for recipe in recipes:
+            self.assertDocumentCurrent(recipe)
+        self.assertIn('Stored 2 documents in', out.getvalue())
+
+    def test_failed_refresh_rolls_back_the_rename(self):
+        """ Test a rename isn't committed without its recipe refresh. """
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        url = reverse('recipe:tag-detail', args=[tag.id])
+
+        with patch(
+            'core.signals.refresh_documents', side_effect=RuntimeError,
+        ), self.assertRaises(RuntimeError):
+            self.client.patch(url, {'name': 'Plant'})
+
+        tag.refresh_from_db()
+        recipe.refresh_from_db()
+        self.assertEqual(tag.name, 'Vegan')
+        self.assertEqual(recipe.tag_names, ['Vegan'])
+        self.assertDocumentCurrent(recipe)
+
+    def test_retrieve_other_users_recipe_not_found(self):
+        """ Test documents of other users are not served. """
+        other = get_user_model().objects.create_user('other@example.com')
+        recipe = create_recipe(other)
+
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
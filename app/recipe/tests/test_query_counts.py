@@ -0,0 +1,335 @@
+"""
+Test the recipe API runs a constant number of queries as data grows.
+"""
+import tempfile
+from decimal import Decimal
+from itertools import count
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status  # type: ignore
+from rest_framework.test import APIClient  # type: ignore
+
+from core.models import Recipe, Tag, Ingredient
+from core.tests.utils import QueryCountMixin
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+user_numbers = count()
+
+
+def recipe_detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def image_upload_url(recipe_id):
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def create_user():
+    """ Create and return a new user. """
+    return get_user_model().objects.create_user(
+        email=f'user{next(user_numbers)}@example.com',
+    )
+
+
+def create_recipe(user, tags=0, ingredients=0):
+    """ Create a recipe with the given number of tags and ingredients. """
+    recipe = Recipe.objects.create(
+        user=user,
+        title='sample recipe name',
+        time_minutes=5,
+        price=Decimal('1.5'),
+    )
+    recipe.tags.add(*Tag.objects.bulk_create(
+        Tag(user=user, name=f'tag {i}') for i in range(tags)
+    ))
+    recipe.ingredients.add(*Ingredient.objects.bulk_create(
+        Ingredient(user=user, name=f'ingredient {i}')
+        for i in range(ingredients)
+    ))
+    return recipe
+
+
+def recipe_payload(size, prefix='new'):
+    return {
+        'title': 'sample recipe name',
+        'time_minutes': 5,
+        'price': Decimal('1.5'),
+        'tags': [{'name': f'{prefix} tag {i}'} for i in range(size)],
+        'ingredients': [
+            {'name': f'{prefix} ingredient {i}'} for i in range(size)
+        ],
+    }
+
+
+class RecipeQueryCountTests(QueryCountMixin, TestCase):
+    """ Test query counts of the recipe endpoints. """
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def authenticated_user(self):
+        user = create_user()
+        self.client.force_authenticate(user)
+        return user
+
+    def assertStatus(self, res, expected):
+        self.assertEqual(res.status_code, expected, res.content)
+
+    def test_list_recipes(self):
+        """ Test listing recipes with tags and ingredients. """
+        def setup(size):
+            user = self.authenticated_user()
+            for _ in range(size):
+                create_recipe(user, tags=2, ingredients=2)
+
+        def request(data):
+            res = self.client.get(RECIPES_URL)
+            self.assertStatus(res, status.HTTP_200_OK)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_list_recipes_skips_join_tables(self):
+        """ Test listing reads tags and ingredients from the recipe row. """
+        user = self.authenticated_user()
+        create_recipe(user, tags=2, ingredients=2)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {'tags': '1,2'})
+            res = self.client.get(RECIPES_URL)
+
+        self.assertStatus(res, status.HTTP_200_OK)
+        self.assertEqual(len(res.data[0]['tags']), 2)
+        for query in queries:
+            self.assertNotIn('core_recipe_tags', query['sql'])
+            self.assertNotIn('core_recipe_ingredients', query['sql'])
+
+    def test_filter_recipes(self):
+        """ Test filtering recipes by tags and ingredients. """
+        def setup(size):
+            user = self.authenticated_user()
+            recipes = [create_recipe(user, 1, 1) for _ in range(size)]
+            return {
+                'tags': ','.join(
+                    str(recipe.tags.get().id) for recipe in recipes
+                ),
+                'ingredients': ','.join(
+                    str(recipe.ingredients.get().id) for recipe in recipes
+                ),
+            }
+
+        def request(params):
+            res = self.client.get(RECIPES_URL, params)
+            self.assertStatus(res, status.HTTP_200_OK)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_retrieve_recipe(self):
+        """ Test retrieving a recipe with many tags and ingredients. """
+        def setup(size):
+            return create_recipe(self.authenticated_user(), size, size)
+
+        def request(recipe):
+            res = self.client.get(recipe_detail_url(recipe.id))
+            self.assertStatus(res, status.HTTP_200_OK)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_create_recipe(self):
+        """ Test creating a recipe with many new tags and ingredients. """
+        def setup(size):
+            self.authenticated_user()
+            return recipe_payload(size)
+
+        def request(payload):
+            res = self.client.post(RECIPES_URL, payload, format='json')
+            self.assertStatus(res, status.HTTP_201_CREATED)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_create_recipe_existing_tags(self):
+        """ Test creating a recipe reusing existing tags. """
+        def setup(size):
+            user = self.authenticated_user()
+            create_recipe(user, size, size)
+            payload = recipe_payload(size)
+            payload['tags'] = [{'name': f'tag {i}'} for i in range(size)]
+            payload['ingredients'] = [
+                {'name': f'ingredient {i}'} for i in range(size)
+            ]
+            return payload
+
+        def request(payload):
+            res = self.client.post(RECIPES_URL, payload, format='json')
+            self.assertStatus(res, status.HTTP_201_CREATED)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_partial_update_recipe(self):
+        """ Test replacing the tags of a recipe. """
+        def setup(size):
+            recipe = create_recipe(self.authenticated_user(), size, size)
+            payload = recipe_payload(size)
+            del payload['ingredients']
+            return recipe, payload
+
+        def request(data):
+            recipe, payload = data
+            res = self.client.patch(
+                recipe_detail_url(recipe.id), payload, format='json',
+            )
+            self.assertStatus(res, status.HTTP_200_OK)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_full_update_recipe(self):
+        """ Test replacing a recipe with many tags and ingredients. """
+        def setup(size):
+            recipe = create_recipe(self.authenticated_user(), size, size)
+            return recipe, recipe_payload(size)
+
+        def request(data):
+            recipe, payload = data
+            res = self.client.put(
+                recipe_detail_url(recipe.id), payload, format='json',
+            )
+            self.assertStatus(res, status.HTTP_200_OK)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_delete_recipe(self):
+        """ Test deleting a recipe with many tags and ingredients. """
+        def setup(size):
+            return create_recipe(self.authenticated_user(), size, size)
+
+        def request(recipe):
+            res = self.client.delete(recipe_detail_url(recipe.id))
+            self.assertStatus(res, status.HTTP_204_NO_CONTENT)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_upload_image(self):
+        """ Test uploading an image to a recipe with many tags. """
+        recipes = []
+
+        def setup(size):
+            recipe = create_recipe(self.authenticated_user(), size, size)
+            recipes.append(recipe)
+            return recipe
+
+        def request(recipe):
+            with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+                Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+                image_file.seek(0)
+                res = self.client.post(
+                    image_upload_url(recipe.id),
+                    {'image': image_file},
+                    format='multipart',
+                )
+            self.assertStatus(res, status.HTTP_200_OK)
+
+        try:
+            self.assertConstantQueries(setup, request)
+        finally:
+            for recipe in recipes:
+                recipe.refresh_from_db()
+                recipe.image.delete()
+
+
+class RecipeAttrQueryCountTests(QueryCountMixin, TestCase):
+    """ Test query counts of the tag and ingredient endpoints. """
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def assert_constant_list(self, model, url, params):
+        def setup(size):
+            user = create_user()
+            self.client.force_authenticate(user)
+            for i in range(size):
+                recipe = create_recipe(user)
+                obj = model.objects.create(user=user, name=f'name {i}')
+                getattr(recipe, f'{model.__name__.lower()}s').add(obj)
+
+        def request(data):
+            res = self.client.get(url, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertConstantQueries(setup, request)
+
+    def assert_constant_detail(self, model, url_name, method, payload,
+                               expected):
+        def setup(size):
+            user = create_user()
+            self.client.force_authenticate(user)
+            obj = model.objects.create(user=user, name='shared')
+            for _ in range(size):
+                recipe = create_recipe(user)
+                getattr(recipe, f'{model.__name__.lower()}s').add(obj)
+            return obj
+
+        def request(obj):
+            url = reverse(f'recipe:{url_name}-detail', args=[obj.id])
+            res = getattr(self.client, method)(url, payload)
+            self.assertEqual(res.status_code, expected)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_list_tags(self):
+        """ Test listing tags. """
+        self.assert_constant_list(Tag, TAGS_URL, {})
+
+    def test_list_assigned_tags(self):
+        """ Test listing tags assigned to recipes. """
+        self.assert_constant_list(Tag, TAGS_URL, {'assigned_only': 1})
+
+    def test_list_ingredients(self):
+        """ Test listing ingredients. """
+        self.assert_constant_list(Ingredient, INGREDIENTS_URL, {})
+
+    def test_list_assigned_ingredients(self):
+        """ Test listing ingredients assigned to recipes. """
+        self.assert_constant_list(
+            Ingredient, INGREDIENTS_URL, {'assigned_only': 1},
+        )
+
+    def test_update_tag(self):
+        """ Test renaming a tag used by many recipes. """
+        for method in ('patch', 'put'):
+            with self.subTest(method=method):
+                self.assert_constant_detail(
+                    Tag, 'tag', method, {'name': 'renamed'},
+                    status.HTTP_200_OK,
+                )
+
+    def test_delete_tag(self):
+        """ Test deleting a tag used by many recipes. """
+        self.assert_constant_detail(
+            Tag, 'tag', 'delete', None, status.HTTP_204_NO_CONTENT,
+        )
+
+    def test_update_ingredient(self):
+        """ Test renaming an ingredient used by many recipes. """
+        for method in ('patch', 'put'):
+            with self.subTest(method=method):
+                self.assert_constant_detail(
+                    Ingredient, 'ingredient', method, {'name': 'renamed'},
+                    status.HTTP_200_OK,
+                )
+
+    def test_delete_ingredient(self):
+        """ Test deleting an ingredient used by many recipes. """
+        self.assert_constant_detail(
+            Ingredient, 'ingredient', 'delete', None,
+            status.HTTP_204_NO_CONTENT,
+        )
@@ -3,10 +3,13 @@
 """
 
 
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.shortcuts import render
 
 # Create your views here.
 from rest_framework.decorators import action # type: ignore
+from rest_framework.generics import get_object_or_404  # type: ignore
 from rest_framework.response import Response # type: ignore
 
 from drf_spectacular.utils import ( extend_schema_view, # type: ignore
@@ -18,8 +21,11 @@ from rest_framework import viewsets , mixins, status # type: ignore
 from rest_framework.authentication import TokenAuthentication # type: ignore
 from rest_framework.permissions import IsAuthenticated # type: ignore
 
-from core.models import Recipe, Tag, Ingredient
+from core import metrics
+from core.models import Recipe, Tag, Ingredient, RECIPE_IMAGE_DIR
+from core.storage import content_name
 from . import serializers
+from .documents import load_documents, serve_document
 
 
 @extend_schema_view(
@@ -51,11 +57,25 @@ class baseRecipeAtrrViewets(mixins.DestroyModelMixin,
         )
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            through = getattr(Recipe, self.recipe_field).through
+            model_name = queryset.model._meta.model_name
+            queryset = queryset.filter(Exists(through.objects.filter(
+                **{f'{model_name}_id': OuterRef('pk')}
+            )))
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by('-name')
+
+    def perform_update(self, serializer):
+        # The recipes carrying it are refreshed by core.signals, a failed
+        # refresh must not leave the rename committed.
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
 
     
 
@@ -64,6 +84,7 @@ class TagViewSet(baseRecipeAtrrViewets):
     """ Manage tags in the database. """
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
+    recipe_field = 'tags'
 
 
 
@@ -73,6 +94,7 @@ class IngredientViewSet(baseRecipeAtrrViewets):
     """ Manage ingredient in database. """
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+    recipe_field = 'ingredients'
 
 
 @extend_schema_view(
@@ -97,6 +119,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthenticated]
     authentication_classes = [TokenAuthentication]
+    # Throttled as read or write by method, uploads set their own scope.
+    throttle_scope = None
 
     def _prams_to_int(self, qs):
         """ converts a list of string to a list of integerts. """
@@ -110,42 +134,105 @@ class RecipeViewSet(viewsets.ModelViewSet):
         
         if tags:
             tag_ids = self._prams_to_int(tags)
-            queryset= queryset.filter(tags__id__in = tag_ids)
+            queryset = queryset.filter(tag_ids__overlap=tag_ids)
         if ingredients:
             ingredient_ids = self._prams_to_int(ingredients)
-            queryset = queryset.filter(ingredients__id__in = ingredient_ids)
+            queryset = queryset.filter(
+                ingredient_ids__overlap=ingredient_ids
+            )
 
 
         return queryset.filter(
             user = self.request.user
-        ).order_by('-id').distinct()
+        ).order_by('-id')
 
 
 
             
         
     
+    def list(self, request, *args, **kwargs):
+        """ List the stored recipe documents. """
+        queryset = self.filter_queryset(self.get_queryset())
+        documents = load_documents(queryset.values_list('pk', 'document'))
+        return Response([
+            serve_document(document, request, list_view=True)
+            for document in documents
+        ])
+
+    def retrieve(self, request, *args, **kwargs):
+        """ Return the stored document of a recipe. """
+        row = get_object_or_404(
+            self.get_queryset().values_list('pk', 'document'),
+            pk=kwargs['pk'],
+        )
+        document, = load_documents([row])
+        return Response(serve_document(document, request))
+
     def get_serializer_class(self):
         """ override and return the serializer for the class. """
         if self.action == 'list':
             return serializers.RecipeSerializer
         
         elif self.action == 'upload_image':
+            if 'key' in self.request.data:
+                return serializers.RecipeImageKeySerializer
             return serializers.RecipeImageSerializer
 
+        elif self.action == 'upload_url':
+            return serializers.RecipeImageUploadURLSerializer
+
         return self.serializer_class
     def perform_create(self, serializer):
         """ create a new recipe """
         serializer.save(user=self.request.user)
 
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @action(methods=['POST'], detail=True, url_path='upload-image',
+            throttle_scope='upload')
     def upload_image(self, request, pk=None):
         """ Upload an image to recipe. """
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data = request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            with metrics.IMAGE_PROCESSING.time(), transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status = status.HTTP_200_OK)
                    
         return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+
+    @action(methods=['POST'], detail=True, url_path='upload-url',
+            throttle_scope='upload')
+    def upload_url(self, request, pk=None):
+        """
+        Return a presigned URL to PUT an image straight to storage.
+
+        Confirm the upload by posting the returned key to upload-image.
+        No upload is needed when exists is true.
+        """
+        self.get_object()
+        storage = Recipe._meta.get_field('image').storage
+        if not storage.supports_direct_upload:
+            return Response(
+                {'detail': 'Direct uploads need object storage.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        digest = serializer.validated_data['sha256']
+        content_type = serializer.validated_data['content_type']
+        key = content_name(
+            RECIPE_IMAGE_DIR, digest,
+            serializers.IMAGE_CONTENT_TYPES[content_type],
+        )
+        if storage.touch(key):
+            return Response({'key': key, 'exists': True})
+        return Response({
+            'key': key,
+            'exists': False,
+            **storage.upload_url(key, digest, content_type),
+        })
@@ -31,6 +31,22 @@ class UserSerializer(serializers.ModelSerializer):
 
         return user
     
+class DeleteUserSerializer(serializers.Serializer):
+    """ Serializer confirming the deletion of a user with their password. """
+    password = serializers.CharField(
+        write_only=True,
+        style={'input_type': 'password'},
+        trim_whitespace=False,
+    )
+
+    def validate_password(self, value):
+        """ Check the password of the user deleting themselves. """
+        if not self.context['request'].user.check_password(value):
+            msg = _('Incorrect password.')
+            raise serializers.ValidationError(msg, code='authorization')
+        return value
+
+
 class AuthTokenSerializer(serializers.Serializer):
     """ Seializer for  the auth token. """
     email = serializers.EmailField()
@@ -0,0 +1,106 @@
+"""
+Test the user API runs a constant number of queries as data grows.
+"""
+from decimal import Decimal
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status  # type: ignore
+from rest_framework.test import APIClient  # type: ignore
+
+from core.models import Recipe, Tag
+from core.tests.utils import QueryCountMixin
+
+
+CREATE_USER_URL = reverse('user:create')
+TOKEN_URL = reverse('user:token')
+ME_URL = reverse('user:me')
+
+user_numbers = count()
+
+
+def create_user_with_recipes(size, password=None):
+    """ Create a user owning size recipes, each with a tag. """
+    user = get_user_model().objects.create_user(
+        email=f'user{next(user_numbers)}@example.com',
+        password=password,
+        name='Test Name',
+    )
+    for i in range(size):
+        recipe = Recipe.objects.create(
+            user=user,
+            title=f'recipe {i}',
+            time_minutes=5,
+            price=Decimal('1.5'),
+        )
+        recipe.tags.add(Tag.objects.create(user=user, name=f'tag {i}'))
+    return user
+
+
+class UserQueryCountTests(QueryCountMixin, TestCase):
+    """ Test query counts of the user endpoints. """
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_create_user(self):
+        """ Test creating a user as the number of users grows. """
+        def setup(size):
+            for _ in range(size):
+                create_user_with_recipes(0)
+            return {
+                'email': f'new{next(user_numbers)}@example.com',
+                'password': 'testpass123',
+                'name': 'New User',
+            }
+
+        def request(payload):
+            res = self.client.post(CREATE_USER_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_create_token(self):
+        """ Test creating a token for a user with many recipes. """
+        def setup(size):
+            user = create_user_with_recipes(size, password='testpass123')
+            return {'email': user.email, 'password': 'testpass123'}
+
+        def request(payload):
+            res = self.client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_retrieve_me(self):
+        """ Test retrieving the profile of a user with many recipes. """
+        def setup(size):
+            self.client.force_authenticate(create_user_with_recipes(size))
+
+        def request(data):
+            res = self.client.get(ME_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertConstantQueries(setup, request)
+
+    def test_update_me(self):
+        """ Test updating the profile of a user with many recipes. """
+        for method in ('patch', 'put'):
+            with self.subTest(method=method):
+                def setup(size):
+                    user = create_user_with_recipes(size)
+                    self.client.force_authenticate(user)
+                    return {
+                        'email': user.email,
+                        'name': 'Updated Name',
+                        'password': 'newpass123',
+                    }
+
+                def request(payload):
+                    res = getattr(self.client, method)(ME_URL, payload)
+                    self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+                self.assertConstantQueries(setup, request)
@@ -13,6 +13,7 @@ from rest_framework import status # type: ignore
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
+ME_DELETE_URL = reverse('user:me-delete')
 
 
 def create_user(**params):
@@ -169,3 +170,30 @@ class PrivateUserApiTests(TestCase):
 
 
 
+
+    def test_delete_user_deactivates_and_queues_purge(self):
+        """ Test deleting the profile deactivates the user at once. """
+        res = self.client.post(ME_DELETE_URL, {'password': 'password1234'})
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertTrue(self.user.userpurge_set.filter(
+            finished__isnull=True,
+        ).exists())
+
+    def test_delete_me_not_allowed(self):
+        """ Test the me endpoint itself doesn't delete the user. """
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_delete_user_requires_password(self):
+        """ Test deleting the profile is confirmed with the password. """
+        for payload in ({}, {'password': 'wrong'}):
+            res = self.client.post(ME_DELETE_URL, payload)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+        self.assertFalse(self.user.userpurge_set.exists())
@@ -10,5 +10,6 @@ app_name = 'user'
 urlpatterns = [
     path('create/',views.CreateUserView.as_view(), name ='create'),
     path('token/',views.CreateTokenView.as_view(), name ='token'),
-    path('me/',views.ManageUserView.as_view(), name ='me')
+    path('me/',views.ManageUserView.as_view(), name ='me'),
+    path('me/delete/', views.DeleteUserView.as_view(), name='me-delete'),
 ]
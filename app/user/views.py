@@ -4,11 +4,23 @@ Views for the user API
 
 from django.shortcuts import render
 
+from drf_spectacular.utils import (  # type: ignore
+    OpenApiResponse,
+    extend_schema,
+)
 from rest_framework import generics, authentication, permissions # type: ignore
+from rest_framework import status  # type: ignore
+from rest_framework.response import Response  # type: ignore
 from rest_framework.authtoken.views import ObtainAuthToken # type: ignore
 from rest_framework.settings import api_settings # type: ignore
 
-from user.serializer import UserSerializer, AuthTokenSerializer
+from core.purge import request_purge
+from core.throttling import TokenBucketThrottle
+from user.serializer import (
+    AuthTokenSerializer,
+    DeleteUserSerializer,
+    UserSerializer,
+)
 
 # Create your views here.
 
@@ -21,6 +33,9 @@ class CreateTokenView(ObtainAuthToken):
     """ create a new auth token for user. """
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken turns throttling off, password guessing needs it.
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'token'
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
@@ -32,3 +47,29 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         """  Retreieve and return the authenticated user. """
         return self.request.user
+
+
+class DeleteUserView(generics.GenericAPIView):
+    """ Delete the authenticated user after checking their password. """
+    serializer_class = DeleteUserSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    # Every call checks the password, limit guesses like logins.
+    throttle_scope = 'token'
+
+    @extend_schema(
+        responses={
+            204: None,
+            400: OpenApiResponse(description='Missing or wrong password.'),
+        },
+        description=(
+            'Delete the authenticated user. The account is deactivated and '
+            'its email released at once, its recipes, tags and ingredients '
+            'are deleted in the background. Cannot be undone.'
+        ),
+    )
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        request_purge(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
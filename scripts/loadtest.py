@@ -0,0 +1,391 @@
+"""
+HTTP load generator for the recipe API.
+
+Creates users, fetches their tokens, seeds a few recipes and then drives a
+weighted mix of recipe calls at a fixed request rate. Requests are scheduled
+open loop, so latency is measured from the moment a request was due and a
+slow server cannot hide its queueing delay.
+
+Only the standard library is used, so it runs from any Python 3.9+:
+
+    python scripts/loadtest.py --base-url http://localhost:8000 \\
+        --rate 50 --duration 60 --mix list=50,filter=15,detail=20,patch=8
+
+Paths match the routes in app/app/urls.py and can be overridden with
+--user-prefix and --recipe-prefix.
+
+The API rate limits every client, see app/core/throttling.py. All users
+are set up from one address, which may fetch 10 tokens per minute by
+default, so the defaults stay at 10 users. For more users start the API
+with a higher THROTTLE_TOKEN_RATE, e.g. THROTTLE_TOKEN_RATE=1000/min,
+and likewise THROTTLE_READ_RATE and THROTTLE_WRITE_RATE when one user
+gets more than 600 reads or 120 writes a minute. Rate limited requests
+are reported as throttled, apart from errors.
+"""
+import argparse
+import json
+import random
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlencode, urlsplit
+
+
+ACTIONS = ('list', 'filter', 'detail', 'create', 'patch', 'upload')
+DEFAULT_MIX = 'list=45,filter=15,detail=25,create=5,patch=8,upload=2'
+
+THROTTLED = 429
+
+
+def setup_failed(what, status, body):
+    """ Return the SystemExit for a failed setup request. """
+    if status == THROTTLED:
+        return SystemExit(
+            f'{what} was rate limited by the API. Start it with higher '
+            f'limits, e.g. THROTTLE_TOKEN_RATE=1000/min and '
+            f'THROTTLE_WRITE_RATE=1000/min, or pass fewer --users.'
+        )
+    return SystemExit(f'{what} failed: {status} {body}')
+
+
+def parse_mix(value):
+    """ Parse 'name=weight,...' into a dict of weights. """
+    mix = {}
+    for item in value.split(','):
+        name, weight = item.split('=')
+        if name not in ACTIONS:
+            raise argparse.ArgumentTypeError(f'unknown action {name!r}')
+        mix[name] = float(weight)
+    return mix
+
+
+def percentile(sorted_values, pct):
+    """ Nearest rank percentile of an already sorted list. """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1,
+                      round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def png_bytes(size=32):
+    """ Return a small valid PNG image built without Pillow. """
+    def chunk(kind, data):
+        body = kind + data
+        return (struct.pack('>I', len(data)) + body
+                + struct.pack('>I', zlib.crc32(body) & 0xffffffff))
+
+    rows = b''.join(
+        b'\x00' + b''.join(
+            bytes((x * 7 % 256, y * 7 % 256, 128)) for x in range(size)
+        )
+        for y in range(size)
+    )
+    header = struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def multipart(field, filename, content, content_type):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; '
+        f'filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class Client:
+    """ Keep-alive HTTP client holding one connection per thread. """
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn_class = (
+                HTTPSConnection if self.scheme == 'https' else HTTPConnection
+            )
+            conn = conn_class(self.netloc, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    def request(self, method, path, token=None, data=None, body=None,
+                content_type=None):
+        headers = {'Accept': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        if data is not None:
+            body = json.dumps(data).encode()
+            content_type = 'application/json'
+        if content_type:
+            headers['Content-Type'] = content_type
+
+        conn = self.connection()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+        except (OSError, ConnectionError):
+            conn.close()
+            self.local.conn = None
+            raise
+        if response.getheader('Connection', '').lower() == 'close':
+            conn.close()
+            self.local.conn = None
+
+        return response.status, payload
+
+
+class Session:
+    """ A load test user with a token and the ids it created. """
+
+    def __init__(self, email, token):
+        self.email = email
+        self.token = token
+        self.recipe_ids = []
+        self.tag_ids = []
+        self.ingredient_ids = []
+        self.lock = threading.Lock()
+
+
+class LoadTest:
+    """ Set up users and drive the request mix. """
+
+    def __init__(self, options):
+        self.options = options
+        self.client = Client(options.base_url, options.timeout)
+        self.random = random.Random(options.seed)
+        self.sessions = []
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.throttled = defaultdict(int)
+        self.lock = threading.Lock()
+        self.image = png_bytes()
+
+    @property
+    def recipes_path(self):
+        return f'{self.options.recipe_prefix}recipes/'
+
+    def setup(self):
+        """ Create users, fetch tokens and seed recipes. """
+        run_id = uuid.uuid4().hex[:8]
+        for i in range(self.options.users):
+            email = f'load-{run_id}-{i}@example.com'
+            password = 'loadtest-password'
+            status, body = self.client.request(
+                'POST', f'{self.options.user_prefix}create/',
+                data={'email': email, 'password': password, 'name': email},
+            )
+            if status != 201:
+                raise setup_failed(f'creating {email}', status, body)
+            status, body = self.client.request(
+                'POST', f'{self.options.user_prefix}token/',
+                data={'email': email, 'password': password},
+            )
+            if status != 200:
+                raise setup_failed(f'token for {email}', status, body)
+            session = Session(email, json.loads(body)['token'])
+            for j in range(self.options.recipes_per_user):
+                status = self.create_recipe(session, j)
+                if status == THROTTLED:
+                    raise setup_failed(f'recipes of {email}', status, '')
+            self.sessions.append(session)
+
+    def create_recipe(self, session, index, rng=None):
+        rng = rng or self.random
+        tags = rng.sample(range(self.options.tag_pool), 3)
+        status, body = self.client.request(
+            'POST', self.recipes_path, token=session.token, data={
+                'title': f'load recipe {index}',
+                'time_minutes': rng.randint(5, 120),
+                'price': f'{rng.uniform(1, 50):.2f}',
+                'tags': [{'name': f'tag {t}'} for t in tags],
+                'ingredients': [{'name': f'ingredient {t}'} for t in tags],
+            },
+        )
+        if status != 201:
+            return status
+        recipe = json.loads(body)
+        with session.lock:
+            session.recipe_ids.append(recipe['id'])
+            session.tag_ids.extend(
+                t['id'] for t in recipe['tags']
+                if t['id'] not in session.tag_ids
+            )
+            session.ingredient_ids.extend(
+                i['id'] for i in recipe['ingredients']
+                if i['id'] not in session.ingredient_ids
+            )
+        return status
+
+    def pick_recipe(self, session, rng):
+        with session.lock:
+            return rng.choice(session.recipe_ids) if session.recipe_ids \
+                else None
+
+    def action_list(self, session, rng):
+        return self.client.request(
+            'GET', self.recipes_path, token=session.token,
+        )[0]
+
+    def action_filter(self, session, rng):
+        with session.lock:
+            tags = rng.sample(session.tag_ids, min(2, len(session.tag_ids)))
+        query = urlencode({'tags': ','.join(map(str, tags))})
+        return self.client.request(
+            'GET', f'{self.recipes_path}?{query}', token=session.token,
+        )[0]
+
+    def action_detail(self, session, rng):
+        recipe_id = self.pick_recipe(session, rng)
+        return self.client.request(
+            'GET', f'{self.recipes_path}{recipe_id}/', token=session.token,
+        )[0]
+
+    def action_create(self, session, rng):
+        return self.create_recipe(session, rng.randint(0, 10 ** 6), rng)
+
+    def action_patch(self, session, rng):
+        recipe_id = self.pick_recipe(session, rng)
+        return self.client.request(
+            'PATCH', f'{self.recipes_path}{recipe_id}/',
+            token=session.token,
+            data={'title': f'patched {rng.randint(0, 10 ** 6)}'},
+        )[0]
+
+    def action_upload(self, session, rng):
+        recipe_id = self.pick_recipe(session, rng)
+        body, content_type = multipart(
+            'image', 'load.png', self.image, 'image/png',
+        )
+        return self.client.request(
+            'POST', f'{self.recipes_path}{recipe_id}/upload-image/',
+            token=session.token, body=body, content_type=content_type,
+        )[0]
+
+    def execute(self, action, due, seed):
+        rng = random.Random(seed)
+        session = rng.choice(self.sessions)
+        try:
+            status = getattr(self, f'action_{action}')(session, rng)
+        except (OSError, ConnectionError):
+            status = None
+        latency = time.perf_counter() - due
+        with self.lock:
+            self.latencies[action].append(latency)
+            if status == THROTTLED:
+                self.throttled[action] += 1
+            elif status is None or status >= 400:
+                self.errors[action] += 1
+
+    def run(self):
+        """ Drive the mix at the target rate for the configured duration. """
+        mix = self.options.mix
+        actions = list(mix)
+        weights = [mix[action] for action in actions]
+        interval = 1 / self.options.rate
+        total = int(self.options.rate * self.options.duration)
+
+        with ThreadPoolExecutor(self.options.concurrency) as pool:
+            start = time.perf_counter()
+            for i in range(total):
+                due = start + i * interval
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                action = self.random.choices(actions, weights)[0]
+                pool.submit(
+                    self.execute, action, due, self.random.getrandbits(32),
+                )
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        rows = {}
+        for action, values in sorted(self.latencies.items()):
+            values.sort()
+            rows[action] = {
+                'requests': len(values),
+                'errors': self.errors[action],
+                'throttled': self.throttled[action],
+                'throughput_rps': len(values) / elapsed,
+                'p50_ms': percentile(values, 50) * 1000,
+                'p95_ms': percentile(values, 95) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+            }
+        every = sorted(v for values in self.latencies.values() for v in values)
+        rows['all'] = {
+            'requests': len(every),
+            'errors': sum(self.errors.values()),
+            'throttled': sum(self.throttled.values()),
+            'throughput_rps': len(every) / elapsed,
+            'p50_ms': percentile(every, 50) * 1000,
+            'p95_ms': percentile(every, 95) * 1000,
+            'p99_ms': percentile(every, 99) * 1000,
+        }
+        return rows
+
+
+def print_report(rows, stream=sys.stdout):
+    header = (f'{"endpoint":<10} {"requests":>9} {"errors":>7} '
+              f'{"throttled":>9} '
+              f'{"rps":>8} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+    stream.write(header + '\n')
+    for action, row in rows.items():
+        stream.write(
+            f'{action:<10} {row["requests"]:>9} {row["errors"]:>7} '
+            f'{row["throttled"]:>9} '
+            f'{row["throughput_rps"]:>8.1f} {row["p50_ms"]:>9.1f} '
+            f'{row["p95_ms"]:>9.1f} {row["p99_ms"]:>9.1f}\n'
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--user-prefix', default='/api/user')
+    parser.add_argument('--recipe-prefix', default='/api/recipe')
+    parser.add_argument('--users', type=int, default=10,
+                        help='More than 10 need a higher '
+                             'THROTTLE_TOKEN_RATE on the API.')
+    parser.add_argument('--recipes-per-user', type=int, default=20)
+    parser.add_argument('--tag-pool', type=int, default=30)
+    parser.add_argument('--rate', type=float, default=50,
+                        help='Target requests per second.')
+    parser.add_argument('--duration', type=float, default=60,
+                        help='Seconds to drive load for.')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--mix', type=parse_mix,
+                        default=parse_mix(DEFAULT_MIX))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Also write the report to this file.')
+    options = parser.parse_args(argv)
+
+    test = LoadTest(options)
+    test.setup()
+    elapsed = test.run()
+    rows = test.report(elapsed)
+    print_report(rows)
+    if options.json:
+        with open(options.json, 'w') as output:
+            json.dump({'options': {
+                k: v for k, v in vars(options).items() if k != 'json'
+            }, 'elapsed_s': elapsed, 'endpoints': rows}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()